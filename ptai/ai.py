@@ -1,23 +1,39 @@
 from abc import ABC, abstractmethod
 import random
-from typing import Union
+import time
+from typing import Optional, Union
 
 from ptai.actions import MoveAction
 from ptai.gamestate import GameState
+from ptai.profiling import tag
 
 
 class AI(ABC):
 
+    # Set by `get_move_before()` if the deadline made it settle for a move
+    # `get_move()` might not have chosen. Such moves shouldn't be cached.
+    cut_short = False
+
     @abstractmethod
     def get_move(self, state:GameState) -> MoveAction:
         # State may not have new_turn==True, since the driver could
         # speculatively ask for a move from the AI.
         raise NotImplementedError()
 
+    def get_move_before(self, state:GameState, deadline:Optional[float]) -> MoveAction:
+        """Like `get_move()`, but try to return by `deadline`.
+
+        `deadline` is a `time.monotonic()` value, or None if there's no time
+        limit. AIs which can trade strength for speed should override this;
+        by default the deadline is ignored.
+        """
+        return self.get_move(state)
+
 
 class RandomAI(AI):
     """AI that makes completely random moves."""
 
+    @tag("ai")
     def get_move(self, state:GameState) -> MoveAction:
         possible_moves = list(state.get_moves())
         move = random.choice(possible_moves)
@@ -28,6 +44,7 @@ class RandomAI(AI):
 class ScoreBasedAI(AI):
     """Abstract class for an AI that works by scoring each possible move."""
 
+    @tag("ai")
     def get_move(self, state:GameState) -> MoveAction:
         def score_func(move):
             return self.score_move(state.copy(), move)
@@ -38,3 +55,65 @@ class ScoreBasedAI(AI):
     def score_move(self, state:GameState, move:MoveAction) -> Union[int, float]:
         """Return a score for a particular move."""
         raise NotImplementedError()
+
+
+class LookaheadAI(ScoreBasedAI):
+    """ScoreBasedAI that also looks at the next piece, when there's time.
+
+    The deep search scores each move by its best follow-up with the next
+    piece in the queue, which costs about as many evaluations per move as
+    there are moves. Given a deadline, the AI only searches deep if the last
+    deep search would have fit in the time left, and otherwise plays the
+    best move by its own score. A deep search that runs out of time anyway
+    stops early, using only the candidates it got to, which are searched
+    best first.
+    """
+
+    def __init__(self):
+        # Seconds the last deep search took, or None before the first
+        self.deep_seconds:Optional[float] = None
+
+    @tag("ai")
+    def get_move(self, state:GameState) -> MoveAction:
+        return self.get_move_before(state, None)
+
+    @tag("ai")
+    def get_move_before(self, state:GameState, deadline:Optional[float]) -> MoveAction:
+        start = time.monotonic()
+        self.cut_short = False
+        moves = list(state.get_moves())
+        random.shuffle(moves)  # Select randomly between ties
+        shallow = {id(move): self.score_move(state.copy(), move) for move in moves}
+        moves.sort(key=lambda move: shallow[id(move)], reverse=True)
+
+        if len(state.queue) < 2:
+            return moves[0]
+        if deadline is not None and self.deep_seconds is not None and \
+                time.monotonic() + self.deep_seconds > deadline:
+            self.cut_short = True
+            return moves[0]
+
+        best_move = moves[0]
+        best_value = float("-inf")
+        for move in moves:
+            if deadline is not None and time.monotonic() > deadline:
+                self.cut_short = True
+                break
+            value = self._deep_value(state, move)
+            if value > best_value:
+                best_move, best_value = move, value
+        else:
+            self.deep_seconds = time.monotonic() - start
+        return best_move
+
+    def _deep_value(self, state:GameState, move:MoveAction) -> float:
+        after = state.copy()
+        result = after.move(move)
+        if result.game_over:
+            return float("-inf")
+        after.queue = after.queue[1:]
+        return max(
+            (self.score_move(after.copy(), next_move) + result.score
+             for next_move in after.get_moves()),
+            default=float("-inf"),
+        )
@@ -0,0 +1,45 @@
+"""
+Importing classes by their dot-separated path, like "ptai.puyo.ai.SimpleComboAI".
+"""
+import importlib
+from typing import Dict
+
+
+class ClassPathError(Exception):
+    pass
+
+
+def instantiate_class(spec_string:str,
+                      shortcut_names:Dict[str, str],
+                      expected_base_cls:type):
+    """Import and instantiate a class.
+
+    :arg spec_string: A string in the form "path.to.Class".
+    :arg shortcut_names: Maps names that can be used as a shortcut for the
+        whole import path of the class.
+    :arg expected_base_cls: Base class which the given class should be a
+        subclass of. This is for catching user mistakes of importing the wrong
+        class.
+
+    Raises `ClassPathError` if the class can't be found or has the wrong base.
+    """
+    path = shortcut_names.get(spec_string, spec_string)
+    if "." not in path:
+        raise ClassPathError(f'Bad path "{spec_string}"')
+
+    module_path, class_name = path.rsplit('.', 1)
+    try:
+        module = importlib.import_module(module_path)
+    except ModuleNotFoundError as e:
+        raise ClassPathError(str(e)) from e
+    try:
+        cls = getattr(module, class_name)
+    except AttributeError as e:
+        raise ClassPathError(str(e)) from e
+    try:
+        is_subclass = issubclass(cls, expected_base_cls)
+    except TypeError:
+        is_subclass = False
+    if not is_subclass:
+        raise ClassPathError(f'Imported {spec_string} successfully, but it is not a subclass of {expected_base_cls} as expected.')
+    return cls()
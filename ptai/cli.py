@@ -1,13 +1,13 @@
+# Only lightweight modules are imported here. Everything else, including
+# numpy and pyusb, is imported by the commands that need it, so `--help` and
+# `--ai help` start quickly. `test_importtime.py` keeps it that way.
 import argparse
-import importlib
 import sys
 from time import sleep
 from typing import Dict
 
-from ptai.driver import Driver
-from ptai.gameinterface import GameInterface
-from ptai.ai import AI
-from ptai.games import GAMES
+from ptai.games import GAMES, get_state_cls
+from ptai import classpath, profiling
 
 
 def main():
@@ -38,6 +38,10 @@ def main():
     getstate_parser.set_defaults(func=cmd_getstate)
     add_interface_arg(getstate_parser)
     getstate_parser.add_argument("--loop", action="store_true")
+    getstate_parser.add_argument("--raw", action="store_true", help="""
+        Print every PPT2 memory structure reachable from the main struct,
+        instead of the game state. Only works with PPT2 interfaces.
+    """)
 
     # Get Move
     getmove_parser = commands.add_parser("getmove",
@@ -46,6 +50,7 @@ def main():
     getmove_parser.set_defaults(func=cmd_getmove)
     add_interface_arg(getmove_parser)
     add_ai_arg(getmove_parser)
+    profiling.add_profile_args(getmove_parser)
 
     # Play
     play_parser = commands.add_parser("play",
@@ -54,13 +59,224 @@ def main():
     play_parser.set_defaults(func=cmd_play)
     add_interface_arg(play_parser)
     add_ai_arg(play_parser)
+    profiling.add_profile_args(play_parser)
     play_parser.add_argument("--max-turns", type=int, help="""
         Exit after this many turns have been played. Mainly used for
         performance testing and profiling.
     """)
+    play_parser.add_argument("--pipelined", action="store_true", help="""
+        Read state, run the AI and send inputs on separate threads, so
+        they overlap.
+    """)
+    play_parser.add_argument("--record", metavar="PATH", help="""
+        Append each position and the move the AI made to this file, for use
+        with the `evaluate` command.
+    """)
+
+    # Multiplay
+    multiplay_parser = commands.add_parser("multiplay",
+        help="Play on every attached console at once"
+    )
+    multiplay_parser.set_defaults(func=cmd_multiplay)
+    add_ai_arg(multiplay_parser)
+    multiplay_parser.add_argument("--max-turns", type=int, help="""
+        Exit after each console has played this many turns.
+    """)
+    multiplay_parser.add_argument("-p", "--processes", type=int, help="""
+        Number of AI worker processes shared by the consoles. Defaults to
+        one per console.
+    """)
+    multiplay_parser.add_argument("--cache-size", type=int, default=100000, help="""
+        Number of moves to remember, by position.
+    """)
+
+    # Evaluate
+    evaluate_parser = commands.add_parser("evaluate",
+        help="Compare AIs against the moves in a recorded game"
+    )
+    evaluate_parser.set_defaults(func=cmd_evaluate)
+    evaluate_parser.add_argument("recording", help="""
+        Path to a recording made with `play --record`.
+    """)
+    evaluate_parser.add_argument("-a", "--ai", action="append", default=[], help="""
+        The name or full path of an AI class to evaluate. May be given more
+        than once to compare several AIs. Use `--ai help` to get a list of
+        valid AIs for the current game.
+    """)
+    evaluate_parser.add_argument("-p", "--processes", type=int, help="""
+        Number of worker processes. Defaults to the number of CPUs. Latencies
+        are most accurate with `--processes 1`.
+    """)
+    evaluate_parser.add_argument("--chunk-size", type=int, default=1000, help="""
+        Number of positions sent to a worker at a time.
+    """)
+
+    # Self Play
+    selfplay_parser = commands.add_parser("selfplay",
+        help="Play simulated versus matches between two AIs"
+    )
+    selfplay_parser.set_defaults(func=cmd_selfplay)
+    add_ai_arg(selfplay_parser)
+    profiling.add_profile_args(selfplay_parser)
+    selfplay_parser.add_argument("-o", "--opponent", default="", help="""
+        The name or full path of the AI to play against. Defaults to the same
+        AI as `--ai`.
+    """)
+    selfplay_parser.add_argument("-n", "--matches", type=int, default=10)
+    selfplay_parser.add_argument("-p", "--processes", type=int, help="""
+        Number of worker processes. Defaults to the number of CPUs.
+    """)
+    selfplay_parser.add_argument("--seed", type=int, default=0, help="""
+        Seed of the first match. Match N uses seed `SEED + N`, so the same
+        seed always produces the same set of matches.
+    """)
+
+    # Tournament
+    tournament_parser = commands.add_parser("tournament",
+        help="Rate AIs with a round-robin of simulated versus matches"
+    )
+    tournament_parser.set_defaults(func=cmd_tournament)
+    tournament_parser.add_argument("-a", "--ai", action="append", default=[], help="""
+        The name or full path of an AI class to enter. Give this at least
+        twice. Defaults to every AI for the current game,
+        except "remote".
+    """)
+    tournament_parser.add_argument("-n", "--seeds", type=int, default=10, help="""
+        Number of seeds. Each pair of AIs plays two matches per seed, one
+        from each side.
+    """)
+    tournament_parser.add_argument("--seed", type=int, default=0, help="""
+        First seed. Seeds `SEED` to `SEED + SEEDS - 1` are used.
+    """)
+    tournament_parser.add_argument("-p", "--processes", type=int, help="""
+        Number of worker processes. Defaults to the number of CPUs.
+    """)
+    tournament_parser.add_argument("-r", "--results", default="tournament.jsonl", help="""
+        File that results are appended to. Matches already in this file are
+        not played again, so rerunning the same command resumes an
+        interrupted tournament.
+    """)
+
+    # Serve
+    serve_parser = commands.add_parser("serve",
+        help="Answer move requests from other processes over a Unix socket"
+    )
+    serve_parser.set_defaults(func=cmd_serve)
+    serve_parser.add_argument("-s", "--socket", default=None, help="""
+        Path of the Unix socket to listen on. Defaults to "/tmp/ptai.sock",
+        or the PTAI_SOCKET environment variable if set.
+    """)
+    serve_parser.add_argument("-a", "--ai", action="append", default=[], help="""
+        Name or full path of an AI to create at startup, so the first request
+        for it doesn't wait. May be given more than once. Other AIs are
+        created when first asked for.
+    """)
+    serve_parser.add_argument("--cache-size", type=int, default=100000, help="""
+        Number of moves to remember, by AI and position.
+    """)
+
+    # Capture
+    capture_parser = commands.add_parser("capture",
+        help="Record PPT2's memory to a file, frame by frame"
+    )
+    capture_parser.set_defaults(func=cmd_capture)
+    capture_parser.add_argument("output", help="""
+        Path of the capture file to write.
+    """)
+    capture_parser.add_argument("-n", "--frames", type=int, help="""
+        Stop after this many frames. By default, capture until interrupted
+        with Ctrl-C.
+    """)
+    capture_parser.add_argument("-d", "--duration", type=float, metavar="SECONDS",
+        help="Stop after this many seconds."
+    )
+    capture_parser.add_argument("--interval", type=float, default=0.0,
+        metavar="SECONDS", help="""
+        Minimum time between frames. By default frames are captured as fast
+        as the Switch can be read.
+    """)
+    capture_parser.add_argument("--keyframe-interval", type=int, default=300,
+        metavar="N", help="""
+        Store a complete frame every N frames. Frames in between only store
+        the bytes that changed.
+    """)
+
+    # Calibrate
+    calibrate_parser = commands.add_parser("calibrate",
+        help="Find the fastest botbase timing that makes moves reliably"
+    )
+    calibrate_parser.set_defaults(func=cmd_calibrate)
+    add_interface_arg(calibrate_parser)
+    add_ai_arg(calibrate_parser)
+    calibrate_parser.add_argument("-c", "--console", help="""
+        Name of the console to calibrate, as printed by multiplay, like
+        "usb:1-4". The ppt2 interface is used, and the profile is saved
+        beside the default one, like "ppt2_timing.usb-1-4.json", where
+        multiplay looks for that console's profile.
+    """)
+    calibrate_parser.add_argument("-o", "--output", help="""
+        Path to save the timing profile to. Defaults to the profile that PPT2
+        interfaces load at startup, "ppt2_timing.json" unless the PTAI_TIMING
+        environment variable is set, or the console's profile with --console.
+    """)
+    calibrate_parser.add_argument("-n", "--moves", type=int, default=10, help="""
+        Number of moves that must all succeed for a setting to be kept.
+    """)
+
+    # Memory Scan
+    memscan_parser = commands.add_parser("memscan",
+        help="Search the Switch's memory for values, narrowing over passes"
+    )
+    memscan_parser.set_defaults(func=cmd_memscan)
+    memscan_parser.add_argument("action", choices=("new", "next", "show"), help="""
+        "new" scans a range, for `--value` or `--pattern` if given, or
+        otherwise just takes a snapshot. "next" re-reads the candidates from
+        the last scan and keeps the ones matching `--condition`. "show"
+        prints the current candidates.
+    """)
+    memscan_parser.add_argument("-f", "--file", default="memscan.npz", help="""
+        File that candidates are saved to between passes.
+    """)
+    memscan_parser.add_argument("--segment", default="heap",
+        choices=("absolute", "main", "heap"))
+    memscan_parser.add_argument("--start", type=lambda s: int(s, 0), default=0,
+        help="Start address of the range to scan."
+    )
+    memscan_parser.add_argument("--size", type=lambda s: int(s, 0), default=0x100000,
+        help="Size in bytes of the range to scan."
+    )
+    memscan_parser.add_argument("-t", "--type", default="u32",
+        choices=("u8", "u16", "u32", "u64", "i8", "i16", "i32", "i64", "f32", "f64"),
+        help="Type of value to search for."
+    )
+    memscan_parser.add_argument("--align", type=int, help="""
+        Only consider addresses that are a multiple of this. Defaults to the
+        size of the type.
+    """)
+    memscan_parser.add_argument("--value", help="Value to search for.")
+    memscan_parser.add_argument("--pattern", help="""
+        Bytes to search for in hex, with "??" matching any byte. For example
+        "01 00 ?? ff".
+    """)
+    memscan_parser.add_argument("-c", "--condition", help="""
+        One of "equal", "changed", "unchanged", "increased" or "decreased".
+        Defaults to "equal" if `--value` is given, otherwise "changed".
+    """)
+    memscan_parser.add_argument("-n", "--show", type=int, default=20, help="""
+        Number of candidates to print.
+    """)
 
     args = parser.parse_args()
     game = GAMES[args.game]
+
+    # Answer `--interface help` and `--ai help` before the command imports
+    # anything or connects to a console.
+    if getattr(args, "interface", None) == "help":
+        get_interface(game, "help")
+    ai_names = getattr(args, "ai", None)
+    if "help" in (ai_names if isinstance(ai_names, list) else [ai_names]):
+        get_ai_path(game, "help")
+
     args.func(game, args)
 
 def usage_error(msg):
@@ -70,43 +286,18 @@ def usage_error(msg):
 def instantiate_class(spec_string: str,
                       shortcut_names: Dict[str, str],
                       expected_base_cls: type):
-    """Import and instantiate a class.
-
-    :arg spec_string: A string in the form "path.to.Class".
-    :arg shortcut_names: Maps names that can be used as a shortcut for the
-        whole import path of the class.
-    :arg expected_base_cls: Base class which the given class should be a
-        subclass of. This is for catching user mistakes of importing the wrong
-        class.
+    """Import and instantiate a class, exiting with a usage error if it fails.
+
+    See `ptai.classpath.instantiate_class()` for the arguments.
     """
-    path = shortcut_names.get(spec_string, spec_string)
     GENERIC_ERROR = 'Paths for AIs and Interfaces should be ' + \
         'dot-separated python paths. For example: ' + \
         '"path.to.module.ClassName". Use "--interface help" or "--ai help" ' + \
         'to get a list of valid ' 'interfaces or AIs.'
-
-
-    if "." not in path:
-        usage_error(
-            f'Bad path "{spec_string}"\n' + GENERIC_ERROR
-        )
-
-    module_path, class_name = path.rsplit('.', 1)
-    try:
-        module = importlib.import_module(module_path)
-    except ModuleNotFoundError as e:
-        usage_error(str(e) + "\n" + GENERIC_ERROR)
     try:
-        cls = getattr(module, class_name, )
-    except AttributeError as e:
+        return classpath.instantiate_class(spec_string, shortcut_names, expected_base_cls)
+    except classpath.ClassPathError as e:
         usage_error(str(e) + "\n" + GENERIC_ERROR)
-    try:
-        is_subclass = issubclass(cls, expected_base_cls)
-    except TypeError:
-        is_subclass = False
-    if not is_subclass:
-        usage_error(f'Imported {spec_string} successfully, but it is not a subclass of {expected_base_cls} as expected.\n' + GENERIC_ERROR)
-    return cls()
 
 def get_interface(game, name_or_path):
     if name_or_path == "help":
@@ -121,13 +312,28 @@ def get_interface(game, name_or_path):
     if not name_or_path:
         name_or_path = game.default_interface
 
+    from ptai.gameinterface import GameInterface
     return instantiate_class(
         name_or_path,
         game.interfaces,
         GameInterface,
     )
 
-def get_ai(game, name_or_path):
+def get_console_interface(console:str):
+    """Create a PPT2 interface for the attached console named `console`."""
+    from ptai.ppt2.puyointerface import PPT2PuyoInterface
+    from ptai.ppt2.switch import SwitchDeviceNotFound, find_switches, switch_names
+
+    # Only the chosen console is connected to, so calibrating one doesn't
+    # disturb others being played on.
+    try:
+        switch, = find_switches(name=console)
+    except SwitchDeviceNotFound:
+        usage_error(f'Console "{console}" not found. Attached consoles: ' +
+                    (", ".join(switch_names()) or "none"))
+    return PPT2PuyoInterface(switch=switch)
+
+def get_ai_path(game, name_or_path):
     if name_or_path == "help":
         usage_error(
             "Valid AIs for this game: " +
@@ -137,15 +343,27 @@ def get_ai(game, name_or_path):
         )
     if not name_or_path:
         name_or_path = game.default_ai
+    return game.ais.get(name_or_path, name_or_path)
 
+def get_ai(game, name_or_path):
+    path = get_ai_path(game, name_or_path)
+    from ptai.ai import AI
     return instantiate_class(
-        name_or_path,
+        path,
         game.ais,
         AI,
     )
 
 def cmd_getstate(game, args):
     interface = get_interface(game, args.interface)
+    if args.raw:
+        print_raw_state(interface)
+        while args.loop:
+            sleep(0.5)
+            print()
+            print_raw_state(interface)
+        return
+
     state = interface.get_state()
     print(state)
 
@@ -155,19 +373,337 @@ def cmd_getstate(game, args):
         print()
         print(state)
 
+def print_raw_state(interface):
+    # Imported here so the other commands don't need pyusb installed
+    from ptai.ppt2.puyointerface import MAIN_POINTER
+    from ptai.ppt2.puyotypes import MainStruct
+    from ptai.ppt2.switchtypes import format_reachable
+
+    switch = getattr(interface, "switch", None)
+    if switch is None:
+        usage_error("--raw only works with PPT2 interfaces")
+    root = MainStruct.pointer_t.pointer_t(MAIN_POINTER, "main")
+    text, reader = format_reachable(root, switch)
+    print(text)
+    print(f"Read with {reader.stats()}", file=sys.stderr)
+
 def cmd_getmove(game, args):
     interface = get_interface(game, args.interface)
     ai = get_ai(game, args.ai)
+    profiler = profiling.profiler_from_args(args)
 
-    state = interface.get_state()
-    move = ai.get_move(state)
+    if profiler:
+        for _ in range(args.profile_turns or 1):
+            with profiler:
+                state = interface.get_state()
+                move = ai.get_move(state)
+    else:
+        state = interface.get_state()
+        move = ai.get_move(state)
     print("X:", move.x)
     print("Y:", move.y)
     print("Orientation:", move.orientation)
 
+    if profiler:
+        write_profile(profiler, args)
+
 def cmd_play(game, args):
+    from ptai.driver import Driver, PipelinedDriver
+    from ptai.records import PositionRecorder
+
     interface = get_interface(game, args.interface)
     ai = get_ai(game, args.ai)
-    driver = Driver(interface, ai)
+    recorder = PositionRecorder(args.record) if args.record else None
+    driver_cls = PipelinedDriver if args.pipelined else Driver
+    driver = driver_cls(interface, ai, recorder)
+    profiler = profiling.profiler_from_args(args)
+    max_turns = args.max_turns
+    if profiler and args.profile_turns:
+        max_turns = args.profile_turns
+
+    try:
+        if profiler:
+            with profiler:
+                driver.play(max_turns=max_turns)
+        else:
+            driver.play(max_turns=max_turns)
+    finally:
+        interface.close()
+        if recorder:
+            recorder.close()
+        if profiler:
+            write_profile(profiler, args)
+
+def cmd_multiplay(game, args):
+    # Imported here so the other commands don't need pyusb installed
+    from ptai import multiconsole, server
+    from ptai.ppt2.inputs import Timing
+    from ptai.ppt2.puyointerface import PPT2PuyoInterface
+    from ptai.ppt2.switch import SwitchDeviceNotFound, find_switches
+
+    if game is not GAMES["puyo"]:
+        usage_error("multiplay is only implemented for puyo")
+    ai_path = get_ai_path(game, args.ai)
+    # Instantiate once here so mistakes are reported before any workers are
+    # started.
+    get_ai(game, ai_path)
+    try:
+        switches = find_switches()
+    except SwitchDeviceNotFound:
+        print("No consoles found", file=sys.stderr)
+        sys.exit(1)
+    interfaces = {
+        switch.transport.name: PPT2PuyoInterface(
+            switch=switch, timing=Timing.load_console(switch.transport.name),
+        )
+        for switch in switches
+    }
+    print(f"Playing on {', '.join(interfaces)}", file=sys.stderr)
+
+    pool = multiconsole.AIPool(
+        ai_path,
+        game.ais,
+        processes=args.processes or len(interfaces),
+        cache=server.MoveCache(args.cache_size),
+    )
+    consoles = multiconsole.MultiConsole(interfaces, pool)
+    try:
+        consoles.play(max_turns=args.max_turns)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.close()
+        for interface in interfaces.values():
+            interface.close()
+        print(consoles.format_report(), file=sys.stderr)
+
+def write_profile(profiler:profiling.Profiler, args):
+    paths = profiler.write(args.profile)
+    print(file=sys.stderr)
+    print(profiler.summary(), file=sys.stderr)
+    print("Profile written to: " + ", ".join(paths), file=sys.stderr)
+
+def cmd_serve(game, args):
+    from ptai import server
+
+    from ptai.ai import AI
+
+    def make_ai(name):
+        # Errors are sent back to the client that asked for the AI
+        return classpath.instantiate_class(name or game.default_ai, game.ais, AI)
+
+    path = args.socket or server.DEFAULT_SOCKET
+    try:
+        ai_server = server.AIServer(
+            path,
+            get_state_cls(game),
+            make_ai,
+            server.MoveCache(args.cache_size),
+        )
+    except OSError as e:
+        print(f"Can't serve on {path}: {e.strerror}", file=sys.stderr)
+        sys.exit(1)
+    for name in args.ai:
+        try:
+            ai_server.get_ai(name)
+        except classpath.ClassPathError as e:
+            ai_server.server_close()
+            usage_error(str(e))
+    print(f"Serving on {path}, press Ctrl-C to stop...", file=sys.stderr)
+    try:
+        ai_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ai_server.server_close()
+        cache = ai_server.cache
+        print(f"Answered {ai_server.n_requests} requests, "
+              f"{cache.n_hits} from the cache", file=sys.stderr)
+
+def cmd_capture(game, args):
+    # Imported here so the other commands don't need pyusb installed
+    from ptai.ppt2 import capture
+    from ptai.ppt2.switch import Switch
+    from ptai.ppt2.puyointerface import MAIN_POINTER
+
+    switch = Switch()
+    switch.set_sleep_time(0)
+    print("Capturing, press Ctrl-C to stop...", file=sys.stderr)
+    n_frames = capture.capture(
+        switch,
+        args.output,
+        MAIN_POINTER,
+        n_frames=args.frames,
+        duration=args.duration,
+        interval=args.interval,
+        keyframe_interval=args.keyframe_interval,
+    )
+    print(f"Captured {n_frames} frames to {args.output}", file=sys.stderr)
+
+def cmd_calibrate(game, args):
+    # Imported here so the other commands don't need pyusb installed
+    from ptai.ppt2 import calibrate
+    from ptai.ppt2.inputs import TIMING_PROFILE, Timing, console_profile
+
+    if args.console:
+        interface = get_console_interface(args.console)
+    else:
+        interface = get_interface(game, args.interface)
+    if not hasattr(interface, "set_timing"):
+        usage_error("calibrate only works with PPT2 interfaces")
+    ai = get_ai(game, args.ai)
+    print("Calibrating, keep the game running...", file=sys.stderr)
+    try:
+        timing = calibrate.calibrate(interface, ai, n_moves=args.moves, start=Timing())
+    except calibrate.CalibrationError as e:
+        print(f"Calibration failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    output = args.output or (
+        console_profile(args.console) if args.console else TIMING_PROFILE
+    )
+    timing.save(output)
+    print(timing)
+    print(f"Saved to {output}", file=sys.stderr)
+
+def cmd_memscan(game, args):
+    # Imported here so the other commands don't need pyusb installed
+    import numpy
+    from ptai.ppt2 import memscan
+    from ptai.ppt2.switch import Switch
+
+    if args.action == "show":
+        print(memscan.format_result(memscan.ScanResult.load(args.file), args.show))
+        return
+
+    switch = Switch()
+    switch.set_sleep_time(0)
+    if args.action == "new":
+        dtype = numpy.dtype(memscan.TYPES[args.type])
+    else:
+        result = memscan.ScanResult.load(args.file)
+        dtype = result.dtype
+    value = None
+    if args.value is not None:
+        value = float(args.value) if dtype.kind == "f" else int(args.value, 0)
+
+    if args.action == "new":
+        result = memscan.scan_range(
+            switch, args.segment, args.start, args.size, dtype,
+            value=value, pattern=args.pattern, align=args.align,
+        )
+    else:
+        condition = args.condition or ("equal" if value is not None else "changed")
+        if condition not in memscan.CONDITIONS:
+            usage_error(f"Invalid condition: {condition}")
+        if condition == "equal" and value is None:
+            usage_error('Condition "equal" needs --value')
+        result = memscan.narrow(switch, result, condition, value)
+
+    result.save(args.file)
+    print(memscan.format_result(result, args.show))
+
+def cmd_evaluate(game, args):
+    from ptai import evaluate
+
+    ai_paths = [get_ai_path(game, name) for name in args.ai or [""]]
+    for path in ai_paths:
+        # Instantiate once here so mistakes are reported before any workers
+        # are started.
+        get_ai(game, path)
+
+    with open(args.recording) as f:
+        totals = evaluate.evaluate(
+            game,
+            ai_paths,
+            f,
+            chunk_size=args.chunk_size,
+            processes=args.processes,
+        )
+    print(evaluate.format_report(ai_paths, totals))
+
+def cmd_selfplay(game, args):
+    from ptai.puyo import versus
+
+    if game is not GAMES["puyo"]:
+        usage_error("Versus matches are only implemented for puyo")
+    ai_paths = (
+        get_ai_path(game, args.ai),
+        get_ai_path(game, args.opponent or args.ai),
+    )
+    for path in ai_paths:
+        get_ai(game, path)
+
+    profiler = profiling.profiler_from_args(args)
+    processes = args.processes
+    max_turns = versus.MAX_TURNS
+    if profiler:
+        # Worker processes can't be profiled from here
+        processes = 1
+        max_turns = args.profile_turns or max_turns
+
+    wins = [0, 0]
+    n_draws = 0
+    results = versus.play_matches(
+        ai_paths,
+        range(args.seed, args.seed + args.matches),
+        game.ais,
+        processes=processes,
+        max_turns=max_turns,
+    )
+    if profiler:
+        with profiler:
+            results = list(results)
+        write_profile(profiler, args)
+    for result in results:
+        if result.winner is None:
+            n_draws += 1
+            outcome = "draw"
+        else:
+            wins[result.winner] += 1
+            outcome = f"player {result.winner} wins"
+        print(f"Seed {result.seed}: {outcome} after {result.n_turns} turns, "
+              f"scores {result.scores[0]}-{result.scores[1]}, "
+              f"nuisance sent {result.nuisance_sent[0]}-{result.nuisance_sent[1]}")
+
+    print()
+    print(f"Player 0 ({ai_paths[0]}): {wins[0]} wins")
+    print(f"Player 1 ({ai_paths[1]}): {wins[1]} wins")
+    print(f"Draws: {n_draws}")
+
+def cmd_tournament(game, args):
+    from ptai import tournament
+
+    if game is not GAMES["puyo"]:
+        usage_error("Versus matches are only implemented for puyo")
+    # By default every AI plays, except "remote" which needs a server
+    # running and would only play as one of the others.
+    ai_paths = [get_ai_path(game, name) for name in args.ai] or [
+        path for name, path in game.ais.items() if name != "remote"
+    ]
+    ai_paths = list(dict.fromkeys(ai_paths))
+    if len(ai_paths) < 2:
+        usage_error("A tournament needs at least two different AIs")
+    for path in ai_paths:
+        get_ai(game, path)
+
+    seeds = range(args.seed, args.seed + args.seeds)
+    # Only count earlier results from this schedule, since the results file
+    # may hold matches between other AIs
+    keys = {job.key() for job in tournament.schedule(ai_paths, seeds)}
+    n_jobs = len(keys)
+    results = list({
+        tournament.result_key(result): result
+        for result in tournament.load_results(args.results)
+        if tournament.result_key(result) in keys
+    }.values())
+    print(f"{len(results)} of {n_jobs} matches already played")
+
+    for result in tournament.run(ai_paths, seeds, args.results, game.ais,
+                                 processes=args.processes):
+        results.append(result)
+        print(f"[{len(results)}/{n_jobs}] {result['players'][0]} vs "
+              f"{result['players'][1]}, seed {result['seed']}: winner "
+              f"{result['winner']}")
 
-    driver.play(max_turns=args.max_turns)
+    print()
+    print(tournament.format_standings(ai_paths, results))
@@ -1,41 +1,56 @@
+import queue
+import threading
+from typing import Optional
+
+from ptai.gamestate import GameState
 from ptai.gameinterface import GameInterface
+from ptai.actions import Action
 from ptai.ai import AI
+from ptai.records import PositionRecorder
+from ptai.profiling import tag
+from ptai.schedule import FrameBudget
 
 class Driver:
+    """Plays a game by polling the interface and asking the AI for moves.
+
+    If the interface's states carry the game's frame counter, `budget`
+    estimates how long each turn's piece has left to fall and the AI is
+    given a deadline with `AI.get_move_before()`.
+    """
 
-    def __init__(self, interface:GameInterface, ai:AI):
+    def __init__(self, interface:GameInterface, ai:AI,
+                 recorder:Optional[PositionRecorder]=None,
+                 budget:Optional[FrameBudget]=None):
         self.interface = interface
         self.ai = ai
+        self.recorder = recorder
+        self.budget = budget or FrameBudget.for_interface(interface)
+        # Moves that didn't land where the AI expected
+        self.n_incorrect = 0
 
-    def play(self, max_turns=float("inf")):
+    @tag("driver")
+    def play(self, max_turns=None):
+        if max_turns is None:
+            max_turns = float("inf")
         expected_next_state = None
         last_move = None
         last_state = None
         n_turns = 0
         while n_turns <= max_turns:
             state = self.interface.get_state()
+            self.budget.observe(state)
             if state.new_turn:
                 n_turns += 1
 
                 if expected_next_state:
-                    # Check if the previous move was performed correctly
-                    #TODO: Account for nuisance
-                    if not (state.board == expected_next_state.board).all():
-                        print()
-                        print("Move performed incorrectly!")
-                        print("Move:", last_move)
-                        print("Before move:")
-                        print(last_state)
-                        print("Expected:")
-                        print(expected_next_state)
-                        print("Actual:")
-                        print(state)
-                        print()
-
-                action = self.ai.get_move(state)
+                    self.check_move(last_state, last_move, expected_next_state, state)
+
+                action = self.ai.get_move_before(state, self.budget.deadline(state))
                 expected_next_state = None
                 if action:
-                    self.interface.perform_action(action)
+                    if self.recorder:
+                        self.recorder.record(state, action)
+                    self._perform(action)
 
                     # Record the expected next board given the current state
                     # and the move given
@@ -43,3 +58,223 @@ class Driver:
                     expected_next_state = state.copy()
                     expected_next_state.move(action)
                     last_move = action
+
+    def _perform(self, action:Action):
+        self.budget.inputs_sent()
+        self.interface.perform_action(action)
+        # See how far the piece fell while the AI was thinking
+        if self.interface.fall_sample is not None:
+            self.budget.observe_fall(*self.interface.fall_sample)
+
+    def check_move(self, last_state:GameState, last_move:Action,
+                   expected:GameState, state:GameState) -> bool:
+        """Check if the previous move was performed correctly."""
+        #TODO: Account for nuisance
+        if (state.board == expected.board).all():
+            return True
+        self.n_incorrect += 1
+        print()
+        print("Move performed incorrectly!")
+        print("Move:", last_move)
+        print("Before move:")
+        print(last_state)
+        print("Expected:")
+        print(expected)
+        print("Actual:")
+        print(state)
+        print()
+        return False
+
+
+class PipelinedDriver(Driver):
+    """Reads, thinks and acts on separate threads.
+
+    A reader thread polls the interface, an actuator thread performs actions,
+    and the AI plans on the calling thread (so sampling profiles still see
+    it), connected by queues holding one item each. The planner hands each
+    action off as soon as it's chosen. While the inputs are sent and the
+    reader waits for the next turn, it checks and records the previous move,
+    then plans the next turn's move ahead of time: the next piece is already
+    in the queue, and the board it will land on is the expected result of
+    this move. When the next turn arrives, the move planned ahead is used if
+    the board matches and the queue starts with the pieces it was planned
+    with, and otherwise the AI plans again. Moves planned ahead don't see the
+    piece revealed at the end of the queue.
+
+    Interface calls from the two threads are serialized by a lock, since
+    they share one connection. Once the reader has handed over a new turn,
+    it stops reading until that turn's action is sent (or the AI gives
+    none), so the actuator never waits behind a read. Each state read is
+    tagged with the number of actions sent before it, and states read
+    before the last planned action was sent are dropped as stale.
+    """
+
+    # Seconds to wait on a queue before checking for shutdown
+    poll_interval = 0.05
+    # Seconds the reader sleeps while it has nothing to do
+    idle_interval = 0.001
+
+    def __init__(self, interface:GameInterface, ai:AI,
+                 recorder:Optional[PositionRecorder]=None,
+                 budget:Optional[FrameBudget]=None):
+        super().__init__(interface, ai, recorder, budget)
+        self.n_dropped = 0
+        # Turns played with the move planned ahead of time
+        self.n_speculated = 0
+        self._interface_lock = threading.Lock()
+        self._states: queue.Queue = queue.Queue(maxsize=1)
+        self._actions: queue.Queue = queue.Queue(maxsize=1)
+        self._stop = threading.Event()
+        # Set while the reader should poll, cleared once it has found a new
+        # turn and until the action for it is sent
+        self._reading = threading.Event()
+        self._error: Optional[BaseException] = None
+        # Actions planned, and actions sent to the interface
+        self._n_planned = 0
+        self._n_sent = 0
+
+    @tag("driver")
+    def play(self, max_turns=None):
+        if max_turns is None:
+            max_turns = float("inf")
+        self._stop.clear()
+        self._error = None
+        self._n_planned = 0
+        self._n_sent = 0
+        self._reading.set()
+        threads = [
+            threading.Thread(target=self._run, args=(self._read,), name="reader"),
+            threading.Thread(target=self._run, args=(self._actuate,), name="actuator"),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            self._plan(max_turns)
+            # Let the last action be sent before stopping
+            while self._n_sent < self._n_planned and not self._stop.is_set():
+                self._stop.wait(self.poll_interval)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        """Ask `play()` to return, from any thread."""
+        self._stop.set()
+
+    def _run(self, target):
+        try:
+            target()
+        except BaseException as e:
+            self._error = e
+            self._stop.set()
+
+    def _read(self):
+        while not self._stop.is_set():
+            # Nothing read now would be used: the planner is working on a
+            # turn, or the board is about to change.
+            if not self._reading.wait(self.poll_interval):
+                continue
+            if self._n_sent < self._n_planned:
+                self._stop.wait(self.idle_interval)
+                continue
+            with self._interface_lock:
+                n_sent = self._n_sent
+                state = self.interface.get_state()
+            self.budget.observe(state)
+            if state.new_turn:
+                self._reading.clear()
+                self._put_latest(self._states, (n_sent, state))
+
+    def _actuate(self):
+        while not self._stop.is_set():
+            try:
+                action = self._actions.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            with self._interface_lock:
+                self._perform(action)
+                self._n_sent += 1
+            self._reading.set()
+
+    @tag("driver")
+    def _plan(self, max_turns):
+        # The state the next turn is expected to start with, and the move
+        # planned for it
+        speculation = None
+        expected_next_state = None
+        last_move = None
+        last_state = None
+        n_turns = 0
+        while n_turns <= max_turns and not self._stop.is_set():
+            try:
+                n_sent, state = self._states.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            if n_sent < self._n_planned:
+                self.n_dropped += 1
+                self._reading.set()
+                continue
+            n_turns += 1
+
+            if speculation is not None and self._matches(speculation[0], state):
+                action = speculation[1]
+                self.n_speculated += 1
+            else:
+                action = self.ai.get_move_before(state, self.budget.deadline(state))
+            speculation = None
+            if action:
+                self._n_planned += 1
+                self._put(self._actions, action)
+            else:
+                self._reading.set()
+
+            # Bookkeeping happens after the action is handed off, so it
+            # doesn't delay the inputs.
+            if expected_next_state:
+                self.check_move(last_state, last_move, expected_next_state, state)
+            expected_next_state = None
+            if action:
+                if self.recorder:
+                    self.recorder.record(state, action)
+                last_state = state
+                expected_next_state = state.copy()
+                expected_next_state.move(action)
+                last_move = action
+
+                # Plan the next turn while this one's inputs are sent and the
+                # reader waits for the next turn.
+                if len(state.queue) > 1 and n_turns <= max_turns:
+                    next_state = expected_next_state.copy()
+                    next_state.queue = state.queue[1:]
+                    speculation = (next_state, self.ai.get_move_before(
+                        next_state, self.budget.deadline(next_state)))
+
+    @staticmethod
+    def _matches(expected:GameState, state:GameState) -> bool:
+        """Whether a move planned for `expected` can be used for `state`."""
+        return (state.board == expected.board).all() and \
+            state.queue[:len(expected.queue)] == expected.queue
+
+    def _put(self, q:queue.Queue, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=self.poll_interval)
+                return
+            except queue.Full:
+                pass
+
+    def _put_latest(self, q:queue.Queue, item):
+        """Put an item, replacing whatever is waiting in the queue."""
+        while True:
+            try:
+                q.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    self.n_dropped += 1
+                except queue.Empty:
+                    pass
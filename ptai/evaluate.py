@@ -0,0 +1,205 @@
+"""
+Offline evaluation of AIs against recorded games.
+
+Positions are streamed from a recording (see `ptai.records`) in chunks, so
+recordings of any size can be evaluated without loading them into memory. Each
+chunk is handed to a worker process, which asks every AI for its move and
+compares it to the move that was actually played.
+"""
+import math
+import multiprocessing
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Optional, TextIO
+
+from ptai.ai import AI
+from ptai.classpath import instantiate_class
+from ptai.games import GAMES
+from ptai.records import iter_record_chunks, record_to_state, record_to_move
+
+
+class LatencyHistogram:
+    """Streaming histogram of durations with logarithmically sized buckets.
+
+    Percentiles are accurate to within one bucket (about 6%), and the memory
+    used is constant no matter how many samples are added.
+    """
+    BUCKETS_PER_DECADE = 40
+    MIN_SECONDS = 1e-6
+    N_BUCKETS = BUCKETS_PER_DECADE * 9  # 1us to 1000s
+
+    def __init__(self):
+        self.counts = [0] * self.N_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds:float):
+        if seconds <= self.MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = int(math.log10(seconds / self.MIN_SECONDS) * self.BUCKETS_PER_DECADE)
+            bucket = min(bucket, self.N_BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other:"LatencyHistogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p:float) -> float:
+        """Return the upper edge of the bucket containing the `p`th percentile."""
+        if not self.count:
+            return 0.0
+        threshold = self.count * p / 100
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if seen >= threshold:
+                upper = self.MIN_SECONDS * 10 ** ((bucket + 1) / self.BUCKETS_PER_DECADE)
+                return min(upper, self.max)
+        return self.max
+
+
+@dataclass
+class AIStats:
+    """Aggregated results for one AI over some number of positions."""
+    n_positions: int = 0
+
+    # Number of positions where the AI's move resulted in the same board as
+    # the recorded move.
+    n_agree: int = 0
+
+    # Sum of (AI move score - recorded move score) over all positions.
+    score_delta: int = 0
+    n_better: int = 0
+    n_worse: int = 0
+
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    def merge(self, other:"AIStats"):
+        self.n_positions += other.n_positions
+        self.n_agree += other.n_agree
+        self.score_delta += other.score_delta
+        self.n_better += other.n_better
+        self.n_worse += other.n_worse
+        self.latency.merge(other.latency)
+
+    @property
+    def agreement(self) -> float:
+        return self.n_agree / self.n_positions if self.n_positions else 0.0
+
+    @property
+    def mean_score_delta(self) -> float:
+        return self.score_delta / self.n_positions if self.n_positions else 0.0
+
+
+# Set in each worker process by `_init_worker()`.
+_worker_game = None
+_worker_ais: List[AI] = []
+
+def _init_worker(game_name:str, ai_paths:List[str]):
+    global _worker_game, _worker_ais  # pylint: disable=global-statement
+    _worker_game = GAMES[game_name]
+    _worker_ais = [
+        instantiate_class(path, _worker_game.ais, AI)
+        for path in ai_paths
+    ]
+
+def evaluate_chunk(records:List[dict]) -> List[AIStats]:
+    """Evaluate every worker AI on a list of records.
+
+    Records without a move, or whose recorded move isn't legal in the recorded
+    position, are skipped.
+    """
+    all_stats = [AIStats() for _ in _worker_ais]
+    for record in records:
+        state = record_to_state(_worker_game, record)
+        recorded_move = record_to_move(record)
+        if recorded_move is None:
+            continue
+        legal = {(m.orientation, m.x) for m in state.get_moves()}
+        if (recorded_move.orientation, recorded_move.x) not in legal:
+            continue
+
+        recorded_state = state.copy()
+        recorded_result = recorded_state.move(recorded_move)
+
+        for ai, stats in zip(_worker_ais, all_stats):
+            start = time.perf_counter()
+            move = ai.get_move(state.copy())
+            stats.latency.add(time.perf_counter() - start)
+
+            ai_state = state.copy()
+            ai_result = ai_state.move(move)
+            delta = ai_result.score - recorded_result.score
+
+            stats.n_positions += 1
+            stats.n_agree += int((ai_state.board == recorded_state.board).all())
+            stats.score_delta += delta
+            stats.n_better += int(delta > 0)
+            stats.n_worse += int(delta < 0)
+
+    return all_stats
+
+def evaluate(game,
+             ai_paths:List[str],
+             f:TextIO,
+             chunk_size:int=1000,
+             processes:Optional[int]=None) -> List[AIStats]:
+    """Evaluate AIs against the recording in file `f`.
+
+    Returns one `AIStats` for each AI path given. If `processes` is 1, the
+    evaluation runs in the current process, otherwise a process pool is used.
+    At most two chunks per process are in flight at any time, so memory use
+    doesn't grow with the size of the recording.
+    """
+    totals = [AIStats() for _ in ai_paths]
+
+    def merge(chunk_stats):
+        for total, stats in zip(totals, chunk_stats):
+            total.merge(stats)
+
+    chunks = iter_record_chunks(f, chunk_size)
+    if processes == 1:
+        _init_worker(game.name, ai_paths)
+        for chunk in chunks:
+            merge(evaluate_chunk(chunk))
+        return totals
+
+    processes = processes or os.cpu_count() or 1
+    with multiprocessing.Pool(processes, _init_worker, (game.name, ai_paths)) as pool:
+        pending: deque = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(evaluate_chunk, (chunk,)))
+            if len(pending) >= 2 * processes:
+                merge(pending.popleft().get())
+        while pending:
+            merge(pending.popleft().get())
+
+    return totals
+
+def format_report(ai_paths:List[str], totals:List[AIStats]) -> str:
+    lines = []
+    for path, stats in zip(ai_paths, totals):
+        latency = stats.latency
+        lines.append(path)
+        lines.append(f"  Positions:        {stats.n_positions}")
+        lines.append(f"  Agreement:        {stats.agreement:.1%}")
+        lines.append(f"  Score delta:      {stats.mean_score_delta:+.1f} per move "
+                     f"({stats.n_better} better, {stats.n_worse} worse)")
+        lines.append(f"  Latency (ms):     mean {latency.mean*1000:.2f}, "
+                     f"p50 {latency.percentile(50)*1000:.2f}, "
+                     f"p95 {latency.percentile(95)*1000:.2f}, "
+                     f"max {latency.max*1000:.2f}")
+    return "\n".join(lines)
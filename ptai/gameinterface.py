@@ -1,4 +1,5 @@
 from abc import ABC
+from typing import Optional, Tuple
 
 from ptai.actions import Action
 from ptai.gamestate import GameState
@@ -6,8 +7,19 @@ from ptai.gamestate import GameState
 
 class GameInterface(ABC):
 
+    # `(frame, y)` of the falling piece, read just before the last move's
+    # inputs were sent, by interfaces that can read it along with them.
+    fall_sample:Optional[Tuple[int, int]] = None
+
     def perform_action(self, action:Action):
         raise NotImplementedError()
 
     def get_state(self) -> GameState:
         raise NotImplementedError()
+
+    def input_latency(self) -> Optional[float]:
+        """Seconds a move's inputs take to reach the game, if known."""
+        return None
+
+    def close(self):
+        """Release anything the interface holds, like threads or connections."""
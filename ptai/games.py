@@ -1,9 +1,10 @@
+import importlib
 import random
-from typing import Type, FrozenSet, Dict
+from typing import TYPE_CHECKING, Type, FrozenSet, Dict
 from itertools import product
 
-from .gamestate import GameState
-from .puyo.gamestate import PuyoGameState
+if TYPE_CHECKING:
+    from .gamestate import GameState
 
 
 class Game:
@@ -11,7 +12,9 @@ class Game:
     pieces: FrozenSet[bytes]
     cells: FrozenSet[bytes]
 
-    state_cls: Type[GameState]
+    # Full path of the game state class. It's looked up by
+    # `get_state_cls()`, so listing the games doesn't import numpy.
+    state_cls_path: str
 
     interfaces: Dict[str, str]
     default_interface: str
@@ -25,22 +28,24 @@ class Game:
 
 
 class PuyoGame:
-    name = "puyo",
+    name = "puyo"
     pieces = frozenset(
         b''.join(pair)
         for pair in product(
             [b'r', b'g', b'b', b'y', b'p'],
             repeat=2
         )
-    ),
+    )
     cells = frozenset([
         b'.', b'r', b'g', b'b', b'y', b'p', b'k'
-    ]),
+    ])
 
-    state_cls = PuyoGameState,
+    state_cls_path = "ptai.puyo.gamestate.PuyoGameState"
 
     interfaces = {
         "ppt2": "ptai.ppt2.puyointerface.PPT2PuyoInterface",
+        "ppt2_async": "ptai.ppt2.puyointerface.AsyncPPT2PuyoInterface",
+        "ppt2_probe": "ptai.ppt2.puyointerface.ProbingPPT2PuyoInterface",
         "simulated": "ptai.puyo.simulate.SimulatedPuyoInterface",
     }
     default_interface = "ppt2"
@@ -49,10 +54,17 @@ class PuyoGame:
     ais = {
         "simple_greedy": "ptai.puyo.ai.SimpleGreedyAI",
         "simple_combo": "ptai.puyo.ai.SimpleComboAI",
+        "lookahead_combo": "ptai.puyo.ai.LookaheadComboAI",
+        "remote": "ptai.server.RemoteAI",
     }
     default_ai = "simple_combo"
 
 
+def get_state_cls(game) -> Type["GameState"]:
+    module_path, class_name = game.state_cls_path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_path), class_name)
+
+
 GAMES = {
     "puyo": PuyoGame,
 }
@@ -22,6 +22,10 @@ class MoveResult:
     # True if this move resulted in a game over
     game_over: bool = False
 
+    # Nuisance generated by this move's chain, before offsetting. Only filled
+    # in when playing versus, since it depends on the match's target points.
+    nuisance_sent: int = 0
+
 
 class GameState(ABC):
     """Abstract class for the state of a falling block puzzle game.
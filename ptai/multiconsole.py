@@ -0,0 +1,190 @@
+"""
+Playing on several consoles at once, from one process.
+
+Each console gets its own interface and `PipelinedDriver`, so reading state
+and sending inputs for one console never waits on another. Moves for every
+console are chosen by one `AIPool`: a pool of worker processes, each with
+the AI loaded, in front of one `MoveCache`. A console reaching a position
+another has already seen, like two playing the same seed, gets its move
+from the cache. Moves the AI cut short to meet a deadline aren't cached.
+
+Workers answer whichever console asks next, so the AI shouldn't rely on
+seeing one game's positions in order.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from ptai.actions import MoveAction
+from ptai.ai import AI
+from ptai.classpath import instantiate_class
+from ptai.driver import PipelinedDriver
+from ptai.evaluate import LatencyHistogram
+from ptai.gameinterface import GameInterface
+from ptai.gamestate import GameState
+from ptai.server import MoveCache
+
+# Set in each worker process by `_init_worker()`.
+_worker_ai:Optional[AI] = None
+
+def _init_worker(ai_path:str, ai_shortcuts:dict):
+    global _worker_ai  # pylint: disable=global-statement
+    _worker_ai = instantiate_class(ai_path, ai_shortcuts, AI)
+
+def _get_move(state:GameState, deadline:Optional[float]) -> Tuple[MoveAction, bool]:
+    """Return a move, and whether the AI cut it short."""
+    # `time.monotonic()` is system wide, so the deadline means the same
+    # thing in the worker.
+    move = _worker_ai.get_move_before(state, deadline)
+    return move, _worker_ai.cut_short
+
+
+class AIPool:
+    """Worker processes choosing moves for any number of consoles.
+
+    If `processes` is 1 the AI runs in this process instead, one move at a
+    time. Safe to call from many threads.
+    """
+
+    def __init__(self, ai_path:str, ai_shortcuts:Optional[dict]=None,
+                 processes:Optional[int]=None, cache:Optional[MoveCache]=None):
+        self.ai_path = ai_path
+        self.cache = cache if cache is not None else MoveCache()
+        init_args = (ai_path, ai_shortcuts or {})
+        self._pool = None
+        self._lock = threading.Lock()
+        if processes == 1:
+            _init_worker(*init_args)
+        else:
+            processes = processes or os.cpu_count() or 1
+            self._pool = multiprocessing.Pool(processes, _init_worker, init_args)
+
+    def get_move_before(self, state:GameState,
+                        deadline:Optional[float]) -> Tuple[MoveAction, bool]:
+        """Return a move, and whether it came from the cache."""
+        key = self.cache.key(self.ai_path, state)
+        move = self.cache.get(key)
+        if move is not None:
+            return move, True
+        if self._pool is None:
+            with self._lock:
+                move, cut_short = _get_move(state, deadline)
+        else:
+            move, cut_short = self._pool.apply(_get_move, (state, deadline))
+        if move is not None and not cut_short:
+            self.cache.put(key, move)
+        return move, False
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+@dataclass
+class ConsoleStats:
+    name: str
+    n_moves: int = 0
+    n_cache_hits: int = 0
+    # Seconds from asking the pool for a move to getting it, including
+    # waiting for a free worker
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+
+class PooledAI(AI):
+    """One console's view of an `AIPool`, counting the console's moves."""
+
+    def __init__(self, pool:AIPool, stats:ConsoleStats):
+        self.pool = pool
+        self.stats = stats
+
+    def get_move(self, state:GameState) -> MoveAction:
+        return self.get_move_before(state, None)
+
+    def get_move_before(self, state:GameState, deadline:Optional[float]) -> MoveAction:
+        start = time.perf_counter()
+        move, cache_hit = self.pool.get_move_before(state, deadline)
+        self.stats.latency.add(time.perf_counter() - start)
+        self.stats.n_moves += 1
+        self.stats.n_cache_hits += int(cache_hit)
+        return move
+
+
+class Console:
+
+    def __init__(self, name:str, interface:GameInterface, pool:AIPool):
+        self.name = name
+        self.interface = interface
+        self.stats = ConsoleStats(name)
+        self.driver = PipelinedDriver(interface, PooledAI(pool, self.stats))
+
+
+class MultiConsole:
+    """Plays every console at once, each on its own thread.
+
+    If any console's driver raises, the others are stopped and the error is
+    raised from `play()`.
+    """
+
+    def __init__(self, interfaces:Dict[str, GameInterface], pool:AIPool):
+        self.pool = pool
+        self.consoles = [
+            Console(name, interface, pool)
+            for name, interface in interfaces.items()
+        ]
+        self._errors:List[BaseException] = []
+
+    def play(self, max_turns=None):
+        self._errors = []
+        threads = [
+            threading.Thread(target=self._run, args=(console, max_turns),
+                             name=console.name)
+            for console in self.consoles
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def stop(self):
+        """Ask every driver to return, from any thread."""
+        for console in self.consoles:
+            console.driver.stop()
+
+    def _run(self, console:Console, max_turns):
+        try:
+            console.driver.play(max_turns=max_turns)
+        except BaseException as e:
+            self._errors.append(e)
+            self.stop()
+
+    def format_report(self) -> str:
+        lines = []
+        for console in self.consoles:
+            stats = console.stats
+            driver = console.driver
+            latency = stats.latency
+            lines.append(console.name)
+            lines.append(f"  Moves:            {stats.n_moves} "
+                         f"({stats.n_cache_hits} from the cache)")
+            lines.append(f"  Incorrect moves:  {driver.n_incorrect}")
+            lines.append(f"  Dropped states:   {driver.n_dropped}")
+            lines.append(f"  Planned ahead:    {driver.n_speculated}")
+            lines.append(f"  Latency (ms):     mean {latency.mean*1000:.2f}, "
+                         f"p50 {latency.percentile(50)*1000:.2f}, "
+                         f"p95 {latency.percentile(95)*1000:.2f}, "
+                         f"max {latency.max*1000:.2f}")
+        cache = self.pool.cache
+        lines.append(f"Cache: {cache.n_hits} hits, {cache.n_misses} misses")
+        return "\n".join(lines)
@@ -0,0 +1,126 @@
+"""
+An asyncio flavor of `Switch` which pipelines peeks.
+
+USB I/O for asynchronous peeks happens on a dedicated thread. Each time that
+thread wakes up it takes every peek submitted so far, writes all of their
+commands in one transfer, and then reads the replies in order. Submitting
+several independent peeks before awaiting any of them therefore overlaps their
+round-trips instead of paying for each one in turn:
+
+    grid, struct2 = await asyncio.gather(
+        switch.peek_async("absolute", grid_address, PuyoGrid.size),
+        switch.peek_async("absolute", struct2_address, Struct2.size),
+    )
+
+`AsyncSwitch` is still a `Switch`, so the normal synchronous methods work too.
+They share a lock with the I/O thread, so commands from either never
+interleave on the wire.
+"""
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from ptai.ppt2.switch import Switch
+
+PeekRequest = Tuple[str, int, int, Future]
+
+
+class AsyncSwitch(Switch):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._io_lock = threading.RLock()
+        self._requests: "queue.Queue[Optional[PeekRequest]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit_peek(self, segment:str, address:int, size:int) -> Future:
+        """Queue a peek, returning a future for the bytes read."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="AsyncSwitch I/O", daemon=True
+            )
+            self._thread.start()
+        future: Future = Future()
+        self._requests.put((segment, address, size, future))
+        return future
+
+    async def peek_async(self, segment:str, address:int, size:int) -> bytes:
+        return await asyncio.wrap_future(self.submit_peek(segment, address, size))
+
+    def close(self):
+        """Stop the I/O thread after it finishes any submitted peeks."""
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            requests: List[PeekRequest] = [request]
+            stop = False
+            while True:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                requests.append(request)
+
+            self._do_peeks(requests)
+            if stop:
+                return
+
+    def _do_peeks(self, requests:List[PeekRequest]):
+        futures = [future for segment, address, size, future in requests]
+        try:
+            with self._io_lock:
+                results = self.peek_many([
+                    (segment, address, size)
+                    for segment, address, size, future in requests
+                ])
+        except BaseException as e:  # pylint: disable=broad-except
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+    # The synchronous API takes the same lock as the I/O thread.
+
+    def send_command(self, command:str):
+        with self._io_lock:
+            super().send_command(command)
+
+    def configure(self, name:str, value):
+        with self._io_lock:
+            super().configure(name, value)
+
+    def flush(self):
+        with self._io_lock:
+            super().flush()
+
+    @contextmanager
+    def batch(self):
+        with self._io_lock:
+            with super().batch():
+                yield self
+
+    def peek(self, segment, address, size):
+        with self._io_lock:
+            return super().peek(segment, address, size)
+
+    def queue_peeks(self, requests:List[Tuple[str, int, int]]):
+        with self._io_lock:
+            super().queue_peeks(requests)
+
+    def read_replies(self, n:int) -> List[bytes]:
+        with self._io_lock:
+            return super().read_replies(n)
@@ -0,0 +1,121 @@
+"""
+Find the fastest botbase timing that still makes moves reliably.
+
+Calibration plays moves in a running game, chosen by an AI, and checks each
+one by reading the next turn's board back and comparing it with the
+simulated result. Starting from the default `Timing`, the click time and
+then the move loop sleep are lowered one step at a time, for as long as
+every trial move lands where it should. When a step fails, the setting is
+kept one step slower than the fastest that worked, as a margin, and the
+result is tried once more before it's returned. The round-trip time of a
+command is measured too, and saved with the result for estimating input
+latency (see `Timing.input_latency()`).
+
+Play something that can't be lost to the opponent while calibrating, like a
+solo endless mode, since moves are made at settings that may fail.
+"""
+import statistics
+import sys
+import time
+from dataclasses import replace
+from typing import Callable, Iterable, Optional, Tuple
+
+from ptai.ai import AI
+from ptai.puyo.gamestate import PuyoGameState
+from ptai.ppt2.inputs import Timing
+from ptai.ppt2.puyointerface import MAIN_POINTER, PPT2PuyoInterface
+
+# Values tried for `click_ms` and `loop_ms`, slowest first
+CLICK_STEPS = (20, 15, 12, 10, 8, 6, 4, 2)
+LOOP_STEPS = (20, 15, 12, 10, 8, 6, 4, 2)
+
+
+class CalibrationError(Exception):
+    pass
+
+
+def measure_peek(switch, n:int=20) -> float:
+    """Median milliseconds for the botbase to answer a small peek."""
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        switch.peek("main", MAIN_POINTER, 8)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def wait_for_new_turn(interface:PPT2PuyoInterface,
+                      timeout:float=10.0) -> PuyoGameState:
+    deadline = time.monotonic() + timeout
+    while True:
+        state = interface.get_state()
+        if state.new_turn:
+            return state
+        if time.monotonic() > deadline:
+            raise CalibrationError("Timed out waiting for a new turn")
+
+def trial(interface:PPT2PuyoInterface,
+          ai:AI,
+          timing:Timing,
+          n_moves:int,
+          state:PuyoGameState) -> Tuple[bool, PuyoGameState]:
+    """Make moves at `timing`, returning whether they were all correct.
+
+    `state` is the current turn's state. The state of the turn after the
+    last move made is returned along with the result, so trials can follow
+    each other without waiting out a turn.
+    """
+    interface.set_timing(timing)
+    for _ in range(n_moves):
+        if not any(True for _ in state.get_moves()):
+            raise CalibrationError("No moves left, start a new game")
+        move = ai.get_move(state)
+        expected = state.copy()
+        expected.move(move)
+        interface.perform_action(move)
+
+        state = wait_for_new_turn(interface)
+        if not (state.board == expected.board).all():
+            return False, state
+    return True, state
+
+def calibrate(interface:PPT2PuyoInterface,
+              ai:AI,
+              n_moves:int=10,
+              start:Timing=Timing(),
+              log:Optional[Callable[[str], None]]=None) -> Timing:
+    """Return a fast timing where `n_moves` moves in a row succeed."""
+    log = log or (lambda text: print(text, file=sys.stderr))
+    state = wait_for_new_turn(interface)
+
+    def lower(timing:Timing, field:str, steps:Iterable[int]) -> Timing:
+        nonlocal state
+        passed = [getattr(timing, field)]
+        for value in steps:
+            if value >= passed[-1]:
+                continue
+            ok, state = trial(interface, ai, replace(timing, **{field: value}),
+                              n_moves, state)
+            log(f"{field}={value}: {'ok' if ok else 'failed'}")
+            if not ok:
+                # Back off from the edge of what works
+                return replace(timing, **{field: passed[max(0, len(passed) - 2)]})
+            passed.append(value)
+        return replace(timing, **{field: passed[-1]})
+
+    ok, state = trial(interface, ai, start, n_moves, state)
+    if not ok:
+        raise CalibrationError("Moves failed at the starting timing")
+    timing = lower(start, "click_ms", CLICK_STEPS)
+    timing = lower(timing, "loop_ms", LOOP_STEPS)
+
+    ok, state = trial(interface, ai, timing, n_moves, state)
+    log(f"click_ms={timing.click_ms}, loop_ms={timing.loop_ms}: "
+        f"{'ok' if ok else 'failed'}")
+    if not ok:
+        raise CalibrationError("Moves failed when repeated at the chosen timing")
+
+    interface.switch.set_sleep_time(timing.read_ms)
+    timing = replace(timing, peek_ms=round(measure_peek(interface.switch), 3))
+    interface.set_timing(timing)
+    log(f"peek_ms={timing.peek_ms}")
+    return timing
@@ -0,0 +1,308 @@
+"""
+Capture PPT2's memory to a file, frame by frame.
+
+Each frame, everything reachable from `MainStruct` is read, following the
+pointers declared in `ptai.ppt2.puyotypes`. Only bytes which changed since the
+previous frame are written, except for keyframes which hold every range read
+that frame. A capture can be replayed through `FakeBotbase` to reproduce a
+real game's I/O without a console.
+
+File layout (all integers little-endian):
+
+    Header:    b"PTAICAP1", u32 keyframe interval
+    Frames:    FRAME_HEADER, then n_ranges of (RANGE_HEADER, data)
+    Index:     INDEX_ENTRY for each frame
+    Footer:    u64 index offset, u32 frame count, b"PTAIIDX1"
+
+The index at the end makes any frame reachable with one seek. Files are read
+through `mmap`, so replaying a long capture only touches the frames used.
+"""
+import mmap
+import struct
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from ptai.ppt2.fakebotbase import FakeBotbase, MemoryImage, SEGMENTS
+from ptai.ppt2.switch import Switch
+from ptai.ppt2.switchtypes import SwitchType, Pointer, Struct, AbstractArray
+from ptai.ppt2.puyotypes import MainStruct
+
+MAGIC = b"PTAICAP1"
+INDEX_MAGIC = b"PTAIIDX1"
+HEADER = struct.Struct("<8sI")
+# Frame number, timestamp, keyframe flag, number of ranges
+FRAME_HEADER = struct.Struct("<IdBI")
+# Segment index, address, size
+RANGE_HEADER = struct.Struct("<BQI")
+# File offset, timestamp, keyframe flag
+INDEX_ENTRY = struct.Struct("<QdB")
+FOOTER = struct.Struct("<QI8s")
+
+# Unchanged runs shorter than this are written anyway, rather than splitting
+# a delta into two ranges.
+MIN_GAP = RANGE_HEADER.size
+
+MemoryRange = Tuple[str, int, int]
+
+
+def _contains_pointers(type_cls) -> bool:
+    if isinstance(type_cls, type) and issubclass(type_cls, Pointer):
+        return type_cls.dest_type is not None
+    if isinstance(type_cls, type) and issubclass(type_cls, Struct):
+        return any(
+            _contains_pointers(field.type)
+            for field in type_cls._fields_dict().values()
+        )
+    if isinstance(type_cls, type) and issubclass(type_cls, AbstractArray):
+        return _contains_pointers(type_cls.base_type_cls)
+    return False
+
+def _pointers_in(obj:SwitchType) -> Iterator[Pointer]:
+    if isinstance(obj, Pointer):
+        if obj.value != 0 and obj.dest_type is not None:
+            yield obj
+    elif isinstance(obj, Struct):
+        for name, field in obj._fields_dict().items():
+            if _contains_pointers(field.type):
+                yield from _pointers_in(obj[name])
+    elif isinstance(obj, AbstractArray):
+        if _contains_pointers(obj.base_type_cls):
+            for item in obj.objects:
+                yield from _pointers_in(item)
+
+def read_reachable(switch:Switch, root:Pointer) -> Dict[MemoryRange, bytes]:
+    """Read `root` and every object reachable from it through pointers.
+
+    Returns the bytes read, keyed by `(segment, address, size)`. Each object
+    is read once, even if several pointers lead to it.
+    """
+    ranges: Dict[MemoryRange, bytes] = {}
+    seen: Set[Tuple[str, int]] = set()
+    pending: List[Pointer] = [root]
+    while pending:
+        pointer = pending.pop()
+        dest_type = pointer.dest_type
+        key = (pointer.segment, pointer.value)
+        if key in seen:
+            continue
+        seen.add(key)
+        data = pointer.deref_as_bytes(switch, dest_type.size)
+        ranges[(pointer.segment, pointer.value, dest_type.size)] = data
+        if _contains_pointers(dest_type):
+            pending.extend(_pointers_in(dest_type.from_bytes(data)))
+    return ranges
+
+def main_struct_root(main_pointer:int) -> Pointer:
+    """The pointer to the pointer to `MainStruct`."""
+    return MainStruct.pointer_t.pointer_t(main_pointer, "main")
+
+
+def _changed_runs(old:bytes, new:bytes) -> Iterator[Tuple[int, int]]:
+    """Yield `(start, end)` of the runs of bytes which differ."""
+    start = None
+    last_changed = None
+    for i, (a, b) in enumerate(zip(old, new)):
+        if a == b:
+            continue
+        if start is None:
+            start = i
+        elif i - last_changed > MIN_GAP:
+            yield (start, last_changed + 1)
+            start = i
+        last_changed = i
+    if start is not None:
+        yield (start, last_changed + 1)
+
+
+class CaptureWriter:
+
+    def __init__(self, path:str, keyframe_interval:int=300):
+        self.keyframe_interval = keyframe_interval
+        self.n_frames = 0
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, keyframe_interval))
+        self._index: List[bytes] = []
+        # Memory as the reader will have reconstructed it so far
+        self._previous = MemoryImage()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_frame(self, ranges:Dict[MemoryRange, bytes], timestamp:Optional[float]=None):
+        if timestamp is None:
+            timestamp = time.time()
+        keyframe = self.n_frames % self.keyframe_interval == 0
+        if keyframe:
+            self._previous = MemoryImage()
+
+        chunks: List[bytes] = []
+        n_ranges = 0
+        for (segment, address, size), data in sorted(ranges.items()):
+            segment_index = SEGMENTS.index(segment)
+            if keyframe:
+                runs: Iterator[Tuple[int, int]] = iter([(0, size)])
+            else:
+                old = self._previous.read(segment, address, size)
+                runs = _changed_runs(old, data)
+            for start, end in runs:
+                chunks.append(RANGE_HEADER.pack(segment_index, address + start, end - start))
+                chunks.append(data[start:end])
+                n_ranges += 1
+            self._previous.write(segment, address, data)
+
+        offset = self._file.tell()
+        self._file.write(FRAME_HEADER.pack(self.n_frames, timestamp, keyframe, n_ranges))
+        self._file.write(b''.join(chunks))
+        self._index.append(INDEX_ENTRY.pack(offset, timestamp, keyframe))
+        self.n_frames += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        self._file.write(b''.join(self._index))
+        self._file.write(FOOTER.pack(index_offset, self.n_frames, INDEX_MAGIC))
+        self._file.close()
+
+
+class CaptureReader:
+
+    def __init__(self, path:str):
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.keyframe_interval = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a capture file: {path}")
+        index_offset, self.n_frames, index_magic = FOOTER.unpack_from(
+            self._mmap, len(self._mmap) - FOOTER.size
+        )
+        if index_magic != INDEX_MAGIC:
+            raise ValueError(f"Capture file is truncated: {path}")
+        self._index = [
+            INDEX_ENTRY.unpack_from(self._mmap, index_offset + i * INDEX_ENTRY.size)
+            for i in range(self.n_frames)
+        ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.n_frames
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def timestamp(self, frame:int) -> float:
+        return self._index[frame][1]
+
+    def is_keyframe(self, frame:int) -> bool:
+        return bool(self._index[frame][2])
+
+    def ranges(self, frame:int) -> Iterator[Tuple[str, int, bytes]]:
+        """Yield `(segment, address, data)` for each range stored in a frame."""
+        offset = self._index[frame][0]
+        _, _, _, n_ranges = FRAME_HEADER.unpack_from(self._mmap, offset)
+        offset += FRAME_HEADER.size
+        for _ in range(n_ranges):
+            segment_index, address, size = RANGE_HEADER.unpack_from(self._mmap, offset)
+            offset += RANGE_HEADER.size
+            yield SEGMENTS[segment_index], address, self._mmap[offset:offset+size]
+            offset += size
+
+    def apply_frame(self, image:MemoryImage, frame:int):
+        """Update an image of the previous frame to `frame`."""
+        for segment, address, data in self.ranges(frame):
+            image.write(segment, address, data)
+
+    def image_at(self, frame:int) -> MemoryImage:
+        """Reconstruct memory as it was at `frame`."""
+        keyframe = frame
+        while not self.is_keyframe(keyframe):
+            keyframe -= 1
+        image = MemoryImage()
+        for i in range(keyframe, frame + 1):
+            self.apply_frame(image, i)
+        return image
+
+    def iter_images(self) -> Iterator[Tuple[int, MemoryImage]]:
+        """Yield `(frame, image)` for every frame, in order.
+
+        The same image is updated in place and yielded each time.
+        """
+        image = MemoryImage()
+        for frame in range(self.n_frames):
+            if self.is_keyframe(frame):
+                image.clear()
+            self.apply_frame(image, frame)
+            yield frame, image
+
+
+class ReplayBotbase(FakeBotbase):
+    """`FakeBotbase` which plays back a capture.
+
+    It starts at the first frame and moves to the next captured frame each
+    time its frame advances, staying on the last one once it's reached.
+    Closing it closes the capture.
+    """
+
+    def __init__(self, reader:CaptureReader, **kwargs):
+        self.reader = reader
+        super().__init__(reader.image_at(0), frame_script=self._play, **kwargs)
+
+    def _play(self, image:MemoryImage, frame:int):
+        if frame < self.reader.n_frames:
+            if self.reader.is_keyframe(frame):
+                image.clear()
+            self.reader.apply_frame(image, frame)
+
+    def close(self):
+        self.reader.close()
+
+
+def replay_botbase(path:str, **kwargs) -> ReplayBotbase:
+    """Return a `ReplayBotbase` playing back the capture at `path`.
+
+    Keyword arguments are passed to `FakeBotbase`. Close it, or use it as a
+    context manager, to release the capture.
+    """
+    reader = CaptureReader(path)
+    try:
+        return ReplayBotbase(reader, **kwargs)
+    except BaseException:
+        reader.close()
+        raise
+
+
+def capture(switch:Switch,
+            path:str,
+            main_pointer:int,
+            n_frames:Optional[int]=None,
+            duration:Optional[float]=None,
+            interval:float=0.0,
+            keyframe_interval:int=300) -> int:
+    """Capture until `n_frames` or `duration` is reached, or until interrupted.
+
+    Returns the number of frames written.
+    """
+    root = main_struct_root(main_pointer)
+    start = time.time()
+    with CaptureWriter(path, keyframe_interval) as writer:
+        try:
+            while n_frames is None or writer.n_frames < n_frames:
+                frame_start = time.time()
+                if duration is not None and frame_start - start >= duration:
+                    break
+                writer.write_frame(read_reachable(switch, root), frame_start)
+                remaining = interval - (time.time() - frame_start)
+                if remaining > 0:
+                    time.sleep(remaining)
+        except KeyboardInterrupt:
+            pass
+        return writer.n_frames
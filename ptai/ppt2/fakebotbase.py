@@ -0,0 +1,307 @@
+"""
+A stand-in for a Switch running USB-Botbase, backed by a memory image.
+
+`FakeBotbase` is used as the transport of a `Switch`, in place of
+`UsbTransport`. It decodes the command frames written to it, answers peeks from
+a sparse `MemoryImage`, applies pokes, and records button presses. This lets
+the whole read path, from `PPT2PuyoInterface.get_state()` down to the bytes on
+the wire, be tested and benchmarked without a console.
+
+Latency can be added per USB transfer and per command to model a real
+console, and frames can be scripted so memory changes while a test runs.
+"""
+import json
+import struct
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ptai.ppt2.puyotypes import (
+    MainStruct, PlayerGameState, Board, Struct1, Struct2, Struct3, PuyoGrid, Puyo,
+)
+
+PAGE_SIZE = 0x1000
+SEGMENTS = ("main", "heap", "absolute")
+
+PEEK_COMMANDS = {"peekMain": "main", "peek": "heap", "peekAbsolute": "absolute"}
+POKE_COMMANDS = {"pokeMain": "main", "poke": "heap", "pokeAbsolute": "absolute"}
+
+
+class MemoryImage:
+    """Sparse memory for each segment, stored as pages.
+
+    Reads from memory that was never written return zeros.
+    """
+
+    def __init__(self):
+        self.pages: Dict[str, Dict[int, bytearray]] = {
+            segment: {} for segment in SEGMENTS
+        }
+
+    def clear(self):
+        for pages in self.pages.values():
+            pages.clear()
+
+    def write(self, segment:str, address:int, data:bytes):
+        pages = self.pages[segment]
+        offset = 0
+        while offset < len(data):
+            page_number, page_offset = divmod(address + offset, PAGE_SIZE)
+            n = min(len(data) - offset, PAGE_SIZE - page_offset)
+            page = pages.setdefault(page_number, bytearray(PAGE_SIZE))
+            page[page_offset:page_offset+n] = data[offset:offset+n]
+            offset += n
+
+    def read(self, segment:str, address:int, size:int) -> bytes:
+        pages = self.pages[segment]
+        chunks = []
+        offset = 0
+        while offset < size:
+            page_number, page_offset = divmod(address + offset, PAGE_SIZE)
+            n = min(size - offset, PAGE_SIZE - page_offset)
+            page = pages.get(page_number)
+            if page is None:
+                chunks.append(bytes(n))
+            else:
+                chunks.append(bytes(page[page_offset:page_offset+n]))
+            offset += n
+        return b''.join(chunks)
+
+    def write_pointer(self, segment:str, address:int, value:int):
+        self.write(segment, address, struct.pack("<Q", value))
+
+    def copy(self) -> "MemoryImage":
+        image = MemoryImage()
+        for segment, pages in self.pages.items():
+            image.pages[segment] = {
+                number: bytearray(page) for number, page in pages.items()
+            }
+        return image
+
+    def save(self, path:str):
+        """Save as JSON, with each non-empty page as a hex string."""
+        data = {
+            segment: {
+                hex(number * PAGE_SIZE): page.hex()
+                for number, page in sorted(pages.items())
+                if any(page)
+            }
+            for segment, pages in self.pages.items()
+        }
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path:str) -> "MemoryImage":
+        """Load an image written by `save()`.
+
+        The first frame of a capture made with `ptai.py capture` can also be
+        loaded.
+        """
+        with open(path, "rb") as f:
+            is_capture = f.read(8) == b"PTAICAP1"
+        if is_capture:
+            from ptai.ppt2.capture import CaptureReader
+            with CaptureReader(path) as reader:
+                return reader.image_at(0)
+
+        with open(path) as f:
+            data = json.load(f)
+        image = cls()
+        for segment, pages in data.items():
+            for address, page in pages.items():
+                image.write(segment, int(address, 16), bytes.fromhex(page))
+        return image
+
+
+FrameScript = Callable[[MemoryImage, int], None]
+
+
+class FakeBotbase:
+    """Transport which behaves like USB-Botbase running on a Switch.
+
+    :arg image: Memory to serve peeks from.
+    :arg transfer_latency: Seconds to sleep for every USB write, modeling the
+        fixed cost of a round-trip.
+    :arg command_latency: Seconds to sleep after each command, by command name
+        ("peekAbsolute", "click", ...). The key "*" sets a default.
+    :arg frame_script: Called as `frame_script(image, frame)` each time the
+        frame advances, to change memory as the game would.
+    :arg commands_per_frame: If set, advance one frame after this many
+        commands, so memory changes as a client polls.
+    """
+    MAX_CHUNK_SIZE = 4080
+
+    def __init__(self,
+                 image:Optional[MemoryImage]=None,
+                 transfer_latency:float=0.0,
+                 command_latency:Optional[Dict[str, float]]=None,
+                 frame_script:Optional[FrameScript]=None,
+                 commands_per_frame:Optional[int]=None):
+        self.image = image or MemoryImage()
+        self.transfer_latency = transfer_latency
+        self.command_latency = command_latency or {}
+        self.frame_script = frame_script
+        self.commands_per_frame = commands_per_frame
+
+        self.frame = 0
+        self.config: Dict[str, str] = {}
+        self.held_buttons: set = set()
+        self.button_log: List[Tuple[str, str]] = []
+        self.command_log: List[str] = []
+        self.n_writes = 0
+        self.n_peeks = 0
+        self.n_bytes_peeked = 0
+        self._output = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def reset_stats(self):
+        self.command_log = []
+        self.n_writes = 0
+        self.n_peeks = 0
+        self.n_bytes_peeked = 0
+
+    def advance_frame(self, n:int=1):
+        for _ in range(n):
+            self.frame += 1
+            if self.frame_script:
+                self.frame_script(self.image, self.frame)
+
+    def write(self, data:bytes):
+        self.n_writes += 1
+        if self.transfer_latency:
+            time.sleep(self.transfer_latency)
+
+        # A transfer may hold any number of length-prefixed commands
+        data = bytes(data)
+        while data:
+            length = struct.unpack("<I", data[:4])[0] - 2
+            self._handle(data[4:4+length].decode())
+            data = data[4+length:]
+
+    def read(self, size:int) -> bytes:
+        assert len(self._output) >= size, "Read with no reply waiting"
+        data = bytes(self._output[:size])
+        del self._output[:size]
+        return data
+
+    def _handle(self, command:str):
+        self.command_log.append(command)
+        name, *args = command.split(" ")
+
+        if name in PEEK_COMMANDS:
+            address, size = int(args[0], 16), int(args[1])
+            data = self.image.read(PEEK_COMMANDS[name], address, size)
+            self._output += struct.pack("<I", len(data)) + data
+            self.n_peeks += 1
+            self.n_bytes_peeked += size
+        elif name in POKE_COMMANDS:
+            self.image.write(POKE_COMMANDS[name], int(args[0], 16), bytes.fromhex(args[1]))
+        elif name == "click":
+            self.button_log.append(("click", args[0]))
+        elif name == "press":
+            self.held_buttons.add(args[0])
+            self.button_log.append(("press", args[0]))
+        elif name == "release":
+            self.held_buttons.discard(args[0])
+            self.button_log.append(("release", args[0]))
+        elif name == "configure":
+            self.config[args[0]] = args[1]
+
+        latency = self.command_latency.get(name, self.command_latency.get("*", 0))
+        if latency:
+            time.sleep(latency)
+
+        if self.commands_per_frame and len(self.command_log) % self.commands_per_frame == 0:
+            self.advance_frame()
+
+
+class PuyoMemoryLayout:
+    """Places PPT2 Puyo structures in a `MemoryImage`.
+
+    Structures for each player are laid out at fixed addresses, with every
+    pointer from `MAIN_POINTER` down filled in, so `PPT2PuyoInterface` can
+    read them just as it would on a console.
+    """
+    MAIN_STRUCT = 0x10000
+    PLAYER_BASE = 0x100000
+    PLAYER_STRIDE = 0x10000
+
+    def __init__(self, image:MemoryImage, main_pointer:int):
+        self.image = image
+        image.write_pointer("main", main_pointer, self.MAIN_STRUCT)
+
+    def addresses(self, player:int) -> Dict[str, int]:
+        base = self.PLAYER_BASE + player * self.PLAYER_STRIDE
+        return {
+            "player": base,
+            "board": base + 0x1000,
+            "struct1": base + 0x2000,
+            "struct3": base + 0x3000,
+            "grid": base + 0x4000,
+            "struct2": base + 0x5000,
+        }
+
+    def add_player(self, player:int):
+        a = self.addresses(player)
+        fields = MainStruct._fields_dict()
+        self.image.write_pointer("absolute", self.MAIN_STRUCT + fields[f"player{player}"].offset, a["player"])
+        self._write_field(a["player"], PlayerGameState, "board", a["board"])
+        self._write_field(a["player"], PlayerGameState, "struct2", a["struct2"])
+        self._write_field(a["board"], Board, "struct1", a["struct1"])
+        self._write_field(a["struct1"], Struct1, "struct3", a["struct3"])
+        self._write_field(a["struct3"], Struct3, "puyo_grid", a["grid"])
+
+    def remove_player(self, player:int):
+        fields = MainStruct._fields_dict()
+        self.image.write_pointer("absolute", self.MAIN_STRUCT + fields[f"player{player}"].offset, 0)
+
+    def write_state(self, player:int, state, frame_counter:int=0):
+        """Write a `PuyoGameState` into the player's structures."""
+        a = self.addresses(player)
+        colors = {byte.value: i for i, byte in Puyo.INT_TO_COLOR.items()}
+
+        grid = bytearray(PuyoGrid.size)
+        for x in range(6):
+            for y in range(12):
+                index = (x + 1) + (14 - y) * 8
+                grid[index * Puyo.size] = colors[state.board[x][y]]
+        self.image.write("absolute", a["grid"], bytes(grid))
+
+        def pair_bytes(a_byte, b_byte):
+            data = bytearray(2 * Puyo.size)
+            data[0] = colors[a_byte]
+            data[Puyo.size] = colors[b_byte]
+            return bytes(data)
+
+        queue = list(state.queue) + [b'..'] * (3 - len(state.queue))
+        board_fields = Board._fields_dict()
+        struct2_fields = Struct2._fields_dict()
+        self.image.write("absolute", a["board"] + board_fields["current_puyo_pair"].offset,
+                         pair_bytes(queue[0][0:1], queue[0][1:2]))
+        # The queue is stored in the opposite order to the current pair
+        self.image.write("absolute", a["struct2"] + struct2_fields["next_puyo_pair"].offset,
+                         pair_bytes(queue[1][1:2], queue[1][0:1]))
+        self.image.write("absolute", a["struct2"] + struct2_fields["next_next_puyo_pair"].offset,
+                         pair_bytes(queue[2][1:2], queue[2][0:1]))
+
+        x, y = state.current_position or (2, 11)
+        self.image.write("absolute", a["board"] + board_fields["current_x"].offset, bytes([x + 1]))
+        self.image.write("absolute", a["board"] + board_fields["current_y"].offset, bytes([14 - y]))
+        self.write_frame_counter(player, frame_counter)
+
+    def write_frame_counter(self, player:int, frame_counter:int):
+        offset = PlayerGameState._fields_dict()["frame_counter"].offset
+        self.image.write("absolute", self.addresses(player)["player"] + offset,
+                         struct.pack("<I", frame_counter))
+
+    def _write_field(self, address:int, struct_cls, field_name:str, value:int):
+        offset = struct_cls._fields_dict()[field_name].offset
+        self.image.write_pointer("absolute", address + offset, value)
@@ -0,0 +1,244 @@
+"""
+Compile moves into button inputs for PPT2's Puyo mode.
+
+A move is made from spawn by rotating the pair and shifting it sideways, then
+dropping it. A rotation and a shift can be input at the same time, by holding
+the direction while clicking the rotation button, so a move takes as many
+input steps as the larger of its rotations and shifts rather than their sum.
+
+Each candidate input sequence for a move is timed against the botbase's sleep
+settings, and the quickest that `ptai.puyo.reachability` says gets there on
+the current board is used. `PLACEMENTS` holds the result for every placement
+on an empty board.
+"""
+import json
+import os
+from dataclasses import asdict, dataclass, fields
+from itertools import zip_longest
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ptai.actions import MoveAction
+from ptai.puyo import reachability
+from ptai.puyo.reachability import SPAWN_X, WIDTH
+
+OPEN_HEIGHTS = (0,) * WIDTH
+
+# Timing profile loaded by default, written by the `calibrate` command
+TIMING_PROFILE = os.environ.get("PTAI_TIMING", "ppt2_timing.json")
+
+
+def console_profile(console:str, path:str=None) -> str:
+    """Path of the timing profile for one console, named like "usb:1-4".
+
+    It sits beside the default profile, `path` or `TIMING_PROFILE`, with the
+    console's name added, like "ppt2_timing.usb-1-4.json".
+    """
+    root, ext = os.path.splitext(path or TIMING_PROFILE)
+    return f"{root}.{console.replace(':', '-')}{ext}"
+
+ROTATE_RIGHT = "A"
+ROTATE_LEFT = "B"
+SHIFT_RIGHT = "DRIGHT"
+SHIFT_LEFT = "DLEFT"
+DROP = "DUP"
+
+BUTTON_INPUTS = {
+    ROTATE_RIGHT: reachability.CW,
+    ROTATE_LEFT: reachability.CCW,
+    SHIFT_RIGHT: reachability.RIGHT,
+    SHIFT_LEFT: reachability.LEFT,
+}
+INPUT_BUTTONS = {input: button for button, input in BUTTON_INPUTS.items()}
+
+# Rotation buttons to reach each orientation from spawn. A turns the pair
+# clockwise and B counterclockwise.
+ROTATIONS = {
+    0: [()],
+    1: [(ROTATE_RIGHT,)],
+    2: [(ROTATE_RIGHT, ROTATE_RIGHT), (ROTATE_LEFT, ROTATE_LEFT)],
+    3: [(ROTATE_LEFT,)],
+}
+
+
+class UnreachableMove(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Timing:
+    """Botbase sleep settings, in milliseconds.
+
+    The defaults were tuned by hand. `ptai.ppt2.calibrate` finds the fastest
+    reliable input settings (`click_ms` and `loop_ms`) for a console and
+    saves them as a profile, which interfaces load from `TIMING_PROFILE` if
+    it exists. With several consoles attached, each can have its own
+    profile (see `console_profile()`). `read_ms` and `idle_ms` don't affect
+    whether inputs land, so they're kept as given. Calibration also measures
+    `peek_ms`, which interfaces use to estimate their input latency.
+    """
+    # `buttonClickSleepTime`: how long a click holds its button
+    click_ms: int = 20
+    # `mainLoopSleepTime` while making a move
+    loop_ms: int = 20
+    # `mainLoopSleepTime` while reading state
+    read_ms: int = 0
+    # `mainLoopSleepTime` the rest of the time
+    idle_ms: int = 8
+    # Measured round-trip time of a small peek, or 0 if not measured
+    peek_ms: float = 0.0
+
+    def input_latency(self) -> Optional[float]:
+        """Seconds from sending the slowest move on an open board until its
+        inputs are done, or None if `peek_ms` hasn't been measured."""
+        if not self.peek_ms:
+            return None
+        longest = max(sequence.duration(self) for sequence in PLACEMENTS.values())
+        return (self.peek_ms + longest) / 1000
+
+    def save(self, path:str):
+        with open(path, "w") as f:
+            json.dump(asdict(self), f, indent=2)
+            f.write("\n")
+
+    @classmethod
+    def load(cls, path:str=None) -> "Timing":
+        """Load a saved profile, or the defaults if there isn't one."""
+        path = path or TIMING_PROFILE
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            values = json.load(f)
+        names = {field.name for field in fields(cls)}
+        return cls(**{name: value for name, value in values.items() if name in names})
+
+    @classmethod
+    def load_console(cls, console:str, path:str=None) -> "Timing":
+        """Load the profile for one console, or the default profile if the
+        console hasn't been calibrated on its own."""
+        console_path = console_profile(console, path)
+        if os.path.exists(console_path):
+            return cls.load(console_path)
+        return cls.load(path)
+
+
+@dataclass(frozen=True)
+class InputStep:
+    """Buttons pressed together for one click.
+
+    The first button is clicked. Any others are held down around the click.
+    """
+    buttons: Tuple[str, ...]
+
+    def commands(self) -> List[Tuple[str, str]]:
+        held = self.buttons[1:]
+        return (
+            [("press", button) for button in held] +
+            [("click", self.buttons[0])] +
+            [("release", button) for button in held]
+        )
+
+
+@dataclass(frozen=True)
+class InputSequence:
+    steps: Tuple[InputStep, ...]
+
+    def commands(self) -> List[Tuple[str, str]]:
+        return [command for step in self.steps for command in step.commands()]
+
+    def duration(self, timing:Timing) -> int:
+        """Estimated milliseconds for the botbase to input the sequence."""
+        commands = self.commands()
+        n_clicks = sum(1 for kind, _ in commands if kind == "click")
+        return len(commands) * timing.loop_ms + n_clicks * timing.click_ms
+
+    def send(self, switch):
+        for kind, button in self.commands():
+            if kind == "click":
+                switch.press_button(button)
+            elif kind == "press":
+                switch.hold_button(button)
+            else:
+                switch.release_button(button)
+
+
+def pivot_x(move:MoveAction) -> int:
+    """Column of the pivot puyo, the one the pair rotates around."""
+    # Orientation 3 has the second puyo on the left, and `x` is the leftmost
+    # column of the pair.
+    return move.x + 1 if move.orientation == 3 else move.x
+
+def _game_inputs(steps:Sequence[InputStep]) -> List[str]:
+    """Reachability inputs in the order the game sees them."""
+    # Held buttons go down before the click
+    return [
+        BUTTON_INPUTS[button]
+        for step in steps
+        for button in step.buttons[1:] + step.buttons[:1]
+    ]
+
+def candidate_sequences(move:MoveAction,
+                        heights:Optional[Sequence[int]]=None
+                        ) -> List[InputSequence]:
+    """Every input sequence that makes the move on a board with `heights`.
+
+    `heights` are the board's column heights, or None for an open board.
+    """
+    if heights is None:
+        heights = OPEN_HEIGHTS
+    target = (move.orientation, move.x)
+    shortest = reachability.reachable(heights).get(target)
+    if shortest is None:
+        raise UnreachableMove(f"{move} can't be reached")
+
+    delta = pivot_x(move) - SPAWN_X
+    shifts = [SHIFT_RIGHT if delta > 0 else SHIFT_LEFT] * abs(delta)
+    drop = (InputStep((DROP,)),) if move.fast_down else ()
+
+    # The shortest path found by `reachability` always works, and might go
+    # around obstacles in a way the orderings below don't.
+    orderings = [[InputStep((INPUT_BUTTONS[input],)) for input in shortest]]
+    for rotations in ROTATIONS[move.orientation]:
+        # One click per input, alternating rotations and shifts
+        orderings.append([
+            InputStep((button,))
+            for pair in zip_longest(rotations, shifts)
+            for button in pair if button is not None
+        ])
+        # Rotations clicked while the direction is held
+        orderings.append([
+            InputStep(tuple(button for button in pair if button is not None))
+            for pair in zip_longest(rotations, shifts)
+        ])
+
+    return [
+        InputSequence(tuple(steps) + drop)
+        for steps in orderings
+        if reachability.follow(heights, _game_inputs(steps)) == target
+    ]
+
+def compile_move(move:MoveAction,
+                 timing:Timing=Timing(),
+                 heights:Optional[Sequence[int]]=None) -> InputSequence:
+    """Return the quickest input sequence for a move.
+
+    Ties go to the sequence with fewer steps, since that's fewer frames of
+    input for the game. Raises `UnreachableMove` if the move can't be made
+    on a board with the given column `heights`.
+    """
+    return min(
+        candidate_sequences(move, heights),
+        key=lambda sequence: (sequence.duration(timing), len(sequence.steps)),
+    )
+
+
+def _all_placements() -> Dict[Tuple[int, int], InputSequence]:
+    placements = {}
+    for orientation in range(4):
+        for x in range(WIDTH - orientation % 2):
+            move = MoveAction(b'', orientation, x)
+            placements[(orientation, x)] = compile_move(move)
+    return placements
+
+# Input sequence for each `(orientation, x)`, on an open board with the
+# default timing.
+PLACEMENTS = _all_placements()
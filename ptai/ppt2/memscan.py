@@ -0,0 +1,272 @@
+"""
+Search the Switch's memory for values, to find new game structures.
+
+This works like Cheat Engine. A first scan reads a whole address range and
+keeps every address holding a value, or matching a byte pattern. If the value
+isn't known yet, the first scan just takes a snapshot. Each following scan
+re-reads only the remaining candidates and keeps the ones that match a
+condition, like "equal to 12" or "increased", so a few passes in between
+changes in the game usually narrow millions of addresses down to a handful.
+
+Ranges are read with peeks as large as `CHUNKS_PER_PEEK` USB chunks, several
+peeks per round-trip, and searched with numpy. Scan results are saved to an
+npz file between passes.
+"""
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import numpy
+
+from ptai.ppt2.switch import Switch
+
+# Each peek reads up to this many of the transport's chunks
+CHUNKS_PER_PEEK = 8
+# Peeks sent per round-trip
+PEEKS_PER_BATCH = 4
+# Candidates closer than this are read with one peek
+MAX_GAP = 256
+
+TYPES = {
+    "u8": "u1", "u16": "<u2", "u32": "<u4", "u64": "<u8",
+    "i8": "i1", "i16": "<i2", "i32": "<i4", "i64": "<i8",
+    "f32": "<f4", "f64": "<f8",
+}
+CONDITIONS = ("equal", "changed", "unchanged", "increased", "decreased")
+
+
+@dataclass
+class ScanResult:
+    """Candidate addresses and the value last read at each.
+
+    If `snapshot` is set, no value has been searched for yet, and every
+    aligned address in the snapshot is a candidate.
+    """
+    segment: str
+    dtype: numpy.dtype
+    align: int
+    addresses: numpy.ndarray
+    values: numpy.ndarray
+    n_passes: int = 1
+    start: int = 0
+    snapshot: Optional[numpy.ndarray] = None
+
+    def __len__(self):
+        if self.snapshot is not None:
+            return (len(self.snapshot) - self.dtype.itemsize) // self.align + 1
+        return len(self.addresses)
+
+    def save(self, path:str):
+        # Saved through a file object so numpy doesn't add ".npz" to the name
+        with open(path, "wb") as f:
+            self._save(f)
+
+    def _save(self, f):
+        numpy.savez(
+            f,
+            segment=self.segment,
+            dtype=self.dtype.str,
+            align=self.align,
+            addresses=self.addresses,
+            values=self.values,
+            n_passes=self.n_passes,
+            start=self.start,
+            snapshot=self.snapshot if self.snapshot is not None else numpy.zeros(0, "u1"),
+            has_snapshot=self.snapshot is not None,
+        )
+
+    @classmethod
+    def load(cls, path:str) -> "ScanResult":
+        with numpy.load(path) as data:
+            return cls(
+                segment=str(data["segment"]),
+                dtype=numpy.dtype(str(data["dtype"])),
+                align=int(data["align"]),
+                addresses=data["addresses"],
+                values=data["values"],
+                n_passes=int(data["n_passes"]),
+                start=int(data["start"]),
+                snapshot=data["snapshot"] if data["has_snapshot"] else None,
+            )
+
+
+def peek_size(switch:Switch) -> int:
+    return switch.transport.MAX_CHUNK_SIZE * CHUNKS_PER_PEEK
+
+def read_runs(switch:Switch,
+              segment:str,
+              runs:List[Tuple[int, int]]) -> Iterator[Tuple[int, bytes]]:
+    """Read each `(address, size)` run, yielding `(address, data)` in order.
+
+    Runs larger than one peek are split, and peeks are sent
+    `PEEKS_PER_BATCH` at a time.
+    """
+    max_size = peek_size(switch)
+    requests = [
+        (segment, address + offset, min(max_size, size - offset))
+        for address, size in runs
+        for offset in range(0, size, max_size)
+    ]
+    for i in range(0, len(requests), PEEKS_PER_BATCH):
+        batch = requests[i:i+PEEKS_PER_BATCH]
+        for (_, address, _), data in zip(batch, switch.peek_many(batch)):
+            yield address, data
+
+def read_range(switch:Switch, segment:str, start:int, size:int) -> numpy.ndarray:
+    data = numpy.empty(size, dtype="u1")
+    for address, chunk in read_runs(switch, segment, [(start, size)]):
+        data[address-start : address-start+len(chunk)] = numpy.frombuffer(chunk, "u1")
+    return data
+
+def aligned_values(data:numpy.ndarray, dtype:numpy.dtype, align:int
+                   ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Return `(offsets, values)` of every aligned value in a byte array."""
+    size = dtype.itemsize
+    offsets = numpy.arange(0, len(data) - size + 1, align, dtype="i8")
+    if size % align != 0:
+        # Copy out each value's bytes, then reinterpret them as the type
+        windows = numpy.lib.stride_tricks.as_strided(
+            data,
+            shape=(len(offsets), size),
+            strides=(align * data.strides[0], data.strides[0]),
+            writeable=False,
+        )
+        return offsets, numpy.ascontiguousarray(windows).view(dtype).reshape(-1)
+
+    # Values starting at the same offset modulo `size` can be viewed directly
+    # as an array of the type, so interleave those views.
+    values = numpy.empty(len(offsets), dtype=dtype)
+    ratio = size // align
+    for k in range(ratio):
+        phase = k * align
+        n = (len(data) - phase) // size
+        dest = values[k::ratio]
+        dest[:] = data[phase:phase + n*size].view(dtype)[:len(dest)]
+    return offsets, values
+
+def values_at(data:numpy.ndarray, offsets:numpy.ndarray, dtype:numpy.dtype) -> numpy.ndarray:
+    """Return the values at the given offsets into a byte array."""
+    indexes = offsets[:, None] + numpy.arange(dtype.itemsize)
+    return numpy.ascontiguousarray(data[indexes]).view(dtype).reshape(-1)
+
+def parse_pattern(text:str) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Parse hex bytes like "01 ?? ff" into `(pattern, mask)`.
+
+    "??" matches any byte.
+    """
+    pattern = []
+    mask = []
+    for byte in text.split():
+        if byte == "??":
+            pattern.append(0)
+            mask.append(False)
+        else:
+            pattern.append(int(byte, 16))
+            mask.append(True)
+    return numpy.array(pattern, dtype="u1"), numpy.array(mask, dtype=bool)
+
+def find_pattern(data:numpy.ndarray, pattern:numpy.ndarray, mask:numpy.ndarray,
+                 align:int=1) -> numpy.ndarray:
+    """Return the offsets in `data` where the pattern matches."""
+    offsets = numpy.arange(0, len(data) - len(pattern) + 1, align, dtype="i8")
+    # Narrow down by one pattern byte at a time, so most offsets are
+    # eliminated by the first few bytes.
+    for i in numpy.flatnonzero(mask):
+        offsets = offsets[data[offsets + i] == pattern[i]]
+    return offsets
+
+def scan_range(switch:Switch,
+               segment:str,
+               start:int,
+               size:int,
+               dtype:numpy.dtype,
+               value=None,
+               pattern:Optional[str]=None,
+               align:Optional[int]=None) -> ScanResult:
+    """First scan of a range, for a value, a pattern, or neither.
+
+    With neither, a snapshot is kept for the next scan to compare against.
+    """
+    align = align or dtype.itemsize
+    data = read_range(switch, segment, start, size)
+
+    if value is None and pattern is None:
+        empty = numpy.zeros(0, dtype="u8")
+        return ScanResult(segment, dtype, align, empty, empty.astype(dtype),
+                          start=start, snapshot=data)
+
+    if pattern is not None:
+        pattern_bytes, mask = parse_pattern(pattern)
+        offsets = find_pattern(data, pattern_bytes, mask, align)
+        offsets = offsets[offsets + dtype.itemsize <= len(data)]
+        values = values_at(data, offsets, dtype)
+    else:
+        offsets, values = aligned_values(data, dtype, align)
+        matches = values == numpy.array(value, dtype=dtype)
+        offsets, values = offsets[matches], values[matches]
+
+    return ScanResult(segment, dtype, align, (offsets + start).astype("u8"), values)
+
+def read_values(switch:Switch, segment:str, addresses:numpy.ndarray,
+                dtype:numpy.dtype) -> numpy.ndarray:
+    """Read the value at each of a sorted array of addresses."""
+    if len(addresses) == 0:
+        return numpy.zeros(0, dtype=dtype)
+    addresses = addresses.astype("i8")
+    # Group addresses close together into runs read with one peek
+    breaks = numpy.flatnonzero(numpy.diff(addresses) > MAX_GAP) + 1
+    run_starts = addresses[numpy.concatenate(([0], breaks))]
+    run_ends = addresses[numpy.concatenate((breaks - 1, [len(addresses) - 1]))] + dtype.itemsize
+    runs = list(zip(run_starts.tolist(), (run_ends - run_starts).tolist()))
+
+    base = int(run_starts[0])
+    memory = numpy.zeros(int(run_ends[-1]) - base, dtype="u1")
+    for address, data in read_runs(switch, segment, runs):
+        memory[address-base : address-base+len(data)] = numpy.frombuffer(data, "u1")
+
+    return values_at(memory, addresses - base, dtype)
+
+def narrow(switch:Switch, result:ScanResult, condition:str, value=None) -> ScanResult:
+    """Re-read candidates and keep those where `condition` holds.
+
+    `condition` is one of `CONDITIONS`. "equal" compares with `value`, and
+    the others compare with the value read by the previous scan.
+    """
+    assert condition in CONDITIONS, f"Invalid condition: {condition}"
+    dtype = result.dtype
+    if result.snapshot is not None:
+        offsets, previous = aligned_values(result.snapshot, dtype, result.align)
+        addresses = (offsets + result.start).astype("u8")
+        current = aligned_values(
+            read_range(switch, result.segment, result.start, len(result.snapshot)),
+            dtype, result.align,
+        )[1]
+    else:
+        addresses = result.addresses
+        previous = result.values
+        current = read_values(switch, result.segment, addresses, dtype)
+
+    if condition == "equal":
+        keep = current == numpy.array(value, dtype=dtype)
+    elif condition == "changed":
+        keep = current != previous
+    elif condition == "unchanged":
+        keep = current == previous
+    elif condition == "increased":
+        keep = current > previous
+    else:
+        keep = current < previous
+
+    return ScanResult(
+        result.segment, dtype, result.align,
+        addresses[keep], current[keep],
+        n_passes=result.n_passes + 1,
+    )
+
+def format_result(result:ScanResult, n:int=20) -> str:
+    lines = [f"{len(result)} candidates after {result.n_passes} passes"]
+    if result.snapshot is None:
+        for address, value in zip(result.addresses[:n], result.values[:n]):
+            lines.append(f"{result.segment}:0x{int(address):08x}  {value}")
+        if len(result) > n:
+            lines.append(f"... and {len(result) - n} more")
+    return "\n".join(lines)
@@ -1,29 +1,112 @@
-from typing import Optional
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 
 from ptai.actions import Action, PressButtonAction, MoveAction
 from ptai.gamestate import GameState
 from ptai.gameinterface import GameInterface
+from ptai.puyo import reachability
 from ptai.ppt2.switch import Switch
-from ptai.ppt2.switchtypes import Pointer
-from ptai.ppt2.puyotypes import MainStruct
+from ptai.ppt2.asyncswitch import AsyncSwitch
+from ptai.ppt2.inputs import Timing, UnreachableMove, compile_move
+from ptai.ppt2.switchtypes import Pointer, StructPointer
+from ptai.ppt2.puyotypes import (
+    MainStruct, PlayerGameState, Board, Struct1, Struct2, Struct3,
+    VisiblePuyoGrid, PuyoGridPointer, get_grid_pointer, make_game_state,
+)
 
 MAIN_POINTER = 0x1625840
+N_PLAYERS = 4
+PLAYER_FIELDS = [f"player{i}" for i in range(N_PLAYERS)]
+# Fields of `PlayerGameState` read on every poll: the frame counter, and the
+# pointers the cache is checked against.
+PLAYER_POLL_FIELDS = ["frame_counter", "struct2", "board"]
+# Times a poll resolves pointers again before giving up, since they can keep
+# changing for a few frames while a match starts.
+MAX_POINTER_RESOLVES = 3
+
+
+def _decode_fields(struct_cls, field_names, data:bytes):
+    """Decode the bytes read for `StructPointer.fields_peek(field_names)`."""
+    offset, _ = struct_cls.field_range(field_names)
+    return struct_cls.from_partial_bytes(data, offset)
+
+
+def _decode_frame_counter(data:bytes) -> int:
+    return _decode_fields(PlayerGameState, PLAYER_POLL_FIELDS, data)["frame_counter"].value
+
+def _pointers_changed() -> RuntimeError:
+    return RuntimeError(
+        f"Pointers changed on {MAX_POINTER_RESOLVES} polls in a row, "
+        "is a match starting?"
+    )
+
+
+@dataclass
+class PlayerPointers:
+    """Resolved addresses of the structures read on every poll.
+
+    None of these change during a match, so they're resolved once and reused
+    until `check()` shows a new match has started.
+    """
+    main_struct: StructPointer
+    player: StructPointer
+    board: StructPointer
+    struct2: StructPointer
+
+    # The grid is reached through `Board.struct1`, which is checked on every
+    # poll since the board is read anyway.
+    struct1: Optional[int] = None
+    grid: Optional[PuyoGridPointer] = None
+
+    # Frame counter at the last poll
+    frame_counter: Optional[int] = None
+
+    def check(self, player_data:bytes) -> bool:
+        """Check the `PLAYER_POLL_FIELDS` read on a poll against the cache.
+
+        A new match may put `PlayerGameState` back at the same address, so
+        its board and Struct2 pointers are compared too, and the frame
+        counter going backwards also means a new match.
+        """
+        player = _decode_fields(PlayerGameState, PLAYER_POLL_FIELDS, player_data)
+        frame_counter = player["frame_counter"].value
+        valid = (
+            player["board"].value == self.board.value and
+            player["struct2"].value == self.struct2.value and
+            (self.frame_counter is None or frame_counter >= self.frame_counter)
+        )
+        self.frame_counter = frame_counter
+        return valid
 
 
 class PPT2PuyoInterface(GameInterface):
 
-    def __init__(self, player:int=0, switch:Switch=None):
+    def __init__(self, player:int=0, switch:Switch=None, timing:Timing=None):
         self.player = player
         if switch is None:
             self.switch = Switch()
         else:
             self.switch = switch
 
-        self.switch.send_command("configure buttonClickSleepTime 20")
-        self.switch.set_sleep_time(8)
+        self.set_timing(timing or Timing.load())
         self._prev_queue:Optional[tuple] = None
         self._queue_changed = True
         self._expected_pair = None
+        self._main_struct:Optional[StructPointer] = None
+        self._pointers:Optional[PlayerPointers] = None
+        # Pointers for every player, used by `get_states()`
+        self._all_pointers:Dict[int, PlayerPointers] = {}
+        # Column heights of the last board read, for planning moves around
+        self._heights:Optional[tuple] = None
+
+    def set_timing(self, timing:Timing):
+        self.timing = timing
+        self.switch.configure("buttonClickSleepTime", timing.click_ms)
+        self.switch.set_sleep_time(timing.idle_ms)
+
+    def input_latency(self) -> Optional[float]:
+        return self.timing.input_latency()
 
     def perform_action(self, action:Action):
         if isinstance(action, PressButtonAction):
@@ -34,13 +117,9 @@ class PPT2PuyoInterface(GameInterface):
             raise NotImplementedError(f"Interface does not support action f{action}")
 
     def get_state(self) -> GameState:
-        self.switch.set_sleep_time(0)
+        self.switch.set_sleep_time(self.timing.read_ms)
 
-        pointer = Pointer(MAIN_POINTER, "main")
-        main_pointer = pointer.deref(self.switch, MainStruct.pointer_t)
-        player_pointer = main_pointer.deref_field(self.switch, f"player{self.player}")
-        player = player_pointer.deref(self.switch)
-        state = player.get_game_state(self.switch)
+        state = self._read_game_state()
 
         # Detect changes in the next puyo queue since the last new turn
         queue = tuple(state.queue)
@@ -75,50 +154,359 @@ class PPT2PuyoInterface(GameInterface):
         if state.queue[0] == b'..':
             state.queue.pop(0)
 
-        self.switch.set_sleep_time(8)
+        self._heights = reachability.column_heights(state.board)
+        # Written now, so the botbase idles while the AI thinks
+        self.switch.set_sleep_time(self.timing.idle_ms)
+        self.switch.flush()
         return state
 
+    def get_states(self) -> Dict[int, GameState]:
+        """Return the game state of every active player, keyed by player.
+
+        Unlike `get_state()`, states aren't checked for new turns. All players
+        are read together: each level of structures is read for every player
+        in a single round-trip, and players whose pointer is null are skipped.
+        Once pointers are cached this takes two round-trips, however many
+        players there are.
+        """
+        switch = self.switch
+        main_struct = self._main_struct_pointer()
+        players = main_struct.deref_fields(switch, PLAYER_FIELDS)
+        active = {
+            i: players[name] for i, name in enumerate(PLAYER_FIELDS)
+            if players[name].value != 0
+        }
+
+        cache = self._all_pointers
+        for i in list(cache):
+            if i not in active or cache[i].player.value != active[i].value:
+                del cache[i]
+        unresolved = [i for i in active if i not in cache]
+        if unresolved:
+            results = switch.peek_many([
+                active[i].fields_peek(["struct2", "board"]) for i in unresolved
+            ])
+            for i, data in zip(unresolved, results):
+                player = _decode_fields(PlayerGameState, ["struct2", "board"], data)
+                cache[i] = PlayerPointers(
+                    main_struct=main_struct,
+                    player=active[i],
+                    board=player["board"],
+                    struct2=player["struct2"],
+                )
+
+        # Read each board and Struct2, along with each grid from its cached
+        # address if there is one.
+        order = sorted(active)
+        requests = []
+        for i in order:
+            pointers = cache[i]
+            requests.append((pointers.board.segment, pointers.board.value, Board.size))
+            requests.append((pointers.struct2.segment, pointers.struct2.value, Struct2.size))
+            if pointers.grid is not None:
+                visible = pointers.grid.visible()
+                requests.append((visible.segment, visible.value, VisiblePuyoGrid.size))
+        results = iter(switch.peek_many(requests))
+        boards = {}
+        struct2s = {}
+        grids = {}
+        for i in order:
+            boards[i] = Board.from_bytes(next(results))
+            struct2s[i] = Struct2.from_bytes(next(results))
+            if cache[i].grid is not None:
+                grid_data = next(results)
+                if boards[i]["struct1"].value == cache[i].struct1:
+                    grids[i] = VisiblePuyoGrid.from_bytes(grid_data)
+
+        moved = [i for i in order if i not in grids]
+        if moved:
+            grids.update(self._resolve_grids({i: boards[i] for i in moved}))
+
+        return {
+            i: make_game_state(boards[i], grids[i], struct2s[i])
+            for i in order
+        }
+
+    def _resolve_grids(self, boards:Dict[int, Board]) -> Dict[int, VisiblePuyoGrid]:
+        """Follow the grid pointers of several boards, one level at a time."""
+        switch = self.switch
+        order = list(boards)
+        struct1s = [boards[i]["struct1"] for i in order]
+        struct3s = [
+            _decode_fields(Struct1, ["struct3"], data)["struct3"]
+            for data in switch.peek_many([p.fields_peek(["struct3"]) for p in struct1s])
+        ]
+        grid_pointers: List[PuyoGridPointer] = [
+            _decode_fields(Struct3, ["puyo_grid"], data)["puyo_grid"]
+            for data in switch.peek_many([p.fields_peek(["puyo_grid"]) for p in struct3s])
+        ]
+        visible = [grid.visible() for grid in grid_pointers]
+        results = switch.peek_many([
+            (pointer.segment, pointer.value, VisiblePuyoGrid.size)
+            for pointer in visible
+        ])
+        grids = {}
+        for i, struct1, grid, data in zip(order, struct1s, grid_pointers, results):
+            self._all_pointers[i].struct1 = struct1.value
+            self._all_pointers[i].grid = grid
+            grids[i] = VisiblePuyoGrid.from_bytes(data)
+        return grids
+
+    def invalidate_pointers(self):
+        """Forget cached pointers, so they're resolved again on the next poll."""
+        self._pointers = None
+        self._main_struct = None
+        self._all_pointers = {}
+
+    def _main_struct_pointer(self) -> StructPointer:
+        # `MainStruct` lives for as long as the game is running
+        if self._main_struct is None:
+            pointer = Pointer(MAIN_POINTER, "main")
+            self._main_struct = pointer.deref(self.switch, MainStruct.pointer_t)
+        return self._main_struct
+
+    def _resolve_pointers(self) -> PlayerPointers:
+        main_pointer = self._main_struct_pointer()
+        player_pointer = main_pointer.deref_field(self.switch, f"player{self.player}")
+        player = player_pointer.deref(self.switch)
+        return PlayerPointers(
+            main_struct=main_pointer,
+            player=player_pointer,
+            board=player["board"],
+            struct2=player["struct2"],
+        )
+
+    def _read_game_state(self):
+        # Cached pointers are checked by the same round-trip that uses them,
+        # see `_poll()`. If they're stale, like when a new match starts, they
+        # are resolved again and the poll retried.
+        for _ in range(MAX_POINTER_RESOLVES):
+            if self._pointers is None:
+                self._pointers = self._resolve_pointers()
+            state = self._poll(self._pointers)
+            if state is not None:
+                return state
+            self._pointers = None
+        raise _pointers_changed()
+
+    def _poll(self, pointers:PlayerPointers) -> Optional[GameState]:
+        """Read the state, or return None if `pointers` are stale."""
+        return self._decode_poll(pointers, self.switch.peek_many(self._poll_peeks(pointers)))
+
+    def _poll_peeks(self, pointers:PlayerPointers) -> List[Tuple[str, int, int]]:
+        """Every read of a poll, which are independent so share a round-trip.
+
+        They are the player pointer in `MainStruct` and the player's
+        `PLAYER_POLL_FIELDS`, which check the cache, the board, Struct2 and,
+        once its address is known, the visible grid. The grid is read
+        speculatively, and read again in the rare case that the board shows
+        it has moved.
+        """
+        player_field = MainStruct._fields_dict()[f"player{self.player}"]
+        peeks = [
+            (
+                pointers.main_struct.segment,
+                pointers.main_struct.value + player_field.offset,
+                player_field.type.size,
+            ),
+            pointers.player.fields_peek(PLAYER_POLL_FIELDS),
+            (pointers.board.segment, pointers.board.value, Board.size),
+            (pointers.struct2.segment, pointers.struct2.value, Struct2.size),
+        ]
+        if pointers.grid is not None:
+            visible = pointers.grid.visible()
+            peeks.append((visible.segment, visible.value, VisiblePuyoGrid.size))
+        return peeks
+
+    def _decode_poll(self, pointers:PlayerPointers,
+                     results:List[bytes]) -> Optional[GameState]:
+        """Make the state from the reads of `_poll_peeks()`, or return None
+        if they show the pointers are stale."""
+        player_field = MainStruct._fields_dict()[f"player{self.player}"]
+        player_pointer = player_field.type.from_bytes(results[0])
+        if player_pointer.value == 0 or \
+                player_pointer.value != pointers.player.value or \
+                not pointers.check(results[1]):
+            return None
+
+        board = Board.from_bytes(results[2])
+        struct2 = Struct2.from_bytes(results[3])
+        struct1 = board["struct1"].value
+        if pointers.grid is None or struct1 != pointers.struct1:
+            pointers.grid = get_grid_pointer(self.switch, board)
+            pointers.struct1 = struct1
+            # Only the rows on screen are read
+            grid = pointers.grid.visible().deref(self.switch)
+        else:
+            grid = VisiblePuyoGrid.from_bytes(results[4])
+        return make_game_state(board, grid, struct2, _decode_frame_counter(results[1]))
+
     def perform_move(self, move:MoveAction):
-        delta_x = move.x - 2
-
-        # Rotation
-        if move.orientation == 0:
-            rotation_key = None
-            rotation_count = 0
-        elif move.orientation == 1:
-            rotation_key = "A"
-            rotation_count = 1
-        elif move.orientation == 2:
-            rotation_key = "A"
-            rotation_count = 2
-        elif move.orientation == 3:
-            rotation_key = "B"
-            rotation_count = 1
-
-            # Since rotation point is the bottom bean, this effectively moves
-            # the piece to the left.
-            delta_x += 1
-
-        # Direction
-        direction_count = abs(delta_x)
-        direction_key = "DRIGHT" if delta_x > 0 else "DLEFT"
-
-        # Press buttons, alternating between rotation and direction
-        self.switch.set_sleep_time(20)
-        for _ in range(3):
-            if rotation_count > 0:
-                self.switch.press_button(rotation_key)
-                rotation_count -= 1
-
-            if direction_count > 0:
-                self.switch.press_button(direction_key)
-                direction_count -= 1
-
-        #TODO: Double check that we moved correctly by calling get_state()
-        #      before doing fast down.
-
-        # Fast down
-        if move.fast_down:
-            self.switch.press_button("DUP")
-
-        self.switch.set_sleep_time(8)
+        try:
+            sequence = compile_move(move, self.timing, self._heights)
+        except UnreachableMove:
+            # The board read last may be out of date, so try anyway
+            sequence = compile_move(move, self.timing)
+
+        # The presses don't need replies, so they're written as one batch.
+        # The piece's height is peeked at the front of it for the fall rate,
+        # and the reply read once the inputs are on their way.
+        self.fall_sample = None
+        pointers = self._pointers
+        with self.switch.batch():
+            if pointers is not None:
+                self.switch.queue_peeks([
+                    pointers.player.fields_peek(["frame_counter"]),
+                    pointers.board.fields_peek(["current_y"]),
+                ])
+            self.switch.set_sleep_time(self.timing.loop_ms)
+            sequence.send(self.switch)
+
+            self.switch.set_sleep_time(self.timing.idle_ms)
+            if pointers is not None:
+                player_data, board_data = self.switch.read_replies(2)
+                frame = _decode_fields(
+                    PlayerGameState, ["frame_counter"], player_data)["frame_counter"].value
+                raw_y = _decode_fields(Board, ["current_y"], board_data)["current_y"].value
+                self.fall_sample = (frame, 14 - raw_y)
+
+
+class AsyncPPT2PuyoInterface(PPT2PuyoInterface):
+    """Like `PPT2PuyoInterface`, but polls through an `AsyncSwitch`.
+
+    A poll's reads are submitted to the switch together, so they share a
+    single round-trip with each other, and with any other peeks submitted
+    at the same time, like those of `read_game_state_async()` for another
+    player.
+    """
+
+    def __init__(self, player:int=0, switch:Optional[AsyncSwitch]=None,
+                 timing:Timing=None):
+        super().__init__(player, switch or AsyncSwitch(), timing)
+        self._loop = asyncio.new_event_loop()
+
+    def close(self):
+        """Stop the switch's I/O thread and close the event loop."""
+        self.switch.close()
+        if not self._loop.is_closed():
+            self._loop.close()
+
+    def _read_game_state(self):
+        return self._loop.run_until_complete(self.read_game_state_async())
+
+    async def read_game_state_async(self):
+        for _ in range(MAX_POINTER_RESOLVES):
+            if self._pointers is None:
+                self._pointers = self._resolve_pointers()
+            pointers = self._pointers
+            results = await asyncio.gather(*(
+                self.switch.peek_async(*peek) for peek in self._poll_peeks(pointers)
+            ))
+            state = self._decode_poll(pointers, list(results))
+            if state is not None:
+                return state
+            self._pointers = None
+        raise _pointers_changed()
+
+
+class ProbingPPT2PuyoInterface(PPT2PuyoInterface):
+    """Like `PPT2PuyoInterface`, but only reads the grid when a turn changes.
+
+    Each poll reads a small probe in one round-trip: the player pointer check,
+    the frame counter, the falling pair and its position, and the queue. The
+    grid only changes at turn boundaries, so it's only read when the probe
+    shows one: the falling pair or queue changing, the pair returning to its
+    start position, or the frame counter going backwards. Otherwise the grid
+    from the last read is reused. As a safeguard the grid is also read at
+    least every `max_probes` polls.
+    """
+    BOARD_PROBE_FIELDS = ("current_puyo_pair", "current_x", "current_y")
+    STRUCT2_PROBE_FIELDS = ("next_puyo_pair", "next_next_puyo_pair")
+
+    max_probes = 60
+
+    def __init__(self, player:int=0, switch:Switch=None, timing:Timing=None):
+        super().__init__(player, switch, timing)
+        self._grid:Optional[VisiblePuyoGrid] = None
+        self._last_probe:Optional[tuple] = None
+        self._frame_counter = 0
+        self._probes_since_grid = 0
+        self.n_probes = 0
+        self.n_grid_reads = 0
+
+    def invalidate_pointers(self):
+        super().invalidate_pointers()
+        self._grid = None
+
+    def _poll(self, pointers:PlayerPointers) -> Optional[GameState]:
+        player_field = MainStruct._fields_dict()[f"player{self.player}"]
+        results = self.switch.peek_many([
+            (
+                pointers.main_struct.segment,
+                pointers.main_struct.value + player_field.offset,
+                player_field.type.size,
+            ),
+            pointers.player.fields_peek(PLAYER_POLL_FIELDS),
+            pointers.board.fields_peek(self.BOARD_PROBE_FIELDS),
+            pointers.struct2.fields_peek(self.STRUCT2_PROBE_FIELDS),
+        ])
+        self.n_probes += 1
+
+        player_pointer = player_field.type.from_bytes(results[0])
+        if player_pointer.value == 0 or \
+                player_pointer.value != pointers.player.value or \
+                not pointers.check(results[1]):
+            self._grid = None
+            return None
+
+        frame_counter = _decode_frame_counter(results[1])
+        board = _decode_fields(Board, self.BOARD_PROBE_FIELDS, results[2])
+        struct2 = _decode_fields(Struct2, self.STRUCT2_PROBE_FIELDS, results[3])
+
+        probe = tuple(
+            struct[name][i].byte
+            for struct, names in (
+                (board, ["current_puyo_pair"]),
+                (struct2, self.STRUCT2_PROBE_FIELDS),
+            )
+            for name in names
+            for i in range(2)
+        )
+        position = (board["current_x"].value, board["current_y"].value)
+        at_start = position == (3, 3)
+        last_probe, last_at_start = self._last_probe or (None, False)
+        if (
+            self._grid is None or
+            probe != last_probe or
+            (at_start and not last_at_start) or
+            frame_counter < self._frame_counter or
+            self._probes_since_grid >= self.max_probes
+        ):
+            self._grid = self._read_grid()
+            self._probes_since_grid = 0
+        else:
+            self._probes_since_grid += 1
+        self._last_probe = (probe, at_start)
+        self._frame_counter = frame_counter
+
+        return make_game_state(board, self._grid, struct2, frame_counter)
+
+    def _read_grid(self) -> VisiblePuyoGrid:
+        self.n_grid_reads += 1
+        pointers = self._pointers
+        if pointers.grid is not None:
+            # Read the grid at its cached address, checking that it hasn't
+            # moved in the same round-trip.
+            visible = pointers.grid.visible()
+            board_data, grid_data = self.switch.peek_many([
+                pointers.board.fields_peek(["struct1"]),
+                (visible.segment, visible.value, VisiblePuyoGrid.size),
+            ])
+            board = _decode_fields(Board, ["struct1"], board_data)
+            if board["struct1"].value == pointers.struct1:
+                return VisiblePuyoGrid.from_bytes(grid_data)
+
+        board = pointers.board.deref_fields(self.switch, ["struct1"])
+        pointers.grid = get_grid_pointer(self.switch, board)
+        pointers.struct1 = board["struct1"].value
+        return pointers.grid.visible().deref(self.switch)
@@ -2,10 +2,13 @@
 Memory structures for Puyo Puyo Tetris 2 pertaining to Puyo.
 """
 from enum import Enum
+from typing import Optional
 
 import numpy
 
-from ptai.ppt2.switchtypes import SwitchType, Struct, AbstractArray, make_array_t, UInt32, UInt8
+from ptai.ppt2.switchtypes import (
+    SwitchType, Struct, AbstractArray, ArrayPointer, make_array_t, UInt32, UInt8,
+)
 
 
 class PUYO(Enum):
@@ -26,7 +29,9 @@ class Puyo(SwitchType):
     Consists of 4 bytes. First is the puyo color. The next 3 bytes are unknown,
     but they are zero in list of next puyos and set to values in the puyo grid.
     """
+    __slots__ = ("color", "raw_bytes")
     size = 4
+    dtype = numpy.dtype([("color", "u1"), ("extra", "u1", (3,))])
 
     INT_TO_COLOR = {
         0: PUYO.BLANK,
@@ -60,6 +65,55 @@ class Puyo(SwitchType):
         return self.color.value
 
 
+# Maps a puyo's color byte to the byte used in game states
+COLOR_TO_BYTE = numpy.full(256, PUYO.UNKNOWN.value, dtype="|S1")
+for _value, _color in Puyo.INT_TO_COLOR.items():
+    COLOR_TO_BYTE[_value] = _color.value
+
+GRID_WIDTH = 8
+GRID_HEIGHT = 15
+# Rows above the screen, at the start of the grid
+HIDDEN_ROWS = 3
+
+
+def visible_byte_array(colors:numpy.ndarray):
+    """Return the board, with origin at bottom left, from visible rows.
+
+    `colors` is the color byte of each puyo in the visible rows, in grid order.
+    """
+    rows = colors.reshape(GRID_HEIGHT - HIDDEN_ROWS, GRID_WIDTH)
+    # Visible columns, flipped so the first row is the bottom, then
+    # transposed to be indexed by [x][y].
+    return COLOR_TO_BYTE[rows[::-1, 1:7].T]
+
+
+class PuyoGridPointer(ArrayPointer):
+    __slots__ = ()
+
+    def visible(self):
+        """Pointer to just the visible rows of the grid."""
+        return VisiblePuyoGrid.pointer_t(
+            self.value + HIDDEN_ROWS * GRID_WIDTH * Puyo.size,
+            self.segment,
+        )
+
+    def deref_rows(self, switch, rows):
+        """Read the colors of the visible columns of `rows`.
+
+        Rows are numbered from the top of the grid, including the hidden rows.
+        Only the color byte of each puyo is read, in one round-trip. Returns an
+        array of bytes like `PUYO.RED.value` with one row per row read.
+        """
+        indexes = [row*GRID_WIDTH + x for row in rows for x in range(1, 7)]
+        data = self.deref_strided(
+            switch, indexes, size=1,
+            # Merge into one peek per group of adjacent rows
+            max_gap=3*Puyo.size,
+        )
+        colors = numpy.frombuffer(b''.join(data), dtype="u1")
+        return COLOR_TO_BYTE[colors].reshape(len(rows), 6)
+
+
 class PuyoGrid(AbstractArray):
     """
     A grid of puyos making up the game board.
@@ -70,8 +124,10 @@ class PuyoGrid(AbstractArray):
      * 4 bytes of extra data on both the left and right of each row.
      * 3 rows above the viewable screen.
     """
+    __slots__ = ()
+    pointer_class = PuyoGridPointer
     base_type_cls = Puyo
-    count = 8*15
+    count = GRID_WIDTH * GRID_HEIGHT
     size = count * Puyo.size
 
     def __str__(self):
@@ -94,25 +150,41 @@ class PuyoGrid(AbstractArray):
 
     def get_byte_array(self):
         """Return byte array with origin at bottom left."""
-        return numpy.array([
-            [self[x + y*8].byte for y in range(14, 2, -1)]
-            for x in range(1, 7)
-        ], dtype="|S1")
+        if self.array is None:
+            colors = numpy.array([puyo.raw_bytes[0] for puyo in self.objects], dtype="u1")
+        else:
+            colors = self.array["color"]
+        return visible_byte_array(colors[HIDDEN_ROWS*GRID_WIDTH:])
+
+
+class VisiblePuyoGrid(AbstractArray):
+    """The rows of a `PuyoGrid` which are shown on screen."""
+    __slots__ = ()
+    base_type_cls = Puyo
+    count = GRID_WIDTH * (GRID_HEIGHT - HIDDEN_ROWS)
+    size = count * Puyo.size
+
+    def get_byte_array(self):
+        """Return byte array with origin at bottom left."""
+        return visible_byte_array(self.array["color"])
 
 
 class Struct3(Struct):
+    __slots__ = ()
     fields = (
         Struct.Field(name="puyo_grid", type=PuyoGrid.pointer_t, offset=0x58),
     )
 
 
 class Struct1(Struct):
+    __slots__ = ()
     fields = (
         Struct.Field(name="struct3", type=Struct3.pointer_t, offset=0x88),
     )
 
 
 class Board(Struct):
+    __slots__ = ()
     fields = (
         Struct.Field(name="struct1", type=Struct1.pointer_t, offset=0x18),
         Struct.Field(name="current_puyo_pair", type=make_array_t(Puyo, 2), offset=0xA8),
@@ -131,6 +203,7 @@ class Board(Struct):
 
 
 class Struct2(Struct):
+    __slots__ = ()
     fields = (
         Struct.Field(name="next_puyo_pair", type=make_array_t(Puyo, 2), offset=0xB4),
         Struct.Field(name="next_next_puyo_pair", type=make_array_t(Puyo, 2), offset=0xEC),
@@ -216,6 +289,7 @@ class PlayerGameState(Struct):
         * Current pair = Old next pair
         * Current position = (2, 11)
     """
+    __slots__ = ()
     fields = (
         Struct.Field(name="frame_counter", type=UInt32, offset=0x6C),
         Struct.Field(name="struct2", type=Struct2.pointer_t, offset=0x98),
@@ -225,31 +299,40 @@ class PlayerGameState(Struct):
 
     def get_game_state(self, switch):
         board = self["board"].deref(switch)
-        grid_pointer = board["struct1"].deref_field(
-            switch, "struct3"
-        ).deref_field(
-            switch, "puyo_grid"
-        )
-        grid = grid_pointer.deref(switch)
+        grid = get_grid_pointer(switch, board).visible().deref(switch)
         struct2 = self["struct2"].deref(switch)
+        return make_game_state(board, grid, struct2)
 
-        from ptai.puyo.gamestate import PuyoGameState
-        return PuyoGameState(
-            grid.get_byte_array(),
-            [
-                board["current_puyo_pair"][0].byte + board["current_puyo_pair"][1].byte,
-                struct2["next_puyo_pair"][1].byte + struct2["next_puyo_pair"][0].byte,
-                struct2["next_next_puyo_pair"][1].byte + struct2["next_next_puyo_pair"][0].byte,
-            ],
-            current_position=(
-                # Convert to bottom left origin, without padding.
-                board["current_x"].value - 1,
-                14 - board["current_y"].value
-            ),
-        )
+
+def get_grid_pointer(switch, board:Board):
+    """Follow the pointers from a `Board` to its `PuyoGrid`."""
+    return board["struct1"].deref_field(
+        switch, "struct3"
+    ).deref_field(
+        switch, "puyo_grid"
+    )
+
+def make_game_state(board:Board, grid:PuyoGrid, struct2:Struct2,
+                    frame_counter:Optional[int]=None):
+    from ptai.puyo.gamestate import PuyoGameState
+    return PuyoGameState(
+        grid.get_byte_array(),
+        [
+            board["current_puyo_pair"][0].byte + board["current_puyo_pair"][1].byte,
+            struct2["next_puyo_pair"][1].byte + struct2["next_puyo_pair"][0].byte,
+            struct2["next_next_puyo_pair"][1].byte + struct2["next_next_puyo_pair"][0].byte,
+        ],
+        current_position=(
+            # Convert to bottom left origin, without padding.
+            board["current_x"].value - 1,
+            14 - board["current_y"].value
+        ),
+        frame=frame_counter,
+    )
 
 
 class MainStruct(Struct):
+    __slots__ = ()
     fields = (
         # These will be null pointers if no game is being played
         Struct.Field(name="player0", type=PlayerGameState.pointer_t, offset=0x208),
@@ -1,8 +1,7 @@
 import struct
 import time
-from typing import List
-
-import usb
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
 
 
 class SwitchDeviceNotFound(Exception):
@@ -21,12 +20,52 @@ def wait_for_connection() -> "Switch":
             time.sleep(5)
 
 
-class Switch:
+def find_switches(vendor_id=0x057E, product_id=0x3000,
+                  name:Optional[str]=None) -> List["Switch"]:
+    """Connect to every attached USB-Botbase device, or only the one called
+    `name` (see `device_name()`)."""
+    transports = UsbTransport.find_all(vendor_id, product_id, name)
+    if not transports:
+        raise SwitchDeviceNotFound()
+    return [Switch(transport=transport) for transport in transports]
 
-    def __init__(self, vendor_id=0x057E, product_id=0x3000):
-        self.usb_dev = usb.core.find(idVendor=vendor_id, idProduct=product_id)
-        if self.usb_dev is None:
-            raise SwitchDeviceNotFound()
+def switch_names(vendor_id=0x057E, product_id=0x3000) -> List[str]:
+    """Names of every attached USB-Botbase device, without connecting."""
+    return [device_name(usb_dev) for usb_dev in _find_devices(vendor_id, product_id)]
+
+def device_name(usb_dev) -> str:
+    """Name for where a device is plugged in, like "usb:1-4.2".
+
+    It's made of the bus and the chain of hub ports, like the device's name
+    in Linux sysfs, so it stays the same when the device is reconnected to
+    the same port, unlike its address.
+    """
+    ports = getattr(usb_dev, "port_numbers", None)
+    if not ports:
+        # Not every backend reports ports
+        return f"usb:{usb_dev.bus}-addr{usb_dev.address}"
+    return f"usb:{usb_dev.bus}-{'.'.join(str(port) for port in ports)}"
+
+def _find_devices(vendor_id:int, product_id:int) -> list:
+    import usb.core
+
+    usb_devs = usb.core.find(find_all=True, idVendor=vendor_id, idProduct=product_id)
+    return sorted(usb_devs, key=lambda dev: (dev.bus, dev.address))
+
+
+class UsbTransport:
+    """The pair of bulk endpoints used to talk to USB-Botbase.
+
+    pyusb is imported when a device is opened, so switches with other
+    transports, like `FakeBotbase`, work without it.
+    """
+
+    MAX_CHUNK_SIZE = 4080
+
+    def __init__(self, usb_dev):
+        import usb.util
+
+        self.usb_dev = usb_dev
 
         # Set active config to first one found
         self.usb_dev.set_configuration()
@@ -44,10 +83,141 @@ class Switch:
             custom_match=lambda e: usb.util.endpoint_direction(e.bEndpointAddress) == usb.util.ENDPOINT_IN
         )
 
-    def send_command(self, command):
+    @classmethod
+    def find(cls, vendor_id:int, product_id:int) -> "UsbTransport":
+        import usb.core
+
+        usb_dev = usb.core.find(idVendor=vendor_id, idProduct=product_id)
+        if usb_dev is None:
+            raise SwitchDeviceNotFound()
+        return cls(usb_dev)
+
+    @classmethod
+    def find_all(cls, vendor_id:int, product_id:int,
+                 name:Optional[str]=None) -> List["UsbTransport"]:
+        """Every attached device with the given ids, in bus order.
+
+        If `name` is given, only the device with that `device_name()` is
+        opened, leaving the others alone.
+        """
+        usb_devs = _find_devices(vendor_id, product_id)
+        if name is not None:
+            usb_devs = [usb_dev for usb_dev in usb_devs if device_name(usb_dev) == name]
+        return [cls(usb_dev) for usb_dev in usb_devs]
+
+    @property
+    def name(self) -> str:
+        """Where the device is plugged in, like "usb:1-4.2"."""
+        return device_name(self.usb_dev)
+
+    def write(self, data:bytes):
+        self.usb_out.write(data)
+
+    def read(self, size:int) -> bytes:
+        return self.usb_in.read(size, timeout=0).tobytes()
+
+
+class Switch:
+    """Client for USB-Botbase.
+
+    Commands are framed as a 4 byte length followed by the command text, and
+    each frame is written to USB in a single transfer. To cut down on USB
+    round-trips further:
+
+     * `configure` commands are tracked, and not sent at all if they wouldn't
+       change the botbase's configuration. Configuration changes are also
+       deferred until the next command is sent, or `flush()` is called, so a
+       change that's undone before then costs nothing. Call `flush()` after
+       a change that should take effect with nothing sent after it.
+     * Inside a `batch()` block, commands that don't return anything (button
+       presses, pokes) are queued and written together in one transfer when
+       the block exits, or when a command that needs a reply is sent.
+
+    Both rely on the botbase reading commands from the USB stream by their
+    length prefix. If a botbase build needs each frame in its own transfer,
+    set `coalesce_writes` to False.
+    """
+
+    coalesce_writes = True
+
+    def __init__(self, vendor_id=0x057E, product_id=0x3000, transport=None):
+        if transport is None:
+            transport = UsbTransport.find(vendor_id, product_id)
+        self.transport = transport
+
+        # Configuration values the botbase has been sent.
+        self._config: Dict[str, str] = {}
+        # Commands waiting to be written, in order. Configuration changes are
+        # queued as ("configure", name, value) and commands as
+        # ("command", text, None).
+        self._queue: List[Tuple[str, str, Optional[str]]] = []
+        self._batch_depth = 0
+
+    def send_command(self, command:str):
         #print(command)
-        self.usb_out.write(struct.pack("<I", (len(command)+2)))
-        self.usb_out.write(command)
+        if command.startswith("configure "):
+            _, name, value = command.split(" ", 2)
+            self.configure(name, value)
+            return
+        self._queue.append(("command", command, None))
+        if not self._batch_depth:
+            self.flush()
+
+    def configure(self, name:str, value):
+        """Queue a `configure` command, to be sent with the next command or
+        `flush()`."""
+        self._queue.append(("configure", name, str(value)))
+
+    @contextmanager
+    def batch(self):
+        """Queue commands inside this block, writing them together at the end."""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+
+    def flush(self):
+        """Write all queued commands and configuration changes.
+
+        Of several changes to the same setting with no command between them,
+        only the last is sent, and only if it differs from what the botbase
+        already has.
+        """
+        frames: List[bytes] = []
+        pending_config: Dict[str, str] = {}
+
+        def write_config():
+            for name, config_value in pending_config.items():
+                if self._config.get(name) != config_value:
+                    frames.append(self._encode(f"configure {name} {config_value}"))
+                    self._config[name] = config_value
+            pending_config.clear()
+
+        for kind, name_or_command, value in self._queue:
+            if kind == "configure":
+                pending_config[name_or_command] = value
+                continue
+            write_config()
+            frames.append(self._encode(name_or_command))
+        write_config()
+
+        self._queue = []
+        if not frames:
+            return
+        if self.coalesce_writes:
+            self.transport.write(b''.join(frames))
+        else:
+            for frame in frames:
+                self.transport.write(frame[:4])
+                self.transport.write(frame[4:])
+
+    @staticmethod
+    def _encode(command:str) -> bytes:
+        data = command.encode()
+        return struct.pack("<I", len(data)+2) + data
 
     def set_sleep_time(self, milliseconds:int):
         """Milliseconds for switch USB-Botbase to sleep after a command.
@@ -60,7 +230,7 @@ class Switch:
 
         Default (in USB-Botbase) is 50.
         """
-        self.send_command(f"configure mainLoopSleepTime {milliseconds}")
+        self.configure("mainLoopSleepTime", milliseconds)
 
     def press_button(self, button):
         self.send_command(f"click {button}")
@@ -72,6 +242,38 @@ class Switch:
         self.send_command(f"release {button}")
 
     def peek(self, segment, address, size):
+        # Peeks need a reply, so are always sent right away along with
+        # anything queued before them.
+        self._queue_peek(segment, address, size)
+        self.flush()
+        return self._read()
+
+    def peek_many(self, requests:List[Tuple[str, int, int]]) -> List[bytes]:
+        """Peek several `(segment, address, size)` ranges in one round-trip.
+
+        All of the peek commands are written together, then the replies are
+        read back in order.
+        """
+        for segment, address, size in requests:
+            self._queue_peek(segment, address, size)
+        self.flush()
+        return [self._read() for _ in requests]
+
+    def queue_peeks(self, requests:List[Tuple[str, int, int]]):
+        """Queue peeks without waiting for their replies.
+
+        The peeks are written with whatever is sent next. Their replies must
+        then be read, in order, with `read_replies()` before any other peek.
+        """
+        for segment, address, size in requests:
+            self._queue_peek(segment, address, size)
+
+    def read_replies(self, n:int) -> List[bytes]:
+        """Write anything queued, then read the replies of `n` queued peeks."""
+        self.flush()
+        return [self._read() for _ in range(n)]
+
+    def _queue_peek(self, segment, address, size):
         peek_commands = {
             "absolute": "peekAbsolute",
             "main": "peekMain",
@@ -79,8 +281,7 @@ class Switch:
         }
         assert segment in peek_commands, f"Invalid segment: {segment}"
         command = peek_commands[segment]
-        self.send_command(f"{command} {hex(address)} {int(size)}")
-        return self._read()
+        self._queue.append(("command", f"{command} {hex(address)} {int(size)}", None))
 
     def poke(self, segment, address, data):
         poke_commands = {
@@ -94,14 +295,14 @@ class Switch:
 
     def _read(self):
         # Read size of incomming data
-        size = int(struct.unpack("<L", self.usb_in.read(4, timeout=0).tobytes())[0])
+        size = int(struct.unpack("<L", self.transport.read(4))[0])
 
         # Read data in chunks
         chunks: List[bytes] = []
-        MAX_CHUNK_SIZE = 4080
+        MAX_CHUNK_SIZE = self.transport.MAX_CHUNK_SIZE
         while size > 0:
             chunk_size = min(MAX_CHUNK_SIZE, size)
-            chunk = self.usb_in.read(chunk_size, timeout=0).tobytes()
+            chunk = self.transport.read(chunk_size)
             chunks.append(chunk)
             size -= chunk_size
 
@@ -3,12 +3,15 @@ A framework for declaring memory types and structures in the nintendo switch's
 memory space. This allows us to build a map of a program's memory space similar
 to making a c-style header file.
 """
-from typing import Optional, Iterable, Tuple, Type
+import struct
+from typing import Callable, Dict, List, Optional, Iterable, Sequence, Tuple, Type, Union
 from copy import copy
 from collections import OrderedDict
 from textwrap import indent
 from dataclasses import dataclass
 
+import numpy
+
 from ptai.ppt2.switch import Switch
 
 STRUCT_INDENT = "|     "
@@ -40,7 +43,11 @@ class SwitchType:
     takes. A types constructor can take any set of parameters, but the
     `from_bytes()` method must be implemented to convert a bytestring of the
     correct size to an instance of the type.
+
+    Types are decoded many times per poll, so subclasses should declare
+    `__slots__`.
     """
+    __slots__ = ()
 
     # Size in bytes of this type.
     # Must be defined statically by concrete classes, either as a normal class
@@ -51,6 +58,10 @@ class SwitchType:
     # `pointer_t` class attribute.
     pointer_class:Optional["Pointer"] = None
 
+    # Numpy dtype with the same layout as this type, if it has a fixed layout.
+    # Arrays of types with a dtype are decoded with `numpy.frombuffer()`.
+    dtype:Optional[numpy.dtype] = None
+
     @classmethod
     def from_bytes(self, data: bytes) -> "SwitchType":
         """Return an instance of this type given a bytestring of its size."""
@@ -62,12 +73,12 @@ class SwitchType:
     @classproperty
     def pointer_t(cls):  # pylint: disable=no-self-argument
         """A Pointer type class which points to this type."""
-        if not hasattr(cls, "_pointer_t"):
+        if "_pointer_t" not in cls.__dict__:
             pointer_class = cls.pointer_class or Pointer
             cls._pointer_t = type(
                 cls.__name__+"Pointer",
                 (pointer_class,),
-                {"dest_type": cls}
+                {"dest_type": cls, "__slots__": ()}
             )
         return cls._pointer_t
 
@@ -87,6 +98,7 @@ class AbstractInt(SwitchType):
 
     Subclasses need only specify `size` and `signed` class attributes.
     """
+    __slots__ = ("value",)
     signed:bool
 
     def __init__(self, value:int):
@@ -109,21 +121,35 @@ class AbstractInt(SwitchType):
         value = int.from_bytes(data, byteorder="little", signed=cls.signed)
         return cls(value)
 
+    @classproperty
+    def struct_format(cls):  # pylint: disable=no-self-argument
+        """Format for the `struct` module, used to decode struct fields."""
+        code = {1: "b", 2: "h", 4: "i", 8: "q"}[cls.size]
+        return "<" + (code if cls.signed else code.upper())
+
 class UInt8(AbstractInt):
+    __slots__ = ()
     signed = False
     size = 1
+    dtype = numpy.dtype("u1")
 
 class UInt16(AbstractInt):
+    __slots__ = ()
     signed = False
     size = 2
+    dtype = numpy.dtype("<u2")
 
 class UInt32(AbstractInt):
+    __slots__ = ()
     signed = False
     size = 4
+    dtype = numpy.dtype("<u4")
 
 class UInt64(AbstractInt):
+    __slots__ = ()
     signed = False
     size = 8
+    dtype = numpy.dtype("<u8")
 
 
 class Pointer(UInt64):
@@ -146,6 +172,7 @@ class Pointer(UInt64):
     memory. Doing so changes the variant of the peek command used when
     dereferencing.
     """
+    __slots__ = ("segment",)
     dest_type: Optional[SwitchType] = None
 
     def __init__(self, value:int, segment="absolute"):
@@ -159,7 +186,7 @@ class Pointer(UInt64):
     def format_reachable_data(self, switch:Switch):
         if self.value == 0 or self.dest_type is None:
             return str(self)
-        return self.deref(switch).format_reachable_data(switch)
+        return _format_pointee(self, switch)
 
     @classmethod
     def from_bytes(cls, data) -> "Pointer":
@@ -189,6 +216,83 @@ class Pointer(UInt64):
 ##### Arrays #####
 ##################
 
+class ArrayPointer(Pointer):
+    """Pointer to an array, which can also point into the array.
+
+    Indexing gives a pointer to one element, and slicing gives a pointer to a
+    contiguous sub-array, so part of an array can be read without reading
+    the whole thing:
+
+        ptr[3].deref(switch)       # One element
+        ptr[8:16].deref(switch)    # An array of 8 elements
+
+    `deref_strided()` reads a set of elements, or just part of each element,
+    in one round-trip.
+    """
+    __slots__ = ()
+    dest_type:"AbstractArray"
+
+    def __getitem__(self, index:Union[int, slice]) -> Pointer:
+        array_t = self.dest_type
+        base_type_cls = array_t.base_type_cls
+        if isinstance(index, slice):
+            start, stop, step = index.indices(array_t.count)
+            if step != 1:
+                raise ValueError("Use deref_strided() to read non-contiguous elements")
+            dest_type = make_array_t(base_type_cls, max(stop - start, 0))
+        else:
+            if index < 0:
+                index += array_t.count
+            if not 0 <= index < array_t.count:
+                raise IndexError("array index out of range")
+            start = index
+            dest_type = base_type_cls
+        return dest_type.pointer_t(self.value + start * base_type_cls.size, self.segment)
+
+    def deref_strided(self,
+                      switch:Switch,
+                      indexes:Sequence[int],
+                      offset:int=0,
+                      size:Optional[int]=None,
+                      max_gap:int=0) -> List[bytes]:
+        """Read `size` bytes at `offset` into each of the elements `indexes`.
+
+        By default whole elements are read. Ranges separated by `max_gap`
+        bytes or less are merged into one peek, trading a few extra bytes for
+        fewer replies. All peeks are sent in one round-trip. Returns the bytes
+        for each index, in the order given.
+        """
+        if self.segment == "absolute" and self.value == 0:
+            raise RuntimeError("Null pointer dereference")
+        item_size = self.dest_type.base_type_cls.size
+        if size is None:
+            size = item_size - offset
+        assert 0 <= offset and offset + size <= item_size
+
+        # Merge into runs of [start, end), remembering which run each
+        # element's range is in.
+        runs: List[List[int]] = []
+        run_indexes: Dict[int, int] = {}
+        for start in sorted({index * item_size + offset for index in indexes}):
+            if runs and start - runs[-1][1] <= max_gap:
+                runs[-1][1] = start + size
+            else:
+                runs.append([start, start + size])
+            run_indexes[start] = len(runs) - 1
+
+        results = switch.peek_many([
+            (self.segment, self.value + start, end - start)
+            for start, end in runs
+        ])
+        items = []
+        for index in indexes:
+            start = index * item_size + offset
+            run = run_indexes[start]
+            relative = start - runs[run][0]
+            items.append(results[run][relative : relative + size])
+        return items
+
+
 class AbstractArray(SwitchType):
     """An array of `base_type_cls` types.
 
@@ -199,17 +303,53 @@ class AbstractArray(SwitchType):
     `make_array_t()` helper function. If you choose to do things manually,
     concrete subclasses must specify `base_type_cls`, `count`, and `size`, and
     the size must be set to `base_type_cls.size * count`.
+
+    When `base_type_cls` has a `dtype`, `from_bytes()` doesn't decode any
+    elements. Instead, `array` is a numpy view of the data, and elements are
+    only decoded when they're accessed.
+
+    Pointers to arrays are `ArrayPointer`s, which can read part of an array.
     """
-    #TODO: Make a pointer class for arrays so you can dereference just one (or
-    #      more than one) items of the array).
+    __slots__ = ("_objects", "data", "array")
+    pointer_class = ArrayPointer
     base_type_cls:SwitchType
     count:int
 
     def __init__(self, objects:Iterable[SwitchType]):
-        self.objects = list(objects)
+        self._objects:Optional[list] = list(objects)
+        self.data:Optional[bytes] = None
+        self.array:Optional[numpy.ndarray] = None
 
-    def __getitem__(self, index:int):
-        return self.objects[index]
+    @classproperty
+    def dtype(cls):  # pylint: disable=no-self-argument
+        base_dtype = getattr(cls, "base_type_cls", None) and cls.base_type_cls.dtype
+        if base_dtype is None:
+            return None
+        return numpy.dtype((base_dtype, (cls.count,)))
+
+    @property
+    def objects(self) -> list:
+        if self._objects is None:
+            self._objects = [self[i] for i in range(self.count)]
+        return self._objects
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index:Union[int, slice]):
+        if self._objects is not None:
+            return self._objects[index]
+        if isinstance(index, slice):
+            # A list, like slicing `objects`
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("array index out of range")
+        item_size = self.base_type_cls.size
+        return self.base_type_cls.from_bytes(
+            self.data[index*item_size : (index+1)*item_size]
+        )
 
     def format_reachable_data(self, switch:Switch):
         formatted_strs = (
@@ -222,6 +362,14 @@ class AbstractArray(SwitchType):
     def from_bytes(cls, data:bytes) -> "AbstractArray":
         assert len(data) == cls.count * cls.base_type_cls.size
 
+        base_dtype = cls.base_type_cls.dtype
+        if base_dtype is not None:
+            array = cls.__new__(cls)
+            array._objects = None
+            array.data = bytes(data)
+            array.array = numpy.frombuffer(array.data, dtype=base_dtype, count=cls.count)
+            return array
+
         objects = []
         for i in range(cls.count):
             obj = cls.base_type_cls.from_bytes(
@@ -231,11 +379,20 @@ class AbstractArray(SwitchType):
 
         return cls(objects)
 
+_array_types: Dict[Tuple[type, int], type] = {}
+
 def make_array_t(base_type_cls:Type[SwitchType], count:int):
+    key = (base_type_cls, count)
+    if key not in _array_types:
+        _array_types[key] = _make_array_t(base_type_cls, count)
+    return _array_types[key]
+
+def _make_array_t(base_type_cls:Type[SwitchType], count:int):
     return type(
         f"{base_type_cls.__name__}Array",
         (AbstractArray,),
         dict(
+            __slots__ = (),
             base_type_cls = base_type_cls,
             count = count,
             size = base_type_cls.size * count,
@@ -248,6 +405,7 @@ def make_array_t(base_type_cls:Type[SwitchType], count:int):
 ######################
 
 class StructPointer(Pointer):
+    __slots__ = ()
     dest_type:"Struct"
 
     def deref_field(self, switch:Switch, field_name:str):
@@ -261,20 +419,28 @@ class StructPointer(Pointer):
         field_pointer = Pointer(self.value + field.offset)
         return field_pointer.deref(switch, field.type)
 
+    def fields_peek(self, field_names:Iterable[str]) -> Tuple[str, int, int]:
+        """Return the `(segment, address, size)` covering the given fields."""
+        if self.segment == "absolute" and self.value == 0:
+            raise RuntimeError("Null pointer dereference")
+        start, size = self.dest_type.field_range(field_names)
+        return (self.segment, self.value + start, size)
+
+    def deref_fields(self, switch:Switch, field_names:Iterable[str]) -> "Struct":
+        """Read only the given fields, in one peek.
+
+        The smallest range covering the fields is read. Fields outside of it
+        read as zero in the returned struct.
+        """
+        field_names = list(field_names)
+        segment, address, size = self.fields_peek(field_names)
+        data = switch.peek(segment, address, size)
+        return self.dest_type.from_partial_bytes(data, address - self.value)
+
     def format_reachable_data(self, switch:Switch) -> str:
         if self.value == 0:
             return "(null pointer)"
-        lines = [
-            #str(self)
-        ]
-        fields = self.dest_type._fields_dict()
-        for field_name in fields:
-            value = self.deref_field(switch, field_name)
-            lines.append(f"{field_name} ({value.__class__.__name__})\n"+indent(
-                value.format_reachable_data(switch),
-                STRUCT_INDENT
-            ))
-        return "\n".join(lines)
+        return _format_pointee(self, switch)
 
 @dataclass
 class StructField:
@@ -283,6 +449,12 @@ class StructField:
     offset:Optional[int] = None
 
 class Struct(SwitchType):
+    """A C-style structure of fields at fixed offsets.
+
+    Fields are decoded the first time they're accessed and cached on the
+    instance, so repeated accesses are a dictionary lookup.
+    """
+    __slots__ = ("data", "_cache")
     fields: Tuple[StructField]
     pointer_class = StructPointer
 
@@ -292,19 +464,34 @@ class Struct(SwitchType):
         # pylint: disable=comparison-with-callable
         assert len(data) == self.size
         self.data = data
+        self._cache: Dict[str, SwitchType] = {}
 
     def __getitem__(self, field_name:str) -> SwitchType:
-        return self.get_field(field_name)
+        try:
+            return self._cache[field_name]
+        except KeyError:
+            return self.get_field(field_name)
 
     def get_field(self, field_name:str) -> SwitchType:
-        field = self._fields_dict()[field_name]
-        return field.type.from_bytes(
-            self.data[field.offset : field.offset+field.type.size]
-        )
+        value = self._cache.get(field_name)
+        if value is None:
+            value = self._decoders()[field_name](self.data)
+            self._cache[field_name] = value
+        return value
+
+    @classmethod
+    def _decoders(cls) -> Dict[str, Callable[[bytes], SwitchType]]:
+        """Return a function to decode each field from the struct's data."""
+        if "_decoders_cache" not in cls.__dict__:
+            cls._decoders_cache = {
+                name: _compile_field(field)
+                for name, field in cls._fields_dict().items()
+            }
+        return cls._decoders_cache
 
     @classmethod
     def _fields_dict(cls):
-        if not hasattr(cls, "_fields_dict_cache"):
+        if "_fields_dict_cache" not in cls.__dict__:
             cls._fields_dict_cache = OrderedDict()
             offset = 0
             for field in cls.fields:
@@ -321,16 +508,129 @@ class Struct(SwitchType):
     @classproperty
     def size(cls):  # pylint: disable=no-self-argument
         # Calculate size by finding highest byte any fields could touch
-        return max(
-            field.offset + field.type.size
-            for field in cls._fields_dict().values()
-        )
+        if "_size_cache" not in cls.__dict__:
+            cls._size_cache = max(
+                field.offset + field.type.size
+                for field in cls._fields_dict().values()
+            )
+        return cls._size_cache
+
+    @classproperty
+    def dtype(cls):  # pylint: disable=no-self-argument
+        if "_dtype_cache" not in cls.__dict__:
+            fields = list(cls._fields_dict().values())
+            if all(field.type.dtype is not None for field in fields):
+                cls._dtype_cache = numpy.dtype({
+                    "names": [field.name for field in fields],
+                    "formats": [field.type.dtype for field in fields],
+                    "offsets": [field.offset for field in fields],
+                    "itemsize": cls.size,
+                })
+            else:
+                cls._dtype_cache = None
+        return cls._dtype_cache
 
     @classmethod
     def from_bytes(cls, data:bytes):
         return cls(data)
 
+    def format_reachable_data(self, switch:Switch) -> str:
+        lines = []
+        for field_name in self._fields_dict():
+            value = self[field_name]
+            lines.append(f"{field_name} ({value.__class__.__name__})\n"+indent(
+                value.format_reachable_data(switch),
+                STRUCT_INDENT
+            ))
+        return "\n".join(lines)
+
+    @classmethod
+    def field_range(cls, field_names:Iterable[str]) -> Tuple[int, int]:
+        """Return `(offset, size)` of the bytes spanned by the given fields."""
+        fields = cls._fields_dict()
+        starts, ends = zip(*(
+            (fields[name].offset, fields[name].offset + fields[name].type.size)
+            for name in field_names
+        ))
+        return min(starts), max(ends) - min(starts)
+
+    @classmethod
+    def from_partial_bytes(cls, data:bytes, offset:int):
+        """Return an instance from `data` found at `offset` into the struct.
+
+        The rest of the struct is filled with zeros, so only fields within the
+        range given are meaningful.
+        """
+        return cls(bytes(offset) + data + bytes(cls.size - offset - len(data)))
+
     @classmethod
     def from_pointer(cls, switch:Switch, pointer:Pointer):
         data = pointer.deref_as_bytes(switch, cls.size)
         return cls(data)
+
+def _compile_field(field:StructField) -> Callable[[bytes], SwitchType]:
+    start = field.offset
+    end = field.offset + field.type.size
+    type_cls = field.type
+    if isinstance(type_cls, type) and issubclass(type_cls, AbstractInt):
+        unpack_from = struct.Struct(type_cls.struct_format).unpack_from
+        return lambda data: type_cls(unpack_from(data, start)[0])
+    return lambda data: type_cls.from_bytes(data[start:end])
+
+
+#####################
+##### Traversal #####
+#####################
+
+class ReachableReader:
+    """Wraps a `Switch` while formatting all data reachable from an object.
+
+    Use `format_reachable()` rather than creating this directly. Each object
+    is read whole, with one peek, and each address is read at most once.
+    Objects reached a second time, including through a cycle of pointers, are
+    shown as a reference instead of being formatted again.
+    """
+
+    def __init__(self, switch:Switch):
+        self.switch = switch
+        self.n_peeks = 0
+        self.n_bytes = 0
+        self._cache: Dict[Tuple[str, int, int], bytes] = {}
+        # True once an object has been formatted, False while it's in progress
+        self.visits: Dict[Tuple[str, int, type], bool] = {}
+
+    def peek(self, segment:str, address:int, size:int) -> bytes:
+        key = (segment, address, size)
+        if key not in self._cache:
+            self._cache[key] = self.switch.peek(segment, address, size)
+            self.n_peeks += 1
+            self.n_bytes += size
+        return self._cache[key]
+
+    def stats(self) -> str:
+        return f"{self.n_peeks} peeks, {self.n_bytes} bytes"
+
+
+def _format_pointee(pointer:Pointer, switch:Switch) -> str:
+    visits = getattr(switch, "visits", None)
+    if visits is None:
+        return pointer.deref(switch).format_reachable_data(switch)
+
+    key = (pointer.segment, pointer.value, pointer.dest_type)
+    if key in visits:
+        if visits[key]:
+            return f"(shown above: {pointer})"
+        return f"(cycle: {pointer})"
+    visits[key] = False
+    text = pointer.deref(switch).format_reachable_data(switch)
+    visits[key] = True
+    return text
+
+def format_reachable(obj:SwitchType, switch:Switch) -> Tuple[str, ReachableReader]:
+    """Format all data reachable from `obj`, reading each object only once.
+
+    Returns the text along with the `ReachableReader` used, which has counts
+    of the peeks and bytes read.
+    """
+    reader = ReachableReader(switch)
+    return obj.format_reachable_data(reader), reader
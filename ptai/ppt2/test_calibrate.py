@@ -0,0 +1,96 @@
+import random
+
+from ptai.actions import MoveAction
+from ptai.ai import AI
+from ptai.puyo import reachability
+from ptai.puyo.gamestate import PuyoGameState
+from ptai.ppt2.calibrate import calibrate
+from ptai.ppt2.fakebotbase import FakeBotbase, MemoryImage, PuyoMemoryLayout
+from ptai.ppt2.inputs import BUTTON_INPUTS, DROP, Timing, console_profile
+from ptai.ppt2.puyointerface import MAIN_POINTER, PPT2PuyoInterface
+from ptai.ppt2.switch import Switch
+
+PIECES = [b'rg', b'by', b'pp', b'gy', b'rb']
+
+
+class FakeConsole(FakeBotbase):
+    """Plays a solo game, misplacing pieces when inputs are too fast."""
+
+    def __init__(self, min_click_ms:int, min_loop_ms:int):
+        super().__init__(MemoryImage())
+        self.min_click_ms = min_click_ms
+        self.min_loop_ms = min_loop_ms
+        self.rng = random.Random(0)
+        self.state = PuyoGameState(queue=PIECES[:3], current_position=(2, 11))
+        self.layout = PuyoMemoryLayout(self.image, MAIN_POINTER)
+        self.layout.add_player(0)
+        self.layout.write_state(0, self.state)
+        self.inputs = []
+
+    def _handle(self, command:str):
+        super()._handle(command)
+        name, *args = command.split(" ")
+        if name in ("click", "press") and args[0] != DROP:
+            self.inputs.append(BUTTON_INPUTS[args[0]])
+        elif name == "click":
+            self._drop()
+
+    def _drop(self):
+        heights = reachability.column_heights(self.state.board)
+        placement = reachability.follow(heights, self.inputs)
+        self.inputs = []
+        too_fast = (
+            int(self.config["buttonClickSleepTime"]) < self.min_click_ms or
+            int(self.config["mainLoopSleepTime"]) < self.min_loop_ms
+        )
+        if too_fast:
+            placement = next(
+                other for other in reachability.reachable(heights)
+                if other[1] != placement[1]
+            )
+        self.state.move(MoveAction(self.state.queue[0], *placement))
+
+        # Make sure the queue changes, so the interface sees a new turn
+        piece = self.rng.choice([p for p in PIECES if p != self.state.queue[-1]])
+        self.state.queue = self.state.queue[1:] + [piece]
+        self.layout.write_state(0, self.state)
+
+
+class FlatAI(AI):
+    """Keeps the board as flat as possible, so the game lasts."""
+
+    def get_move(self, state):
+        def max_height(move):
+            after = state.copy()
+            after.move(move)
+            return max(reachability.column_heights(after.board))
+        return min(state.get_moves(), key=max_height)
+
+
+def test_calibrate(tmp_path):
+    fake = FakeConsole(min_click_ms=12, min_loop_ms=10)
+    interface = PPT2PuyoInterface(switch=Switch(transport=fake), timing=Timing())
+    timing = calibrate(interface, FlatAI(), n_moves=3, log=lambda text: None)
+    # One step slower than the fastest settings that worked
+    assert (timing.click_ms, timing.loop_ms) == (15, 12)
+    assert fake.config["buttonClickSleepTime"] == "15"
+    assert timing.peek_ms > 0
+    assert interface.input_latency() == timing.input_latency() > timing.peek_ms / 1000
+    assert Timing().input_latency() is None
+
+    path = str(tmp_path / "timing.json")
+    timing.save(path)
+    assert Timing.load(path) == timing
+    assert Timing.load(str(tmp_path / "missing.json")) == Timing()
+
+def test_console_profile(tmp_path):
+    path = str(tmp_path / "timing.json")
+    assert console_profile("usb:1-4", path) == str(tmp_path / "timing.usb-1-4.json")
+    # Consoles without their own profile use the shared one
+    shared = Timing(click_ms=15)
+    shared.save(path)
+    assert Timing.load_console("usb:1-4", path) == shared
+    own = Timing(click_ms=12)
+    own.save(console_profile("usb:1-4", path))
+    assert Timing.load_console("usb:1-4", path) == own
+    assert Timing.load_console("usb:1-5", path) == shared
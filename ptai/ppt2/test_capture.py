@@ -0,0 +1,68 @@
+import os
+
+from ptai.ppt2.capture import (
+    CaptureReader, capture, main_struct_root, read_reachable, replay_botbase,
+)
+from ptai.ppt2.fakebotbase import MemoryImage
+from ptai.ppt2.puyointerface import MAIN_POINTER, PPT2PuyoInterface
+from ptai.ppt2.switch import Switch
+from ptai.ppt2.test_fakebotbase import make_fake, make_state
+
+
+def test_read_reachable():
+    fake, layout = make_fake()
+    ranges = read_reachable(Switch(transport=fake), main_struct_root(MAIN_POINTER))
+    addresses = {address for segment, address, size in ranges}
+    assert set(layout.addresses(0).values()) <= addresses
+    assert ("main", MAIN_POINTER, 8) in ranges
+
+def test_capture_round_trip(tmp_path):
+    def frame_script(image, frame):
+        layout.write_frame_counter(0, frame)
+        state = make_state()
+        state.board[3][0] = b'rgbyp'[frame % 5:frame % 5 + 1]
+        layout.write_state(0, state, frame)
+    fake, layout = make_fake(frame_script=frame_script)
+    switch = Switch(transport=fake)
+    path = str(tmp_path / "game.cap")
+
+    # Advance the game one frame per captured frame
+    n_peeks_per_frame = len(read_reachable(switch, main_struct_root(MAIN_POINTER)))
+    fake.commands_per_frame = n_peeks_per_frame
+    fake.advance_frame()
+    assert capture(switch, path, MAIN_POINTER, n_frames=20, keyframe_interval=8) == 20
+
+    with CaptureReader(path) as reader:
+        assert len(reader) == 20
+        assert reader.is_keyframe(0) and reader.is_keyframe(8)
+        assert not reader.is_keyframe(9)
+        expected = []
+        for frame, image in reader.iter_images():
+            expected.append(image.copy())
+        for frame in (0, 5, 8, 13, 19):
+            image = reader.image_at(frame)
+            assert image.pages == expected[frame].pages
+            grid = layout.addresses(0)["grid"]
+            offset = ((3 + 1) + 14*8) * 4
+            color = image.read("absolute", grid + offset, 1)[0]
+            assert color == (frame + 1) % 5 + 1
+
+    # Deltas are much smaller than storing each frame in full
+    keyframe_size = sum(size for segment, address, size in
+        read_reachable(switch, main_struct_root(MAIN_POINTER)))
+    assert os.path.getsize(path) < 4 * keyframe_size
+
+    assert MemoryImage.load(path).pages == expected[0].pages
+
+def test_replay(tmp_path):
+    fake, layout = make_fake()
+    path = str(tmp_path / "game.cap")
+    capture(Switch(transport=fake), path, MAIN_POINTER, n_frames=3)
+
+    with replay_botbase(path) as replay:
+        interface = PPT2PuyoInterface(switch=Switch(transport=replay))
+        state = interface.get_state()
+        assert state.queue == make_state().queue
+        assert (state.board == make_state().board).all()
+    # The capture isn't left open
+    assert replay.reader._file.closed
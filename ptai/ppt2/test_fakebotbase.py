@@ -0,0 +1,238 @@
+import threading
+
+import numpy
+import pytest
+
+from ptai.actions import MoveAction
+from ptai.puyo.gamestate import PuyoGameState
+from ptai.ppt2.fakebotbase import FakeBotbase, MemoryImage, PuyoMemoryLayout
+from ptai.ppt2.inputs import Timing
+from ptai.ppt2.puyointerface import (
+    MAIN_POINTER, PPT2PuyoInterface, AsyncPPT2PuyoInterface,
+    PlayerPointers, ProbingPPT2PuyoInterface,
+)
+from ptai.ppt2.switch import Switch
+from ptai.ppt2.asyncswitch import AsyncSwitch
+from ptai.schedule import FrameBudget
+
+
+def make_state():
+    board = numpy.full((6, 12), b'.', dtype="|S1")
+    board[0][0:3] = [b'r', b'g', b'b']
+    board[5][0:2] = [b'y', b'p']
+    board[2][0] = b'k'
+    return PuyoGameState(board, [b'rg', b'by', b'pp'], current_position=(2, 11))
+
+def make_fake(**kwargs):
+    image = MemoryImage()
+    layout = PuyoMemoryLayout(image, MAIN_POINTER)
+    layout.add_player(0)
+    layout.write_state(0, make_state())
+    return FakeBotbase(image, **kwargs), layout
+
+
+def test_memory_image(tmp_path):
+    image = MemoryImage()
+    image.write("absolute", 0xFFE, b"abcd")
+    assert image.read("absolute", 0xFFC, 8) == b"\0\0abcd\0\0"
+    assert image.read("heap", 0xFFE, 4) == b"\0\0\0\0"
+
+    path = str(tmp_path / "image.json")
+    image.save(path)
+    assert MemoryImage.load(path).read("absolute", 0xFFE, 4) == b"abcd"
+
+def test_get_state():
+    fake, layout = make_fake()
+    interface = PPT2PuyoInterface(switch=Switch(transport=fake))
+
+    state = interface.get_state()
+    expected = make_state()
+    assert (state.board == expected.board).all()
+    assert state.queue == expected.queue
+    assert state.current_position == (2, 11)
+    assert state.new_turn
+
+    # Once pointers are cached, each poll is 5 peeks in one round-trip, and
+    # one more write setting the idle sleep back
+    fake.reset_stats()
+    state = interface.get_state()
+    assert fake.n_peeks == 5
+    assert fake.n_writes == 2
+    assert state.frame == 0
+
+    # A new match moves the player's structures
+    layout.remove_player(0)
+    layout.PLAYER_BASE = 0x200000
+    layout.add_player(0)
+    layout.write_state(0, make_state())
+    state = interface.get_state()
+    assert (state.board == expected.board).all()
+
+def test_structures_move():
+    for interface_cls in (PPT2PuyoInterface, ProbingPPT2PuyoInterface):
+        fake, layout = make_fake()
+        interface = interface_cls(switch=Switch(transport=fake))
+        layout.write_state(0, make_state(), frame_counter=50)
+        interface.get_state()
+
+        # A new match puts the player's structures somewhere else, but
+        # `PlayerGameState` stays at the same address.
+        addresses = layout.addresses
+        layout.addresses = lambda player: {
+            name: address if name == "player" else address + 0x8000
+            for name, address in addresses(player).items()
+        }
+        layout.add_player(0)
+        new_match = make_state()
+        new_match.board[3][0] = b'g'
+        layout.write_state(0, new_match, frame_counter=0)
+        state = interface.get_state()
+        assert (state.board == new_match.board).all()
+        assert state.frame == 0
+
+        # The new pointers are cached
+        interface.get_state()
+        fake.reset_stats()
+        interface.get_state()
+        assert fake.n_writes == 2
+
+def test_pointers_keep_changing(monkeypatch):
+    for interface_cls in (PPT2PuyoInterface, AsyncPPT2PuyoInterface,
+                          ProbingPPT2PuyoInterface):
+        fake, layout = make_fake()
+        switch_cls = AsyncSwitch if interface_cls is AsyncPPT2PuyoInterface else Switch
+        interface = interface_cls(switch=switch_cls(transport=fake))
+        interface.get_state()
+        # Every poll sees a new match starting
+        monkeypatch.setattr(PlayerPointers, "check", lambda self, data: False)
+        with pytest.raises(RuntimeError, match="Pointers changed"):
+            interface.get_state()
+        monkeypatch.undo()
+        assert interface.get_state().new_turn is False
+        interface.close()
+
+def test_async_get_state():
+    fake, layout = make_fake()
+    n_threads = threading.active_count()
+    interface = AsyncPPT2PuyoInterface(switch=AsyncSwitch(transport=fake))
+    try:
+        state = interface.get_state()
+        assert (state.board == make_state().board).all()
+        fake.reset_stats()
+        state = interface.get_state()
+        assert state.queue == make_state().queue
+        # Every read shares one round-trip, then the idle sleep is set back
+        assert fake.n_peeks == 5
+        assert fake.n_writes == 2
+    finally:
+        interface.close()
+    assert threading.active_count() == n_threads
+    assert interface._loop.is_closed()
+
+def test_frames():
+    states = []
+    def frame_script(image, frame):
+        states.append(frame)
+        layout.write_frame_counter(0, frame)
+    fake, layout = make_fake(frame_script=frame_script, commands_per_frame=2)
+    interface = PPT2PuyoInterface(switch=Switch(transport=fake))
+    interface.get_state()
+    assert fake.frame > 0
+    assert states == list(range(1, fake.frame + 1))
+
+def test_buttons():
+    fake, layout = make_fake()
+    interface = PPT2PuyoInterface(switch=Switch(transport=fake))
+    interface.perform_action(MoveAction(b'rr', 1, 0))
+    # The rotation is clicked while the first shift is held
+    assert fake.button_log == [
+        ("press", "DLEFT"), ("click", "A"), ("release", "DLEFT"),
+        ("click", "DLEFT"), ("click", "DUP"),
+    ]
+    assert fake.held_buttons == set()
+    assert fake.n_writes == 1
+    assert fake.config["buttonClickSleepTime"] == "20"
+
+def test_idle_sleep():
+    fake, layout = make_fake()
+    timing = Timing(read_ms=0, loop_ms=20, idle_ms=8)
+    interface = PPT2PuyoInterface(switch=Switch(transport=fake), timing=timing)
+    interface.get_state()
+    assert fake.config["mainLoopSleepTime"] == "8"
+    interface.perform_action(MoveAction(b'rr', 0, 0))
+    assert fake.config["mainLoopSleepTime"] == "8"
+    # Reads and inputs ran at their own sleep times
+    assert "configure mainLoopSleepTime 0" in fake.command_log
+    assert "configure mainLoopSleepTime 20" in fake.command_log
+
+def test_fall_sample():
+    fake, layout = make_fake()
+    interface = PPT2PuyoInterface(switch=Switch(transport=fake))
+    budget = FrameBudget()
+    budget.observe(interface.get_state())
+
+    # The piece fell while the AI was thinking
+    falling = make_state()
+    falling.current_position = (2, 8)
+    layout.write_state(0, falling, frame_counter=90)
+    fake.reset_stats()
+    interface.perform_action(MoveAction(b'rr', 0, 0))
+    # Sampled in the same transfer as the inputs
+    assert fake.n_writes == 1
+    assert interface.fall_sample == (90, 8)
+    budget.observe_fall(*interface.fall_sample)
+    assert budget.frames_per_row == 30
+
+def test_probing_get_state():
+    fake, layout = make_fake()
+    interface = ProbingPPT2PuyoInterface(switch=Switch(transport=fake))
+    state = interface.get_state()
+    assert state.new_turn
+    assert (state.board == make_state().board).all()
+
+    # While the pair falls, each poll is a single small read
+    falling = make_state()
+    falling.current_position = (2, 8)
+    layout.write_state(0, falling, frame_counter=10)
+    fake.reset_stats()
+    state = interface.get_state()
+    assert state.current_position == (2, 8)
+    assert state.frame == 10
+    assert not state.new_turn
+    assert fake.n_writes == 2
+    assert fake.n_bytes_peeked < 256
+    assert interface.n_grid_reads == 1
+
+    # The next turn starts with a new board and queue
+    next_turn = make_state()
+    next_turn.board[1][0] = b'g'
+    next_turn.queue = [b'by', b'pp', b'rr']
+    layout.write_state(0, next_turn, frame_counter=20)
+    state = interface.get_state()
+    assert interface.n_grid_reads == 2
+    assert state.new_turn
+    assert state.board[1][0] == b'g'
+    assert state.queue == next_turn.queue
+
+def test_get_states():
+    fake, layout = make_fake()
+    layout.add_player(1)
+    opponent = make_state()
+    opponent.board[4][0] = b'k'
+    opponent.queue = [b'yy', b'gg', b'bb']
+    layout.write_state(1, opponent)
+    interface = PPT2PuyoInterface(switch=Switch(transport=fake))
+
+    states = interface.get_states()
+    assert sorted(states) == [0, 1]
+    assert (states[0].board == make_state().board).all()
+    assert (states[1].board == opponent.board).all()
+    assert states[1].queue == opponent.queue
+
+    # Cached pointers take two round-trips for both players
+    fake.reset_stats()
+    interface.get_states()
+    assert fake.n_writes == 2
+
+    layout.remove_player(1)
+    assert sorted(interface.get_states()) == [0]
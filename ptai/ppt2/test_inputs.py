@@ -0,0 +1,62 @@
+import pytest
+
+from ptai.actions import MoveAction
+from ptai.ppt2.inputs import (
+    PLACEMENTS, InputSequence, InputStep, Timing, UnreachableMove,
+    compile_move,
+)
+
+
+def buttons(sequence:InputSequence):
+    return [step.buttons for step in sequence.steps]
+
+def test_compile_move():
+    assert buttons(compile_move(MoveAction(b'rr', 0, 2))) == [("DUP",)]
+    assert buttons(compile_move(MoveAction(b'rr', 0, 2, fast_down=False))) == []
+    # Rotations are clicked while holding the first shifts
+    assert buttons(compile_move(MoveAction(b'rr', 1, 0))) == [
+        ("A", "DLEFT"), ("DLEFT",), ("DUP",),
+    ]
+    assert buttons(compile_move(MoveAction(b'rr', 2, 3))) == [
+        ("A", "DRIGHT"), ("A",), ("DUP",),
+    ]
+    # The pivot of orientation 3 is on the right
+    assert buttons(compile_move(MoveAction(b'rr', 3, 1))) == [("B",), ("DUP",)]
+
+    # Holding costs extra commands, so slow clicks favor overlapping more
+    # than slow command loops do.
+    move = MoveAction(b'rr', 1, 3)
+    slow_clicks = compile_move(move, Timing(click_ms=50, loop_ms=5))
+    slow_loop = compile_move(move, Timing(click_ms=5, loop_ms=50))
+    assert buttons(slow_clicks) == [("A", "DRIGHT"), ("DUP",)]
+    assert buttons(slow_loop) == [("A",), ("DRIGHT",), ("DUP",)]
+    assert slow_clicks.commands() == [
+        ("press", "DRIGHT"), ("click", "A"), ("release", "DRIGHT"),
+        ("click", "DUP"),
+    ]
+
+def test_placements():
+    assert len(PLACEMENTS) == 22
+    for (orientation, x), sequence in PLACEMENTS.items():
+        # Never longer than the larger of the rotations and shifts
+        assert len(sequence.steps) <= 4
+        assert sequence.steps[-1] == InputStep(("DUP",))
+
+def test_blocked_columns():
+    heights = [0, 0, 0, 12, 0, 0]
+    # A flip rotates through the open side
+    assert buttons(compile_move(MoveAction(b'rr', 2, 2), heights=heights)) == [
+        ("B",), ("B",), ("DUP",),
+    ]
+    with pytest.raises(UnreachableMove):
+        compile_move(MoveAction(b'rr', 0, 4), heights=heights)
+    with pytest.raises(UnreachableMove):
+        compile_move(MoveAction(b'rr', 1, 2), heights=heights)
+    compile_move(MoveAction(b'rr', 0, 0), heights=heights)
+
+    # Flipped, the lower puyo can't pass a column one short of the top, but
+    # holding the direction shifts the pair before each rotation.
+    heights = [0, 0, 0, 11, 0, 0]
+    assert buttons(compile_move(MoveAction(b'rr', 2, 4), heights=heights)) == [
+        ("A", "DRIGHT"), ("A", "DRIGHT"), ("DUP",),
+    ]
@@ -0,0 +1,65 @@
+import numpy
+
+from ptai.ppt2 import memscan
+from ptai.ppt2.fakebotbase import FakeBotbase, MemoryImage
+from ptai.ppt2.switch import Switch
+
+START = 0x10000
+SIZE = 0x20000
+
+
+def make_switch():
+    rng = numpy.random.RandomState(0)
+    image = MemoryImage()
+    image.write("heap", START, rng.randint(0, 256, SIZE, dtype="u1").tobytes())
+    fake = FakeBotbase(image)
+    return Switch(transport=fake), fake
+
+def test_aligned_values():
+    data = numpy.arange(16, dtype="u1")
+    for dtype in ("u1", "<u2", "<u4", "<u8"):
+        dtype = numpy.dtype(dtype)
+        for align in (1, 2, 3, 4):
+            offsets, values = memscan.aligned_values(data, dtype, align)
+            expected = [
+                int.from_bytes(data[offset:offset+dtype.itemsize].tobytes(), "little")
+                for offset in range(0, 16 - dtype.itemsize + 1, align)
+            ]
+            assert list(offsets) == list(range(0, 16 - dtype.itemsize + 1, align))
+            assert values.tolist() == expected
+
+def test_scan_and_narrow(tmp_path):
+    switch, fake = make_switch()
+    dtype = numpy.dtype("<u4")
+    score_address = START + 0x1234
+
+    fake.image.write("heap", score_address, (1000).to_bytes(4, "little"))
+    result = memscan.scan_range(switch, "heap", START, SIZE, dtype)
+    assert result.snapshot is not None
+    # Large peeks, several per round-trip
+    assert fake.n_peeks == -(-SIZE // memscan.peek_size(switch))
+    assert fake.n_writes < fake.n_peeks
+
+    path = str(tmp_path / "scan")
+    result.save(path)
+    result = memscan.ScanResult.load(path)
+
+    fake.image.write("heap", score_address, (1500).to_bytes(4, "little"))
+    result = memscan.narrow(switch, result, "increased")
+    assert score_address in result.addresses
+    assert result.snapshot is None
+
+    fake.image.write("heap", score_address, (1700).to_bytes(4, "little"))
+    result = memscan.narrow(switch, result, "equal", 1700)
+    assert result.addresses.tolist() == [score_address]
+    assert result.values.tolist() == [1700]
+    assert result.n_passes == 3
+
+def test_pattern():
+    switch, fake = make_switch()
+    fake.image.write("heap", START + 0x100, bytes([0xde, 0xad, 0x42, 0xbe, 0xef]))
+    result = memscan.scan_range(
+        switch, "heap", START, SIZE, numpy.dtype("u1"), pattern="de ad ?? be ef"
+    )
+    assert START + 0x100 in result.addresses
+    assert result.values[result.addresses.tolist().index(START + 0x100)] == 0xde
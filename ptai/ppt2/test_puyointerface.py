@@ -1,3 +1,4 @@
+import struct
 from typing import List, Tuple
 
 from ptai.actions import MoveAction
@@ -5,23 +6,43 @@ from .puyointerface import PPT2PuyoInterface
 from ptai.ppt2.switch import Switch
 
 
+class MockTransport:
+    MAX_CHUNK_SIZE = 4080
+
+    def __init__(self):
+        self.writes: List[bytes] = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+
 class MockSwitch(Switch):
+    """Records buttons in order: clicks as the button name, and holds and
+    releases as the name prefixed by "+" and "-"."""
 
-    #pylint: disable=super-init-not-called
     def __init__(self, *args, **kwargs):
+        super().__init__(transport=MockTransport())
         self.key_presses: List[str] = []
 
     def press_button(self, button):
         self.key_presses.append(button)
+        super().press_button(button)
 
-    def send_command(self, command):
-        pass
+    def hold_button(self, button):
+        self.key_presses.append("+" + button)
+        super().hold_button(button)
+
+    def release_button(self, button):
+        self.key_presses.append("-" + button)
+        super().release_button(button)
 
 
 def test_perform_move():
     mock_switch = MockSwitch()
     interface = PPT2PuyoInterface(switch=mock_switch)
 
+    # Rotations are clicked while the first shift in the same direction is
+    # held, so both happen in one step.
     testdata: List[Tuple[MoveAction, List[str]]] = [
         # rotation=0
         (MoveAction(b'rr', 0, 0), ["DLEFT", "DLEFT", "DUP"]),
@@ -32,24 +53,24 @@ def test_perform_move():
         (MoveAction(b'rr', 0, 5), ["DRIGHT", "DRIGHT", "DRIGHT", "DUP"]),
 
         # rotation=1
-        (MoveAction(b'rr', 1, 0), ["A", "DLEFT", "DLEFT", "DUP"]),
+        (MoveAction(b'rr', 1, 0), ["+DLEFT", "A", "-DLEFT", "DLEFT", "DUP"]),
         (MoveAction(b'rr', 1, 2), ["A", "DUP"]),
-        (MoveAction(b'rr', 1, 4), ["A", "DRIGHT", "DRIGHT", "DUP"]),
+        (MoveAction(b'rr', 1, 4), ["+DRIGHT", "A", "-DRIGHT", "DRIGHT", "DUP"]),
 
         # rotation=2
-        (MoveAction(b'rr', 2, 0), ["A", "A", "DLEFT", "DLEFT", "DUP"]),
-        (MoveAction(b'rr', 2, 1), ["A", "A", "DLEFT", "DUP"]),
+        (MoveAction(b'rr', 2, 0), ["+DLEFT", "A", "-DLEFT", "+DLEFT", "A", "-DLEFT", "DUP"]),
+        (MoveAction(b'rr', 2, 1), ["+DLEFT", "A", "-DLEFT", "A", "DUP"]),
         (MoveAction(b'rr', 2, 2), ["A", "A", "DUP"]),
-        (MoveAction(b'rr', 2, 3), ["A", "A", "DRIGHT", "DUP"]),
-        (MoveAction(b'rr', 2, 4), ["A", "A", "DRIGHT", "DRIGHT", "DUP"]),
-        (MoveAction(b'rr', 2, 5), ["A", "A", "DRIGHT", "DRIGHT", "DRIGHT", "DUP"]),
+        (MoveAction(b'rr', 2, 3), ["+DRIGHT", "A", "-DRIGHT", "A", "DUP"]),
+        (MoveAction(b'rr', 2, 4), ["+DRIGHT", "A", "-DRIGHT", "+DRIGHT", "A", "-DRIGHT", "DUP"]),
+        (MoveAction(b'rr', 2, 5), ["+DRIGHT", "A", "-DRIGHT", "+DRIGHT", "A", "-DRIGHT", "DRIGHT", "DUP"]),
 
         # rotation=3
-        (MoveAction(b'rr', 3, 0), ["B", "DLEFT", "DUP"]),
+        (MoveAction(b'rr', 3, 0), ["+DLEFT", "B", "-DLEFT", "DUP"]),
         (MoveAction(b'rr', 3, 1), ["B", "DUP"]),
-        (MoveAction(b'rr', 3, 2), ["B", "DRIGHT", "DUP"]),
-        (MoveAction(b'rr', 3, 3), ["B", "DRIGHT", "DRIGHT", "DUP"]),
-        (MoveAction(b'rr', 3, 4), ["B", "DRIGHT", "DRIGHT", "DRIGHT", "DUP"]),
+        (MoveAction(b'rr', 3, 2), ["+DRIGHT", "B", "-DRIGHT", "DUP"]),
+        (MoveAction(b'rr', 3, 3), ["+DRIGHT", "B", "-DRIGHT", "DRIGHT", "DUP"]),
+        (MoveAction(b'rr', 3, 4), ["+DRIGHT", "B", "-DRIGHT", "DRIGHT", "DRIGHT", "DUP"]),
 
         # fast_down=False
         (MoveAction(b'rr', 0, 2, fast_down=False), []),
@@ -59,4 +80,46 @@ def test_perform_move():
     for move, expected_keys in testdata:
         mock_switch.key_presses = []
         interface.perform_action(move)
-        assert set(mock_switch.key_presses) == set(expected_keys)
+        assert mock_switch.key_presses == expected_keys, move
+
+
+def frame(command):
+    return struct.pack("<I", len(command)+2) + command.encode()
+
+def test_command_coalescing():
+    switch = Switch(transport=MockTransport())
+    writes = switch.transport.writes
+
+    # Configuration is deferred until a command is sent, and dropped when it
+    # wouldn't change anything.
+    switch.set_sleep_time(8)
+    assert writes == []
+    switch.set_sleep_time(0)
+    switch.press_button("A")
+    assert writes == [
+        frame("configure mainLoopSleepTime 0") + frame("click A")
+    ]
+    switch.set_sleep_time(8)
+    switch.set_sleep_time(0)
+    switch.press_button("B")
+    assert writes[1:] == [frame("click B")]
+
+    # A change with no command after it is written by `flush()`
+    switch.set_sleep_time(8)
+    switch.flush()
+    assert writes[2:] == [frame("configure mainLoopSleepTime 8")]
+    switch.flush()
+    assert len(writes) == 3
+
+    # Commands in a batch are written together
+    del writes[:]
+    with switch.batch():
+        switch.press_button("A")
+        switch.set_sleep_time(20)
+        switch.press_button("B")
+        assert writes == []
+    assert writes == [
+        frame("click A") +
+        frame("configure mainLoopSleepTime 20") +
+        frame("click B")
+    ]
@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+from ptai.ppt2 import switch
+from ptai.ppt2.switch import UsbTransport, device_name
+
+
+class UnopenedTransport(UsbTransport):
+    """Keeps the device without configuring it."""
+
+    def __init__(self, usb_dev):
+        self.usb_dev = usb_dev
+
+
+def test_device_name():
+    dev = SimpleNamespace(bus=1, address=17, port_numbers=(4, 2))
+    assert device_name(dev) == "usb:1-4.2"
+    # Reconnecting gives the device a new address, but the same name
+    dev.address = 18
+    assert device_name(dev) == "usb:1-4.2"
+    assert device_name(SimpleNamespace(bus=2, address=5, port_numbers=None)) == "usb:2-addr5"
+
+def test_find_by_name(monkeypatch):
+    devs = [
+        SimpleNamespace(bus=1, address=3, port_numbers=(1,)),
+        SimpleNamespace(bus=1, address=9, port_numbers=(2,)),
+    ]
+    monkeypatch.setattr(switch, "_find_devices", lambda vendor_id, product_id: devs)
+    assert [t.name for t in UnopenedTransport.find_all(0, 0)] == ["usb:1-1", "usb:1-2"]
+    # Only the named device is opened
+    assert [t.usb_dev for t in UnopenedTransport.find_all(0, 0, "usb:1-2")] == [devs[1]]
+    assert UnopenedTransport.find_all(0, 0, "usb:1-3") == []
+    assert switch.switch_names() == ["usb:1-1", "usb:1-2"]
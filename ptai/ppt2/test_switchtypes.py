@@ -0,0 +1,136 @@
+import numpy
+
+from ptai.ppt2.switchtypes import Struct, UInt8, UInt32, make_array_t, format_reachable
+from ptai.ppt2.puyotypes import Puyo, PuyoGrid, PUYO
+from ptai.ppt2.fakebotbase import FakeBotbase, MemoryImage
+from ptai.ppt2.switch import Switch
+
+
+class Example2(Struct):
+    fields = (
+        Struct.Field(name="x", type=UInt8),
+    )
+
+
+def test_array_decoding():
+    array_t = make_array_t(UInt32, 3)
+    array = array_t.from_bytes(b"\x01\0\0\0\x02\0\0\0\xff\xff\xff\xff")
+    assert list(array.array) == [1, 2, 0xFFFFFFFF]
+    assert array[1].value == 2
+    assert array[-1].value == 0xFFFFFFFF
+    assert [obj.value for obj in array[1:]] == [2, 0xFFFFFFFF]
+    assert [obj.value for obj in array[::-2]] == [0xFFFFFFFF, 1]
+    assert [obj.value for obj in array.objects] == [1, 2, 0xFFFFFFFF]
+    assert [obj.value for obj in array[:2]] == [1, 2]
+
+def test_puyo_grid_byte_array():
+    rng = numpy.random.RandomState(0)
+    data = bytes(rng.randint(0, 8, PuyoGrid.size, dtype="u1"))
+    grid = PuyoGrid.from_bytes(data)
+    expected = numpy.array([
+        [grid[x + y*8].byte for y in range(14, 2, -1)]
+        for x in range(1, 7)
+    ], dtype="|S1")
+    assert grid.get_byte_array().shape == (6, 12)
+    assert (grid.get_byte_array() == expected).all()
+    assert grid[8].color in set(PUYO)
+
+    # Grids built from objects give the same result
+    objects = PuyoGrid([
+        Puyo.from_bytes(data[i*4:(i+1)*4]) for i in range(PuyoGrid.count)
+    ])
+    assert (objects.get_byte_array() == expected).all()
+
+def test_struct_fields():
+    class Example(Struct):
+        __slots__ = ()
+        fields = (
+            Struct.Field(name="a", type=UInt8),
+            Struct.Field(name="b", type=UInt32, offset=4),
+            Struct.Field(name="pair", type=make_array_t(Puyo, 2)),
+            Struct.Field(name="pointer", type=Example2.pointer_t),
+        )
+    data = bytes([7, 0, 0, 0, 1, 2, 0, 0, 3, 0, 0, 0, 4, 0, 0, 0]) + (0x1234).to_bytes(8, "little")
+    assert Example.size == 24
+    example = Example.from_bytes(data)
+    assert example["a"].value == 7
+    assert example["b"].value == 0x201
+    assert example["pair"][1].color == PUYO.YELLOW
+    assert example["pointer"].value == 0x1234
+    assert example["pointer"].dest_type is Example2
+    # Decoded fields are cached
+    assert example["pair"] is example["pair"]
+    assert not hasattr(example, "__dict__")
+
+def test_array_pointer():
+    image = MemoryImage()
+    image.write("absolute", 0x1000, bytes(range(0x40)))
+    fake = FakeBotbase(image)
+    switch = Switch(transport=fake)
+    pointer = make_array_t(UInt32, 16).pointer_t(0x1000)
+
+    assert pointer[1].deref(switch).value == 0x07060504
+    assert pointer[-1].deref(switch).value == 0x3F3E3D3C
+    sub_array = pointer[2:4].deref(switch)
+    assert [obj.value for obj in sub_array.objects] == [0x0B0A0908, 0x0F0E0D0C]
+    assert fake.n_bytes_peeked == 16
+
+    # Strided reads share one round-trip, merging nearby ranges
+    fake.reset_stats()
+    assert pointer.deref_strided(switch, [5, 0, 1], offset=1, size=2) == \
+        [b"\x15\x16", b"\x01\x02", b"\x05\x06"]
+    assert fake.n_writes == 1
+    assert fake.n_peeks == 3
+    fake.reset_stats()
+    pointer.deref_strided(switch, [5, 0, 1], offset=1, size=2, max_gap=2)
+    assert fake.n_peeks == 2
+    assert fake.n_bytes_peeked == 8
+
+def test_puyo_grid_pointer():
+    rng = numpy.random.RandomState(0)
+    data = bytes(rng.randint(0, 8, PuyoGrid.size, dtype="u1"))
+    image = MemoryImage()
+    image.write("absolute", 0x1000, data)
+    fake = FakeBotbase(image)
+    switch = Switch(transport=fake)
+    pointer = PuyoGrid.pointer_t(0x1000)
+    board = PuyoGrid.from_bytes(data).get_byte_array()
+
+    assert (pointer.visible().deref(switch).get_byte_array() == board).all()
+    assert fake.n_bytes_peeked == 12 * 8 * Puyo.size
+
+    # Top two visible rows, which are the highest y on the board
+    fake.reset_stats()
+    rows = pointer.deref_rows(switch, [3, 4])
+    assert (rows[0] == board[:, 11]).all()
+    assert (rows[1] == board[:, 10]).all()
+    assert fake.n_peeks == 1
+
+class Node(Struct):
+    pass
+Node.fields = (
+    Struct.Field(name="value", type=UInt32),
+    Struct.Field(name="next", type=Node.pointer_t, offset=8),
+    Struct.Field(name="other", type=Node.pointer_t),
+)
+
+def test_format_reachable():
+    image = MemoryImage()
+    # A cycle of two nodes, with both pointing to a third
+    for address, value, next_address, other in (
+        (0x100, 1, 0x200, 0x300),
+        (0x200, 2, 0x100, 0x300),
+        (0x300, 3, 0, 0),
+    ):
+        image.write("absolute", address, value.to_bytes(8, "little"))
+        image.write_pointer("absolute", address + 8, next_address)
+        image.write_pointer("absolute", address + 16, other)
+    fake = FakeBotbase(image)
+
+    text, reader = format_reachable(Node.pointer_t(0x100), Switch(transport=fake))
+    assert text.count("(cycle: absolute:0x00000100)") == 1
+    assert text.count("(shown above: absolute:0x00000300)") == 1
+    assert text.count("(null pointer)") == 2
+    # Each node is read once, whole
+    assert reader.n_peeks == fake.n_peeks == 3
+    assert reader.n_bytes == 3 * Node.size
@@ -0,0 +1,263 @@
+"""
+Profiling for the command line tools.
+
+Two modes are supported:
+ * "deterministic" uses cProfile, which records every function call.
+ * "sampling" interrupts the program periodically with a profiling timer and
+   records the stack at that moment. It has much lower overhead, so timings
+   are closer to an unprofiled run, but it only works on Unix and only sees
+   the main thread.
+
+Either mode writes a pstats file, which can be read with `pstats` or tools such
+as snakeviz, and a collapsed stack file (one `frame;frame;frame count` line
+per stack), which can be turned into a flamegraph with flamegraph.pl,
+speedscope or inferno.
+
+Functions decorated with `tag()` are given a descriptive label in both outputs,
+such as "engine:PuyoGameState._get_connected", so the engine and AI stand out
+from everything else.
+"""
+import cProfile
+import marshal
+import os
+import signal
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Tuple, TypeVar
+
+PROFILE_MODES = ("deterministic", "sampling")
+
+# Maps the (filename, line, name) key that pstats uses for a function to its
+# label.
+_TAGS: Dict[Tuple[str, int, str], str] = {}
+
+F = TypeVar("F", bound=Callable)
+
+
+def _code_key(code) -> Tuple[str, int, str]:
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+def _tag_code(code, label:str):
+    _TAGS[_code_key(code)] = label
+    # Also label functions defined inside this one
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            _tag_code(const, f"{label}.{const.co_name}")
+
+def tag(category:str) -> Callable[[F], F]:
+    """Decorator which labels a function as "category:QualifiedName".
+
+    The function itself isn't changed, so tagging has no runtime cost.
+    """
+    def decorator(func:F) -> F:
+        _tag_code(func.__code__, f"{category}:{func.__qualname__}")
+        return func
+    return decorator
+
+def label_for(key:Tuple[str, int, str]) -> str:
+    """Return a human readable label for a pstats function key."""
+    if key in _TAGS:
+        return _TAGS[key]
+    filename, line, name = key
+    if filename == "~":
+        # Builtins are recorded by cProfile as ("~", 0, "<built-in ...>")
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+class Profiler:
+    """Collects a profile while enabled.
+
+    The profiler can be enabled and disabled any number of times, for example
+    around each turn, and the results are aggregated over all of them.
+    """
+
+    def __init__(self, mode:str="deterministic", interval:float=0.001):
+        assert mode in PROFILE_MODES, f"Invalid profile mode: {mode}"
+        self.mode = mode
+        self.interval = interval
+        self._cprofile = cProfile.Profile() if mode == "deterministic" else None
+        self._samples: Counter = Counter()
+        self._enabled_time = 0.0
+        self._enable_start = 0.0
+
+    def enable(self):
+        self._enable_start = time.perf_counter()
+        if self._cprofile:
+            self._cprofile.enable()
+        else:
+            signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        if self._cprofile:
+            self._cprofile.disable()
+        else:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        self._enabled_time += time.perf_counter() - self._enable_start
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(_code_key(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        self._samples[tuple(stack)] += 1
+
+    def get_stats(self) -> dict:
+        """Return profile data in the format used by `pstats`."""
+        if self._cprofile:
+            self._cprofile.create_stats()
+            return self._cprofile.stats  # type: ignore
+        return _samples_to_stats(self._samples, self.interval)
+
+    def write(self, prefix:str) -> List[str]:
+        """Write "PREFIX.pstats" and "PREFIX.collapsed", returning the paths."""
+        stats = self.get_stats()
+        labeled = {
+            _relabel(key): (cc, nc, tt, ct, {
+                _relabel(caller): value for caller, value in callers.items()
+            })
+            for key, (cc, nc, tt, ct, callers) in stats.items()
+        }
+        pstats_path = prefix + ".pstats"
+        with open(pstats_path, "wb") as f:
+            marshal.dump(labeled, f)
+
+        if self._cprofile:
+            stacks = _stats_to_stacks(stats)
+        else:
+            stacks = {
+                stack: count * self.interval
+                for stack, count in self._samples.items()
+            }
+        collapsed_path = prefix + ".collapsed"
+        with open(collapsed_path, "w") as f:
+            for stack, seconds in sorted(stacks.items()):
+                microseconds = round(seconds * 1e6)
+                if microseconds > 0:
+                    labels = ";".join(label_for(key) for key in stack)
+                    f.write(f"{labels} {microseconds}\n")
+
+        return [pstats_path, collapsed_path]
+
+    def summary(self, n:int=15) -> str:
+        """Return the top `n` functions by total time as a string."""
+        stats = self.get_stats()
+        lines = [
+            f"Profiled {self._enabled_time:.2f}s ({self.mode})",
+            f"{'cumulative':>10} {'own':>10}  function",
+        ]
+        rows = sorted(stats.items(), key=lambda item: -item[1][3])
+        for key, (cc, nc, tt, ct, callers) in rows[:n]:
+            lines.append(f"{ct:>9.3f}s {tt:>9.3f}s  {label_for(key)}")
+        if not rows:
+            lines.append("(no samples)")
+        return "\n".join(lines)
+
+
+def _relabel(key:Tuple[str, int, str]) -> Tuple[str, int, str]:
+    if key in _TAGS:
+        return (key[0], key[1], _TAGS[key])
+    return key
+
+def _samples_to_stats(samples:Counter, interval:float) -> dict:
+    """Build pstats style data from sampled stacks.
+
+    Call counts aren't known when sampling, so each sample counts as one call.
+    """
+    own: Dict[tuple, float] = defaultdict(float)
+    cumulative: Dict[tuple, float] = defaultdict(float)
+    n_samples: Counter = Counter()
+    callers: Dict[tuple, Dict[tuple, list]] = defaultdict(dict)
+    for stack, count in samples.items():
+        seconds = count * interval
+        own[stack[-1]] += seconds
+        # Recursive functions are only counted once per stack
+        for key in set(stack):
+            cumulative[key] += seconds
+            n_samples[key] += count
+        for caller, callee in set(zip(stack, stack[1:])):
+            edge = callers[callee].setdefault(caller, [0, 0, 0.0, 0.0])
+            edge[0] += count
+            edge[1] += count
+            edge[3] += seconds
+        for caller, callee in zip(stack[-2:-1], stack[-1:]):
+            callers[callee][caller][2] += seconds
+
+    return {
+        key: (n_samples[key], n_samples[key], own[key], cumulative[key], {
+            caller: tuple(edge) for caller, edge in callers[key].items()
+        })
+        for key in cumulative
+    }
+
+def _stats_to_stacks(stats:dict, max_depth:int=100) -> Dict[tuple, float]:
+    """Estimate full stacks from cProfile's caller/callee data.
+
+    cProfile only records which function called which, not whole stacks, so
+    each function's time is split between its callers in proportion to the
+    time spent in it when called from each one.
+    """
+    children: Dict[tuple, Dict[tuple, float]] = defaultdict(dict)
+    for callee, (cc, nc, tt, ct, callers) in stats.items():
+        for caller, edge in callers.items():
+            edge_ct = edge[3] if isinstance(edge, tuple) else 0.0
+            children[caller][callee] = edge_ct
+
+    stacks: Dict[tuple, float] = defaultdict(float)
+
+    def visit(stack, key, seconds):
+        cc, nc, tt, ct, callers = stats[key]
+        if ct <= 0 or seconds <= 0:
+            return
+        fraction = min(1.0, seconds / ct)
+        stacks[stack] += tt * fraction
+        if len(stack) >= max_depth:
+            return
+        for child, child_seconds in children[key].items():
+            if child in stack:
+                continue
+            visit(stack + (child,), child, child_seconds * fraction)
+
+    roots = [key for key, value in stats.items() if not value[4]]
+    for root in roots:
+        visit((root,), root, stats[root][3])
+    return stacks
+
+
+def add_profile_args(parser):
+    """Add the profiling options to an argparse parser."""
+    parser.add_argument("--profile", metavar="PREFIX", nargs="?", const="ptai-profile",
+        help="""
+        Profile the command, writing "PREFIX.pstats" and "PREFIX.collapsed".
+        PREFIX defaults to "ptai-profile".
+    """)
+    parser.add_argument("--profile-mode", choices=PROFILE_MODES,
+        default="deterministic", help="""
+        "deterministic" traces every call using cProfile. "sampling" records
+        the stack every `--profile-interval` of CPU time, which has much less
+        overhead.
+    """)
+    parser.add_argument("--profile-interval", type=float, default=1.0,
+        metavar="MS", help="""
+        Milliseconds of CPU time between samples in sampling mode.
+    """)
+    parser.add_argument("--profile-turns", type=int, metavar="N", help="""
+        Number of turns to profile. The profile is aggregated over all of
+        them.
+    """)
+
+def profiler_from_args(args):
+    """Return a `Profiler` if `--profile` was given, otherwise None."""
+    if args.profile is None:
+        return None
+    return Profiler(args.profile_mode, args.profile_interval / 1000)
@@ -1,9 +1,10 @@
 from typing import cast
 
-from ptai.ai import ScoreBasedAI
+from ptai.ai import LookaheadAI, ScoreBasedAI
 from ptai.actions import MoveAction
 from ptai.gamestate import GameState
 from ptai.puyo.gamestate import PuyoGameState
+from ptai.profiling import tag
 
 
 class SimpleGreedyAI(ScoreBasedAI):
@@ -15,6 +16,7 @@ class SimpleGreedyAI(ScoreBasedAI):
     the highest score is chosen. Ties are broken randomly.
     """
 
+    @tag("ai")
     def score_move(self, state:GameState, move:MoveAction) -> float:
         state = cast(PuyoGameState, state)
         result = state.move(move)
@@ -42,6 +44,7 @@ class SimpleComboAI(ScoreBasedAI):
     potential to make combos.
     """
 
+    @tag("ai")
     def score_move(self, state:GameState, move:MoveAction) -> float:
         state = cast(PuyoGameState, state)
         result = state.move(move)
@@ -73,3 +76,7 @@ class SimpleComboAI(ScoreBasedAI):
             value = float("-inf")
 
         return value
+
+
+class LookaheadComboAI(LookaheadAI, SimpleComboAI):
+    """SimpleComboAI that also looks at the next piece, when there's time."""
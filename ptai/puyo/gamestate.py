@@ -1,8 +1,11 @@
+import random
 import numpy
-from typing import Iterable
+from typing import Iterable, Optional
 
 from ptai.gamestate import GameState, MoveResult
 from ptai.actions import MoveAction
+from ptai.profiling import tag
+from ptai.puyo import reachability
 
 
 # Score calculation tables
@@ -23,10 +26,13 @@ class PuyoGameState(GameState):
         b'k': (0, 0, 0),
     }
 
-    def __init__(self, board=None, queue=None, new_turn=False, current_position=None):
+    def __init__(self, board=None, queue=None, new_turn=False, current_position=None,
+                 frame=None):
         """
         Args additional to superclass:
         * current_position - (x, y) of the currently falling piece.
+        * frame - The game's frame counter when the state was read, if the
+          interface knows it.
         """
         if board is None:
             board = numpy.array([[b'.' for y in range(12)]
@@ -37,6 +43,7 @@ class PuyoGameState(GameState):
 
         super().__init__(board, queue or [], new_turn)
         self.current_position = current_position
+        self.frame = frame
 
     def __str__(self):
         lines = []
@@ -59,9 +66,12 @@ class PuyoGameState(GameState):
 
         return '\n'.join(lines)
 
+    @tag("engine")
     def copy(self) -> "PuyoGameState":
-        return PuyoGameState(self.board, self.queue, self.new_turn)
+        return PuyoGameState(self.board, list(self.queue), self.new_turn,
+                             self.current_position, self.frame)
 
+    @tag("engine")
     def move(self, move: MoveAction) -> MoveResult:
         assert self._can_make_move(move)
         assert len(move.piece) == 2
@@ -88,50 +98,54 @@ class PuyoGameState(GameState):
         else:
             return self._drop_beans((move.x, move.x+1), pair)
 
+    @tag("engine")
     def get_moves(self) -> Iterable[MoveAction]:
         piece = self.queue[0]
+        placements = reachability.board_reachable(self.board)
         for orientation in range(4):
             for x in range(5 if orientation%2 else 6):
-                y = None  # Puyo doesn't use Y because of its gravity rules
-                move = MoveAction(piece, orientation, x, y)
-                if self._can_make_move(move):
-                    yield move
+                if (orientation, x) in placements:
+                    y = None  # Puyo doesn't use Y because of its gravity rules
+                    yield MoveAction(piece, orientation, x, y)
 
 
+    @tag("engine")
+    def drop_nuisance(self, n:int, rng:Optional[random.Random]=None) -> int:
+        """Drop `n` black nuisance puyos onto the board.
+
+        Full rows of 6 are dropped first, then any remainder falls in randomly
+        chosen, distinct columns. Returns the number of puyos which landed,
+        which is less than `n` if columns are full. Columns are chosen with
+        `rng`, or the global random module if not given.
+        """
+        rng = rng or random
+        n_landed = 0
+        columns = [x for x in range(6)] * (n // 6)
+        columns += rng.sample(range(6), n % 6)
+        for x in columns:
+            if self.board[x][11] == b'.':
+                n_landed += 1
+            self._drop(x, b'k')
+        return n_landed
+
     ############################
     ##### Internal Methods #####
     ############################
 
+    @tag("engine")
     def _can_make_move(self, move:MoveAction):
         """Return True if the move can be made, False otherwise."""
 
         # Is this even a valid move?
         assert move.orientation in range(4)
         if move.orientation % 2 == 0:
-            assert move.orientation in range(6)
+            assert move.x in range(6)
         else:
-            assert move.orientation in range(5)
-
-        # Any beans blocking the path?
-        if move.orientation == 2 and move.orientation == 0:
-            # This move is always possible. If this column is completely
-            # filled, this move results in a game over.
-            return True
-        elif move.orientation >= 2:
-            pos_range = list(range(2, move.orientation+1 + move.orientation%2))
-        else:
-            pos_range = list(range(2, move.orientation-1, -1))
-        for i in pos_range:
-            if self.board[i][11] != b'.':
-                return False
-
-        # Make sure there is room to rotate the beans
-        if move.orientation != 0 and self.board[1][11] != b'.' and \
-                             self.board[3][11] != b'.':
-            return False
+            assert move.x in range(5)
 
-        return True
+        return (move.orientation, move.x) in reachability.board_reachable(self.board)
 
+    @tag("engine")
     def _drop_beans(self, xs, beans) -> MoveResult:
         for x, bean in zip(xs, beans):
             self._drop(x, bean)
@@ -165,12 +179,14 @@ class PuyoGameState(GameState):
             n_cells_eliminated=total_n_beans,
         )
 
+    @tag("engine")
     def _drop(self, x, bean):
         for y in range(12):
             if self.board[x][y] == b'.':
                 self.board[x][y] = bean
                 break
 
+    @tag("engine")
     def _eliminate_beans(self):
 
         def eliminate_if_black_bean(x, y):
@@ -196,16 +212,17 @@ class PuyoGameState(GameState):
                 else:
                     group_bonus += GROUP_BONUS_TABLE[len(coordinates)]
 
-                for x, y in coordinates:
-                    eliminate_if_black_bean(x-1, y)
-                    eliminate_if_black_bean(x+1, y)
-                    eliminate_if_black_bean(x, y-1)
-                    eliminate_if_black_bean(x, y+1)
-                    self.board[x][y] = b'.'
+                for cx, cy in coordinates:
+                    eliminate_if_black_bean(cx-1, cy)
+                    eliminate_if_black_bean(cx+1, cy)
+                    eliminate_if_black_bean(cx, cy-1)
+                    eliminate_if_black_bean(cx, cy+1)
+                    self.board[cx][cy] = b'.'
                     n_beans += 1
 
         return n_beans, len(colors_eliminated), group_bonus
 
+    @tag("engine")
     def _get_connected(self, x, y):
         """Return a list of coordinates connected by color to (x, y)."""
         color = self.board[x][y]
@@ -230,6 +247,7 @@ class PuyoGameState(GameState):
         visit(x, y)
         return list(visited)
 
+    @tag("engine")
     def _do_gravity(self):
         """Make floating beans fall."""
         for x in range(6):
@@ -0,0 +1,158 @@
+"""
+Which placements the falling pair can reach, and the fewest inputs for each.
+
+The pair spawns vertically with its pivot at (2, 11), and is moved by
+shifting it left or right and rotating it around the pivot. A shift or
+rotation can't move either puyo into a column that's filled up to it. A
+rotation that's blocked kicks the pair one cell away from the obstruction if
+there's room, so a pair next to a full column can still turn.
+
+Only the tops of the columns matter, so results are cached by the column
+heights with anything below the pair clamped to the same value. There are
+few enough of those profiles that, after the first few turns of a game,
+lookups are almost always cache hits.
+"""
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy
+
+WIDTH = 6
+HEIGHT = 12
+SPAWN_X = 2
+SPAWN_Y = 11
+
+LEFT = "left"
+RIGHT = "right"
+# Clockwise turns the second puyo from above the pivot to its right.
+CW = "cw"
+CCW = "ccw"
+INPUTS = (CW, CCW, LEFT, RIGHT)
+
+# Position of the second puyo relative to the pivot, for each orientation.
+SECOND_OFFSET = {0: (0, 1), 1: (1, 0), 2: (0, -1), 3: (-1, 0)}
+# Neither puyo ever goes below this row, so lower columns all act the same.
+MIN_HEIGHT = SPAWN_Y - 1
+# A kick can push the pair at most this many rows up.
+MAX_LIFT = 1
+
+_EMPTY_ROW = b'.' * WIDTH
+_LOW_PROFILE = (MIN_HEIGHT,) * WIDTH
+
+# `(orientation, x)`, like the fields of `MoveAction`
+Placement = Tuple[int, int]
+# `(pivot x, orientation, rows kicked up)`
+_State = Tuple[int, int, int]
+
+
+def column_heights(board) -> Tuple[int, ...]:
+    """Number of puyos in each column of a `PuyoGameState` board."""
+    board = numpy.asarray(board, dtype="|S1")
+    return _byte_heights(board.tobytes(), board.shape[1])
+
+def profile(heights:Sequence[int]) -> Tuple[int, ...]:
+    """Heights with every value that behaves the same clamped together."""
+    return tuple([
+        MIN_HEIGHT if h < MIN_HEIGHT else HEIGHT if h > HEIGHT else h
+        for h in heights
+    ])
+
+def reachable(heights:Sequence[int]) -> Dict[Placement, Tuple[str, ...]]:
+    """Map each reachable placement to the fewest inputs that reach it.
+
+    Empty if the spawn point is filled. The returned dict is shared between
+    calls and must not be modified.
+    """
+    return _reachable(profile(heights))
+
+def can_reach(heights:Sequence[int], orientation:int, x:int) -> bool:
+    return (orientation, x) in reachable(heights)
+
+def board_reachable(board:numpy.ndarray) -> Dict[Placement, Tuple[str, ...]]:
+    """Like `reachable()`, for the heights of a `PuyoGameState` board.
+
+    Columns only count once they reach `MIN_HEIGHT`, which takes a puyo in
+    one of the rows from there up. Most boards have none, so those rows are
+    checked first, which is much cheaper than counting every column.
+    """
+    data = board.tobytes()
+    if all(data[row::HEIGHT] == _EMPTY_ROW for row in range(MIN_HEIGHT, HEIGHT)):
+        return _reachable(_LOW_PROFILE)
+    return reachable(_byte_heights(data, HEIGHT))
+
+def _byte_heights(data:bytes, height:int) -> Tuple[int, ...]:
+    # Counting in the raw bytes of a board is cheaper than comparing it as
+    # an array.
+    return tuple([
+        height - data.count(b'.', start, start + height)
+        for start in range(0, len(data), height)
+    ])
+
+def follow(heights:Sequence[int], inputs:Iterable[str]) -> Optional[Placement]:
+    """Placement reached by making `inputs` from spawn.
+
+    Returns None if any input is blocked, since on the console the pair then
+    ends up somewhere other than intended.
+    """
+    heights = profile(heights)
+    state = (SPAWN_X, 0, 0)
+    if not _fits(heights, state):
+        return None
+    for input in inputs:
+        state = _step(heights, state, input)
+        if state is None:
+            return None
+    return _placement(state)
+
+
+@lru_cache(maxsize=None)
+def _reachable(heights:Tuple[int, ...]) -> Dict[Placement, Tuple[str, ...]]:
+    start = (SPAWN_X, 0, 0)
+    if not _fits(heights, start):
+        return {}
+
+    # Breadth first, so the first path found to each state is a shortest one
+    paths = {start: ()}
+    queue = deque([start])
+    placements:Dict[Placement, Tuple[str, ...]] = {}
+    while queue:
+        state = queue.popleft()
+        placements.setdefault(_placement(state), paths[state])
+        for input in INPUTS:
+            next_state = _step(heights, state, input)
+            if next_state is not None and next_state not in paths:
+                paths[next_state] = paths[state] + (input,)
+                queue.append(next_state)
+    return placements
+
+def _fits(heights:Tuple[int, ...], state:_State) -> bool:
+    x, orientation, lift = state
+    dx, dy = SECOND_OFFSET[orientation]
+    y = SPAWN_Y + lift
+    for cell_x, cell_y in ((x, y), (x + dx, y + dy)):
+        if not 0 <= cell_x < WIDTH or heights[cell_x] > cell_y:
+            return False
+    return True
+
+def _step(heights:Tuple[int, ...], state:_State, input:str) -> Optional[_State]:
+    x, orientation, lift = state
+    if input == LEFT or input == RIGHT:
+        shifted = (x + (1 if input == RIGHT else -1), orientation, lift)
+        return shifted if _fits(heights, shifted) else None
+
+    orientation = (orientation + (1 if input == CW else -1)) % 4
+    rotated = (x, orientation, lift)
+    if _fits(heights, rotated):
+        return rotated
+    # Kick away from whatever the second puyo hit
+    dx, dy = SECOND_OFFSET[orientation]
+    kicked = (x - dx, orientation, lift - dy)
+    if 0 <= kicked[2] <= MAX_LIFT and _fits(heights, kicked):
+        return kicked
+    return None
+
+def _placement(state:_State) -> Placement:
+    x, orientation, _ = state
+    # The second puyo is on the left, and placements use the leftmost column
+    return (orientation, x - 1 if orientation == 3 else x)
@@ -0,0 +1,54 @@
+import random
+
+from ptai.actions import MoveAction
+from ptai.puyo.gamestate import PuyoGameState
+from ptai.puyo.reachability import (
+    CCW, CW, LEFT, RIGHT, board_reachable, column_heights, follow, reachable,
+)
+
+
+def test_open_board():
+    placements = reachable([0] * 6)
+    assert len(placements) == 22
+    assert placements[(0, 2)] == ()
+    assert len(placements[(2, 5)]) == 5
+    assert len(placements[(3, 0)]) == 2
+    # Heights below the pair share a cache entry
+    assert reachable([3, 1, 0, 7, 9, 2]) is placements
+
+def test_blocked():
+    # A full column can't be crossed, but the pair kicks off it to rotate
+    heights = [0, 0, 0, 12, 0, 0]
+    placements = reachable(heights)
+    assert (0, 4) not in placements
+    assert (1, 2) not in placements
+    assert placements[(1, 1)] == (CW,)
+
+    # Flipped, the lower puyo hits a column one short of the top
+    heights = [0, 0, 0, 11, 0, 0]
+    assert follow(heights, [CW, CW, RIGHT, RIGHT]) is None
+    assert follow(heights, [RIGHT, RIGHT, CW, CW]) == (2, 4)
+    assert follow(heights, [CCW, LEFT]) == (3, 0)
+
+    assert reachable([0, 0, 12, 0, 0, 0]) == {}
+
+def test_game_state_moves():
+    state = PuyoGameState(queue=[b'rg'])
+    state.board[3][:] = b'k'
+    assert column_heights(state.board) == (0, 0, 0, 12, 0, 0)
+    moves = {(move.orientation, move.x) for move in state.get_moves()}
+    assert moves == set(reachable(column_heights(state.board)))
+    assert (0, 5) not in moves
+    assert not state._can_make_move(MoveAction(b'rg', 0, 5))
+    assert state._can_make_move(MoveAction(b'rg', 1, 1))
+
+def test_board_reachable():
+    rng = random.Random(0)
+    for _ in range(200):
+        state = PuyoGameState()
+        for x in range(6):
+            # Some columns reach the rows that matter, and some cells float
+            for y in rng.sample(range(12), rng.choice([0, 3, 9, 10, 11, 12])):
+                state.board[x][y] = b'r'
+        expected = reachable(column_heights(state.board))
+        assert board_reachable(state.board) == expected
@@ -0,0 +1,49 @@
+import random
+
+import numpy
+
+from ptai.actions import MoveAction
+from ptai.puyo.gamestate import PuyoGameState
+from ptai.puyo import vecenv
+
+
+def test_matches_puyo_game_state():
+    rng = random.Random(0)
+    n_envs = 16
+    env = vecenv.VectorPuyoEnv(n_envs, seed=0)
+    n_chains = 0
+
+    for _ in range(200):
+        states = [env.get_state(i) for i in range(n_envs)]
+        legal = env.legal_moves()
+        moves = [
+            rng.choice(numpy.nonzero(legal[i])[0])
+            for i in range(n_envs)
+        ]
+        _, rewards, dones, info = env.step(moves)
+
+        for i, (state, move) in enumerate(zip(states, moves)):
+            orientation, x = vecenv.MOVES[move]
+            result = state.move(MoveAction(state.queue[0], orientation, x))
+            assert rewards[i] == result.score
+            assert info["n_combo"][i] == result.n_combo
+            assert info["n_cells_eliminated"][i] == result.n_cells_eliminated
+            if not dones[i]:
+                assert (env.get_state(i).board == state.board).all()
+            n_chains += result.n_combo > 0
+
+    assert n_chains > 0
+
+def test_auto_reset():
+    env = vecenv.VectorPuyoEnv(2, seed=0)
+    state = PuyoGameState([[b'r', b'g']*6 for x in range(6)], [b'rr'])
+    env.set_state(0, state)
+    assert not env.legal_moves()[0].any()
+
+    moves = [vecenv.move_index(0, 2), vecenv.move_index(0, 2)]
+    (boards, queues), rewards, dones, info = env.step(moves)
+    assert list(dones) == [True, False]
+    assert (boards[0] == vecenv.EMPTY).all()
+    assert env.turns[0] == 0
+    assert env.turns[1] == 1
+    assert (boards[1] != vecenv.EMPTY).sum() == 2
@@ -0,0 +1,58 @@
+import random
+
+from ptai.actions import MoveAction
+from ptai.ai import AI
+from ptai.puyo.gamestate import PuyoGameState
+from ptai.puyo import versus
+
+
+class FixedColumnAI(AI):
+    """Always drops the pair vertically in the same column."""
+
+    def __init__(self, x):
+        self.x = x
+
+    def get_move(self, state):
+        return MoveAction(state.queue[0], 0, self.x)
+
+
+def test_drop_nuisance():
+    state = PuyoGameState()
+    assert state.drop_nuisance(8, random.Random(0)) == 8
+    assert all(state.board[x][0] == b'k' for x in range(6))
+    assert sum(state.board[x][1] == b'k' for x in range(6)) == 2
+    assert all(state.board[x][2] == b'.' for x in range(6))
+
+def test_match_is_reproducible():
+    results = list(versus.play_matches(
+        ("ptai.ai.RandomAI", "ptai.ai.RandomAI"),
+        [3, 3],
+        processes=1,
+    ))
+    assert results[0] == results[1]
+    assert results[0].winner in (0, 1)
+
+def test_nuisance_exchange():
+    match = versus.VersusMatch(FixedColumnAI(0), FixedColumnAI(3), seed=0)
+    sender, receiver = match.players
+    # Set up two reds in column 0, so dropping a red pair there pops.
+    sender.state = PuyoGameState(queue=[b'rr', b'gg', b'bb'])
+    sender.state.move(MoveAction(b'rr', 0, 0))
+    sender.pending_nuisance = 1
+    sender.leftover_score = 60
+
+    result = match._move(0, sender, receiver)
+    # 4 puyos popped for 40 points, plus 60 left over from before
+    assert result.score == 40
+    assert result.nuisance_sent == 1
+    assert sender.leftover_score == 30
+    assert sender.pending_nuisance == 0
+    assert receiver.pending_nuisance == 0
+
+    receiver.pending_nuisance = 7
+    match._move(1, receiver, sender)
+    assert receiver.pending_nuisance == 0
+    assert sum(
+        receiver.state.board[x][y] == b'k'
+        for x in range(6) for y in range(12)
+    ) == 7
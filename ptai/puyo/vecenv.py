@@ -0,0 +1,310 @@
+"""
+Many independent simulated Puyo games, stepped together.
+
+Unlike `SimulatedPuyoInterface`, which wraps one `PuyoGameState`, this keeps
+every game in a few packed numpy arrays and implements the game rules as
+whole-array operations. Dropping pieces, finding connected groups, popping,
+gravity and scoring are each done once per step for all games, so the cost of
+a step grows very slowly with the number of games.
+
+Cells are stored as small integers instead of bytes. See `CELLS` for the
+mapping, which matches the byte values used by `PuyoGameState`.
+"""
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy
+
+from ptai.puyo import reachability
+from ptai.puyo.gamestate import (
+    PuyoGameState, CHAIN_POWER_TABLE, COLOR_BONUS_TABLE, GROUP_BONUS_TABLE
+)
+
+WIDTH = 6
+HEIGHT = 12
+
+# Index in this tuple is the integer value of a cell.
+CELLS = (b'.', b'r', b'g', b'b', b'y', b'p', b'k')
+EMPTY = 0
+BLACK = 6
+N_COLORS = 5
+CELL_TO_INT = {cell: i for i, cell in enumerate(CELLS)}
+
+# All (orientation, x) placements. Moves passed to `VectorPuyoEnv.step()` are
+# indexes into this tuple.
+MOVES: Tuple[Tuple[int, int], ...] = tuple(
+    (orientation, x)
+    for orientation in range(4)
+    for x in range(5 if orientation%2 else 6)
+)
+MOVE_INDEXES = {move: i for i, move in enumerate(MOVES)}
+
+# Column each half of the pair lands in. The first column gets the "bottom"
+# puyo, which is dropped first.
+_MOVE_COLUMNS = numpy.array([
+    (x, x) if orientation%2 == 0 else (x, x+1)
+    for orientation, x in MOVES
+])
+# Index into the piece for the puyo dropped first and second. This mirrors the
+# pair reversal done in `PuyoGameState.move()`.
+_MOVE_ORDER = numpy.array([
+    (1, 0) if orientation <= 1 else (0, 1)
+    for orientation, x in MOVES
+])
+
+_CHAIN_POWER = numpy.array(CHAIN_POWER_TABLE)
+_COLOR_BONUS = numpy.array(COLOR_BONUS_TABLE)
+_GROUP_BONUS = numpy.array(GROUP_BONUS_TABLE)
+
+
+def move_index(orientation:int, x:int) -> int:
+    return MOVE_INDEXES[(orientation, x)]
+
+
+class VectorPuyoEnv:
+    """N independent single player Puyo games.
+
+    Observations are a tuple of `(boards, queues)`:
+     * `boards` has shape (N, 6, 12) and is indexed like `PuyoGameState.board`
+       (`boards[i, x, y]`, origin at the bottom left).
+     * `queues` has shape (N, queue_length, 2). `queues[i, 0]` is the pair
+       which the next move places.
+
+    A game is done when the spawn cell (2, 11) is filled after a move, or when
+    the move can't be made because a full column is in the way. Done games are
+    reset automatically, so the observation returned for them is the start of
+    a new game.
+    """
+
+    def __init__(self, n_envs:int, queue_length:int=3, seed:Optional[int]=None):
+        assert queue_length >= 1
+        self.n_envs = n_envs
+        self.queue_length = queue_length
+        self.rng = numpy.random.default_rng(seed)
+
+        self.boards = numpy.zeros((n_envs, WIDTH, HEIGHT), dtype=numpy.uint8)
+        self.queues = numpy.zeros((n_envs, queue_length, 2), dtype=numpy.uint8)
+        self.scores = numpy.zeros(n_envs, dtype=numpy.int64)
+        self.turns = numpy.zeros(n_envs, dtype=numpy.int64)
+        self.reset()
+
+    def reset(self, mask:Optional[numpy.ndarray]=None):
+        """Start new games, for all environments or only where `mask` is True."""
+        if mask is None:
+            mask = numpy.ones(self.n_envs, dtype=bool)
+        n = int(mask.sum())
+        self.boards[mask] = EMPTY
+        self.queues[mask] = self._random_pieces((n, self.queue_length))
+        self.scores[mask] = 0
+        self.turns[mask] = 0
+        return self.observation()
+
+    def observation(self):
+        return self.boards.copy(), self.queues.copy()
+
+    def legal_moves(self) -> numpy.ndarray:
+        """Return a (N, len(MOVES)) boolean array of moves which can be made."""
+        heights = numpy.clip(
+            (self.boards != EMPTY).sum(axis=2),
+            reachability.MIN_HEIGHT, HEIGHT,
+        )
+        # Games usually share a handful of height profiles, so each distinct
+        # profile is looked up once.
+        profiles, inverse = numpy.unique(heights, axis=0, return_inverse=True)
+        masks = numpy.array([_legal_mask(tuple(p.tolist())) for p in profiles])
+        return masks[inverse.reshape(-1)]
+
+    def step(self, moves) -> Tuple[Tuple[numpy.ndarray, numpy.ndarray],
+                                   numpy.ndarray,
+                                   numpy.ndarray,
+                                   Dict[str, numpy.ndarray]]:
+        """Make one move in every game.
+
+        `moves` is a sequence of N indexes into `MOVES`. Returns a tuple of
+        `(observation, rewards, dones, info)`, where rewards are the score
+        gained by each move and info contains the "n_combo" and
+        "n_cells_eliminated" arrays, like `MoveResult`.
+        """
+        moves = numpy.asarray(moves, dtype=numpy.intp)
+        assert moves.shape == (self.n_envs,)
+        envs = numpy.arange(self.n_envs)
+
+        blocked = ~self.legal_moves()[envs, moves]
+
+        pieces = self.queues[:, 0]
+        columns = _MOVE_COLUMNS[moves]
+        order = _MOVE_ORDER[moves]
+        first = pieces[envs, order[:, 0]]
+        second = pieces[envs, order[:, 1]]
+        ok = ~blocked
+        _drop(self.boards, envs[ok], columns[ok, 0], first[ok])
+        _drop(self.boards, envs[ok], columns[ok, 1], second[ok])
+
+        rewards, n_combo, n_cells = resolve_chains(self.boards)
+
+        self.queues[:, :-1] = self.queues[:, 1:]
+        self.queues[:, -1] = self._random_pieces((self.n_envs,))
+        self.scores += rewards
+        self.turns += 1
+
+        dones = blocked | (self.boards[:, 2, HEIGHT-1] != EMPTY)
+        info = {
+            "n_combo": n_combo,
+            "n_cells_eliminated": n_cells,
+            "final_scores": numpy.where(dones, self.scores, 0),
+        }
+        if dones.any():
+            self.reset(dones)
+        return self.observation(), rewards, dones, info
+
+    def get_state(self, i:int) -> PuyoGameState:
+        """Return game `i` as a `PuyoGameState`, for use with normal AIs."""
+        lookup = numpy.array(CELLS, dtype="|S1")
+        return PuyoGameState(
+            lookup[self.boards[i]],
+            [lookup[a] + lookup[b] for a, b in self.queues[i]],
+            new_turn=True,
+        )
+
+    def set_state(self, i:int, state:PuyoGameState):
+        """Overwrite game `i` with the board and queue of `state`."""
+        for x in range(WIDTH):
+            for y in range(HEIGHT):
+                self.boards[i, x, y] = CELL_TO_INT[state.board[x][y]]
+        for j, piece in enumerate(state.queue[:self.queue_length]):
+            self.queues[i, j] = [CELL_TO_INT[piece[0:1]], CELL_TO_INT[piece[1:2]]]
+
+    def _random_pieces(self, shape) -> numpy.ndarray:
+        return self.rng.integers(1, N_COLORS+1, size=tuple(shape)+(2,), dtype=numpy.uint8)
+
+
+@lru_cache(maxsize=None)
+def _legal_mask(heights:Tuple[int, ...]) -> numpy.ndarray:
+    placements = reachability.reachable(heights)
+    return numpy.array([move in placements for move in MOVES])
+
+def _drop(boards, envs, xs, cells):
+    heights = (boards[envs, xs] != EMPTY).sum(axis=1)
+    # Puyos dropped onto a full column disappear, like `PuyoGameState._drop()`
+    room = heights < HEIGHT
+    boards[envs[room], xs[room], heights[room]] = cells[room]
+
+def connected_labels(boards:numpy.ndarray) -> numpy.ndarray:
+    """Label connected groups of same colored puyos.
+
+    Returns an array the shape of `boards`, where each colored puyo holds the
+    lowest flat index (x*12 + y) of any puyo in its group. Empty and black
+    cells are labeled `WIDTH*HEIGHT`.
+    """
+    n_cells = WIDTH * HEIGHT
+    colored = (boards != EMPTY) & (boards != BLACK)
+    index = numpy.arange(n_cells, dtype=numpy.uint8).reshape(WIDTH, HEIGHT)
+    labels = numpy.where(colored, index, numpy.uint8(n_cells))
+
+    same_x = colored[:, 1:, :] & (boards[:, 1:, :] == boards[:, :-1, :])
+    same_y = colored[:, :, 1:] & (boards[:, :, 1:] == boards[:, :, :-1])
+    blank = numpy.uint8(n_cells)
+
+    # Repeatedly take the smallest label among same colored neighbors until
+    # nothing changes. After each pass every cell also jumps to the label of
+    # the cell its label points at, which shortens long snaking groups. Only
+    # boards that are still changing are processed.
+    todo = numpy.arange(len(boards))
+    while len(todo):
+        sub = labels[todo]
+        sx = same_x[todo]
+        sy = same_y[todo]
+        new = sub.copy()
+        numpy.minimum(new[:, 1:, :], numpy.where(sx, sub[:, :-1, :], blank), out=new[:, 1:, :])
+        numpy.minimum(new[:, :-1, :], numpy.where(sx, sub[:, 1:, :], blank), out=new[:, :-1, :])
+        numpy.minimum(new[:, :, 1:], numpy.where(sy, sub[:, :, :-1], blank), out=new[:, :, 1:])
+        numpy.minimum(new[:, :, :-1], numpy.where(sy, sub[:, :, 1:], blank), out=new[:, :, :-1])
+
+        flat = new.reshape(len(todo), n_cells)
+        padded = numpy.concatenate(
+            [flat, numpy.full((len(todo), 1), blank, dtype=numpy.uint8)], axis=1
+        )
+        flat = numpy.take_along_axis(padded, flat.astype(numpy.intp), axis=1)
+        new = flat.reshape(sub.shape)
+
+        changed = (new != sub).any(axis=(1, 2))
+        labels[todo] = new
+        todo = todo[changed]
+
+    return labels
+
+def resolve_chains(boards:numpy.ndarray):
+    """Pop groups and apply gravity until no more groups pop, in place.
+
+    Returns arrays of `(score, n_combo, n_cells_eliminated)` for each board,
+    calculated the same way as `PuyoGameState._drop_beans()`.
+    """
+    n = len(boards)
+    n_cells = WIDTH * HEIGHT
+    scores = numpy.zeros(n, dtype=numpy.int64)
+    n_combo = numpy.zeros(n, dtype=numpy.int64)
+    n_eliminated = numpy.zeros(n, dtype=numpy.int64)
+
+    # Boards that can't possibly pop are skipped entirely.
+    color_counts = numpy.stack([
+        (boards == color).sum(axis=(1, 2))
+        for color in range(1, N_COLORS+1)
+    ], axis=1)
+    active = numpy.nonzero((color_counts >= 4).any(axis=1))[0]
+
+    chain = 0
+    while len(active):
+        sub = boards[active]
+        labels = connected_labels(sub)
+
+        # Size of every group, indexed by [board, label]
+        m = len(active)
+        flat = (numpy.arange(m)[:, None, None] * (n_cells+1) + labels).ravel()
+        group_sizes = numpy.bincount(flat, minlength=m*(n_cells+1)).reshape(m, n_cells+1)
+        group_sizes[:, n_cells] = 0
+        cell_group_sizes = numpy.take_along_axis(
+            group_sizes, labels.reshape(m, -1), axis=1
+        ).reshape(labels.shape)
+        popped = cell_group_sizes >= 4
+
+        popping = popped.any(axis=(1, 2))
+        if not popping.any():
+            break
+        active = active[popping]
+        sub = sub[popping]
+        popped = popped[popping]
+        group_sizes = group_sizes[popping]
+
+        n_beans = popped.sum(axis=(1, 2))
+        n_colors = numpy.stack([
+            (popped & (sub == color)).any(axis=(1, 2))
+            for color in range(1, N_COLORS+1)
+        ], axis=1).sum(axis=1)
+        big_groups = numpy.where(group_sizes >= 4, group_sizes, 0)
+        group_bonus = numpy.where(
+            big_groups > 0,
+            _GROUP_BONUS[numpy.minimum(big_groups, len(_GROUP_BONUS)-1)],
+            0,
+        ).sum(axis=1)
+        chain_power = _CHAIN_POWER[min(chain, len(_CHAIN_POWER)-1)]
+        multiplier = numpy.clip(chain_power + _COLOR_BONUS[n_colors] + group_bonus, 1, 999)
+        scores[active] += 10 * n_beans * multiplier
+        n_eliminated[active] += n_beans
+        n_combo[active] += 1
+
+        # Black puyos next to popped puyos are cleared too
+        near_pop = numpy.zeros_like(popped)
+        near_pop[:, 1:, :] |= popped[:, :-1, :]
+        near_pop[:, :-1, :] |= popped[:, 1:, :]
+        near_pop[:, :, 1:] |= popped[:, :, :-1]
+        near_pop[:, :, :-1] |= popped[:, :, 1:]
+        cleared = popped | (near_pop & (sub == BLACK))
+        sub[cleared] = EMPTY
+
+        # Gravity: stable sort each column so filled cells come first
+        order = numpy.argsort(sub == EMPTY, axis=2, kind="stable")
+        boards[active] = numpy.take_along_axis(sub, order, axis=2)
+
+        chain += 1
+
+    return scores, n_combo, n_eliminated
@@ -0,0 +1,166 @@
+"""
+Headless two player Puyo matches between AIs.
+
+Each player places pieces from the same sequence of pairs. Chains convert score
+into nuisance using the match's target points, nuisance first offsets any
+nuisance waiting to fall on the chaining player, and whatever is left is sent
+to the opponent. Nuisance waiting for a player falls after they place a pair
+that doesn't start a chain, at most `MAX_NUISANCE_DROP` at a time.
+
+Players take turns placing one pair each, instead of playing in real time. This
+keeps matches deterministic for a given seed and lets them run as fast as the
+engine allows.
+"""
+import multiprocessing
+import os
+import random
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from ptai.ai import AI
+from ptai.classpath import instantiate_class
+from ptai.gamestate import MoveResult
+from ptai.puyo.gamestate import PuyoGameState
+
+TARGET_POINTS = 70
+MAX_NUISANCE_DROP = 30
+QUEUE_LENGTH = 3
+MAX_TURNS = 500
+
+
+@dataclass
+class MatchResult:
+    seed: int
+
+    # Index of the winning player, or None if the match hit the turn limit.
+    winner: Optional[int]
+    n_turns: int
+    scores: List[int] = field(default_factory=lambda: [0, 0])
+    nuisance_sent: List[int] = field(default_factory=lambda: [0, 0])
+    max_combo: List[int] = field(default_factory=lambda: [0, 0])
+
+
+class VersusPlayer:
+
+    def __init__(self, ai:AI):
+        self.ai = ai
+        self.state = PuyoGameState()
+        self.n_pieces = 0
+        self.pending_nuisance = 0
+        self.leftover_score = 0
+
+
+class VersusMatch:
+    """A match between two AIs, played by calling `play()` or `step()`."""
+
+    def __init__(self, ai0:AI, ai1:AI, seed:int,
+                 target_points:int=TARGET_POINTS,
+                 max_turns:int=MAX_TURNS):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.target_points = target_points
+        self.max_turns = max_turns
+        self.players = [VersusPlayer(ai0), VersusPlayer(ai1)]
+        self.pieces: List[bytes] = []
+        self.result = MatchResult(seed, None, 0)
+        for player in self.players:
+            for _ in range(QUEUE_LENGTH):
+                player.state.queue.append(self._next_piece(player))
+
+    def _next_piece(self, player:VersusPlayer) -> bytes:
+        # Both players get the same sequence of pieces
+        while player.n_pieces >= len(self.pieces):
+            self.pieces.append(b''.join(self.rng.choices(
+                [b'r', b'g', b'b', b'y', b'p'],
+                k=2
+            )))
+        piece = self.pieces[player.n_pieces]
+        player.n_pieces += 1
+        return piece
+
+    def play(self) -> MatchResult:
+        while not self.step():
+            pass
+        return self.result
+
+    def step(self) -> bool:
+        """Each player makes one move. Returns True when the match is over."""
+        self.result.n_turns += 1
+        for i, player in enumerate(self.players):
+            opponent = self.players[1-i]
+            if not any(True for _ in player.state.get_moves()):
+                # Blocked in with nowhere to move
+                self.result.winner = 1-i
+                return True
+            self._move(i, player, opponent)
+            if player.state.board[2][11] != b'.':
+                self.result.winner = 1-i
+                return True
+        return self.result.n_turns >= self.max_turns
+
+    def _move(self, i:int, player:VersusPlayer, opponent:VersusPlayer) -> MoveResult:
+        state = player.state.copy()
+        state.new_turn = True
+        move = player.ai.get_move(state)
+        result = player.state.move(move)
+        player.state.queue.pop(0)
+        player.state.queue.append(self._next_piece(player))
+
+        if result.n_combo > 0:
+            points = result.score + player.leftover_score
+            result.nuisance_sent = points // self.target_points
+            player.leftover_score = points % self.target_points
+
+            offset = min(result.nuisance_sent, player.pending_nuisance)
+            player.pending_nuisance -= offset
+            opponent.pending_nuisance += result.nuisance_sent - offset
+        elif player.pending_nuisance:
+            n_drop = min(player.pending_nuisance, MAX_NUISANCE_DROP)
+            player.state.drop_nuisance(n_drop, self.rng)
+            player.pending_nuisance -= n_drop
+
+        self.result.scores[i] += result.score
+        self.result.nuisance_sent[i] += result.nuisance_sent
+        self.result.max_combo[i] = max(self.result.max_combo[i], result.n_combo)
+        return result
+
+
+# Set in each worker process by `_init_worker()`.
+_worker_ais: Tuple[AI, ...] = ()
+_worker_max_turns = MAX_TURNS
+
+def _init_worker(ai_classes:Tuple[str, str], ai_shortcuts:dict, max_turns:int):
+    global _worker_ais, _worker_max_turns  # pylint: disable=global-statement
+    _worker_ais = tuple(
+        instantiate_class(path, ai_shortcuts, AI)
+        for path in ai_classes
+    )
+    _worker_max_turns = max_turns
+
+def _play_seed(seed:int) -> MatchResult:
+    # AIs break ties with the global random module, so seed it too to make
+    # each match reproducible.
+    random.seed(seed)
+    return VersusMatch(_worker_ais[0], _worker_ais[1], seed,
+                       max_turns=_worker_max_turns).play()
+
+def play_matches(ai_paths:Tuple[str, str],
+                 seeds:Iterable[int],
+                 ai_shortcuts:Optional[dict]=None,
+                 processes:Optional[int]=None,
+                 max_turns:int=MAX_TURNS) -> Iterator[MatchResult]:
+    """Play a match for each seed, yielding results as they finish.
+
+    If `processes` is 1 matches are played in this process, otherwise they're
+    spread across a process pool and may finish out of order.
+    """
+    init_args = (tuple(ai_paths), ai_shortcuts or {}, max_turns)
+    if processes == 1:
+        _init_worker(*init_args)
+        for seed in seeds:
+            yield _play_seed(seed)
+        return
+
+    processes = processes or os.cpu_count() or 1
+    with multiprocessing.Pool(processes, _init_worker, init_args) as pool:
+        yield from pool.imap_unordered(_play_seed, seeds)
@@ -0,0 +1,128 @@
+"""
+Player ratings from game results.
+
+Games are given as `(player_a, player_b, score)` tuples, where score is 1 if
+player A won, 0 if player B won and 0.5 for a draw. Ratings are on the usual
+Elo scale, where a 400 point difference means the stronger player is expected
+to score 10 times as much as the weaker one.
+"""
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy
+
+Game = Tuple[str, str, float]
+
+ELO_SCALE = 400 / math.log(10)
+INITIAL_RATING = 1500.0
+Z_95 = 1.96
+
+
+@dataclass
+class Rating:
+    rating: float
+
+    # Half width of the 95% confidence interval
+    interval: float
+
+    def __str__(self):
+        return f"{self.rating:.0f} ± {self.interval:.0f}"
+
+
+def elo_ratings(players:Sequence[str], games:Iterable[Game],
+                prior_draws:float=1.0) -> Dict[str, Rating]:
+    """Maximum likelihood Elo ratings using the Bradley-Terry model.
+
+    Ratings are fit to all games at once, so the order games were played in
+    doesn't matter. Every pair of players is given `prior_draws` virtual
+    draws, which keeps ratings finite when a player wins or loses every game.
+    Ratings are centered on `INITIAL_RATING`, and confidence intervals come
+    from the curvature of the likelihood.
+    """
+    index = {player: i for i, player in enumerate(players)}
+    n = len(players)
+    wins = numpy.full((n, n), prior_draws / 2)
+    numpy.fill_diagonal(wins, 0)
+    for a, b, score in games:
+        wins[index[a], index[b]] += score
+        wins[index[b], index[a]] += 1 - score
+    n_games = wins + wins.T
+    total_wins = wins.sum(axis=1)
+
+    # Minorization-maximization updates (Hunter 2004)
+    strength = numpy.ones(n)
+    for _ in range(10000):
+        denominators = (n_games / (strength[:, None] + strength[None, :])).sum(axis=1)
+        new = total_wins / denominators
+        new /= numpy.exp(numpy.log(new).mean())
+        converged = numpy.allclose(new, strength, rtol=1e-10, atol=0)
+        strength = new
+        if converged:
+            break
+
+    log_strength = numpy.log(strength)
+    p = strength[:, None] / (strength[:, None] + strength[None, :])
+    information = -n_games * p * p.T
+    numpy.fill_diagonal(information, 0)
+    numpy.fill_diagonal(information, -information.sum(axis=1))
+    # The information matrix is singular since adding a constant to every
+    # rating doesn't change the likelihood. The pseudo-inverse gives the
+    # covariance with the mean rating held fixed.
+    covariance = numpy.linalg.pinv(information)
+    errors = numpy.sqrt(numpy.maximum(numpy.diag(covariance), 0))
+
+    return {
+        player: Rating(
+            INITIAL_RATING + ELO_SCALE * log_strength[i],
+            Z_95 * ELO_SCALE * errors[i],
+        )
+        for player, i in index.items()
+    }
+
+
+GLICKO_Q = math.log(10) / 400
+GLICKO_INITIAL_RD = 350.0
+GLICKO_MIN_RD = 30.0
+
+def _glicko_g(rd:float) -> float:
+    return 1 / math.sqrt(1 + 3 * GLICKO_Q**2 * rd**2 / math.pi**2)
+
+def glicko_ratings(players:Sequence[str],
+                   periods:Iterable[Iterable[Game]]) -> Dict[str, Rating]:
+    """Glicko ratings, updated once per rating period.
+
+    Each period is an iterable of games. Within a period every player is
+    updated using their opponents' ratings from the start of the period, as
+    described in Glickman's "The Glicko system". The confidence interval is
+    1.96 times the rating deviation.
+    """
+    ratings = {player: INITIAL_RATING for player in players}
+    rds = {player: GLICKO_INITIAL_RD for player in players}
+
+    for period in periods:
+        results: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+        for a, b, score in period:
+            results[a].append((b, score))
+            results[b].append((a, 1 - score))
+
+        new_ratings = dict(ratings)
+        new_rds = dict(rds)
+        for player, player_results in results.items():
+            d_inverse = 0.0
+            total = 0.0
+            for opponent, score in player_results:
+                g = _glicko_g(rds[opponent])
+                expected = 1 / (1 + 10 ** (-g * (ratings[player] - ratings[opponent]) / 400))
+                d_inverse += GLICKO_Q**2 * g**2 * expected * (1 - expected)
+                total += g * (score - expected)
+            denominator = 1 / rds[player]**2 + d_inverse
+            new_ratings[player] = ratings[player] + GLICKO_Q / denominator * total
+            new_rds[player] = max(math.sqrt(1 / denominator), GLICKO_MIN_RD)
+        ratings, rds = new_ratings, new_rds
+
+    return {
+        player: Rating(ratings[player], Z_95 * rds[player])
+        for player in players
+    }
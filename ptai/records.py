@@ -0,0 +1,93 @@
+"""
+Reading and writing recorded game positions.
+
+A recording is a text file with one JSON object per line. Each line is one
+position: the state of the game when a new turn started, plus the move that
+was played from that position. For example:
+
+    {"board": ["gr..........", ...], "queue": ["rg", "bb", "yp"],
+     "move": {"piece": "rg", "orientation": 0, "x": 2}}
+
+The board is stored as one string per column, starting at the bottom, to match
+the `board[x][y]` indexing of `GameState`. Since each line stands alone,
+recordings can be appended to and streamed without loading the whole file.
+"""
+import json
+from itertools import islice
+from typing import Iterator, List, Optional, TextIO
+
+import numpy
+
+from ptai.actions import MoveAction
+from ptai.games import get_state_cls
+from ptai.gamestate import GameState
+
+
+def state_to_record(state:GameState, move:Optional[MoveAction]=None) -> dict:
+    record = {
+        "board": [
+            b''.join(column).decode()
+            for column in state.board.tolist()
+        ],
+        "queue": [piece.decode() for piece in state.queue],
+    }
+    if move is not None:
+        record["move"] = {
+            "piece": move.piece.decode(),
+            "orientation": move.orientation,
+            "x": move.x,
+        }
+        if move.y is not None:
+            record["move"]["y"] = move.y
+    return record
+
+def record_to_state(game, record:dict) -> GameState:
+    board = numpy.array([
+        [cell.encode() for cell in column]
+        for column in record["board"]
+    ], dtype="|S1")
+    return get_state_cls(game)(
+        board,
+        [piece.encode() for piece in record["queue"]],
+        new_turn=True,
+    )
+
+def record_to_move(record:dict) -> Optional[MoveAction]:
+    move = record.get("move")
+    if move is None:
+        return None
+    return MoveAction(
+        move["piece"].encode(),
+        move["orientation"],
+        move["x"],
+        move.get("y"),
+    )
+
+def iter_records(f:TextIO) -> Iterator[dict]:
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def iter_record_chunks(f:TextIO, chunk_size:int) -> Iterator[List[dict]]:
+    """Yield lists of at most `chunk_size` records, reading lazily from `f`."""
+    records = iter_records(f)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class PositionRecorder:
+    """Appends positions and the moves made from them to a recording file."""
+
+    def __init__(self, path:str):
+        self.file = open(path, "a")
+
+    def record(self, state:GameState, move:MoveAction):
+        self.file.write(json.dumps(state_to_record(state, move)) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,118 @@
+"""
+Estimating how long the AI has to think, from the game's frame counter.
+
+The falling piece drops at a rate that speeds up over a match. `FrameBudget`
+watches the frame counter and the piece's height, from the state a turn
+starts with and from samples taken as the move's inputs start (see
+`observe_fall()`), to learn how many frames the piece takes to fall a row.
+From that, it estimates how many frames are left in a turn before the piece
+could land, and turns it into a deadline for the AI.
+
+States without a frame counter (`state.frame` is None) are ignored, and no
+deadline is given until the fall rate has been measured.
+"""
+import math
+import threading
+import time
+from typing import Optional
+
+from ptai.gameinterface import GameInterface
+from ptai.gamestate import GameState
+
+FRAME_RATE = 60
+# Weight of each new fall rate measurement in the running average
+SMOOTHING = 0.5
+
+
+class FrameBudget:
+    """Tracks frames per row fallen, to budget thinking time.
+
+    `reserve_frames` are kept back from every budget for sending the move's
+    inputs. States may be observed from a different thread than the one
+    asking for deadlines.
+    """
+
+    def __init__(self, reserve_frames:int=10, frame_rate:float=FRAME_RATE):
+        self.reserve_frames = reserve_frames
+        self.frame_rate = frame_rate
+        # Running average, None until measured
+        self.frames_per_row:Optional[float] = None
+        self._lock = threading.Lock()
+        # Frame counter and height of the piece at the last fall measurement
+        self._fall_start:Optional[tuple] = None
+        self._inputs_sent = False
+
+    @classmethod
+    def for_interface(cls, interface:GameInterface) -> "FrameBudget":
+        """A budget reserving the interface's input latency, if it knows it."""
+        latency = interface.input_latency()
+        if latency is None:
+            return cls()
+        return cls(reserve_frames=math.ceil(latency * FRAME_RATE))
+
+    def observe(self, state:GameState):
+        frame = getattr(state, "frame", None)
+        position = getattr(state, "current_position", None)
+        if frame is None or position is None:
+            return
+        y = position[1]
+        with self._lock:
+            if state.new_turn or self._fall_start is None or \
+                    frame < self._fall_start[0]:
+                self._fall_start = (frame, y)
+                self._inputs_sent = False
+                return
+            # Once inputs are sent the piece is moved and dropped by them, so
+            # it no longer shows the fall rate.
+            if not self._inputs_sent:
+                self._measure(frame, y)
+
+    def observe_fall(self, frame:int, y:int):
+        """Observe the piece's height read just before the inputs moved it.
+
+        Interfaces can take this sample along with the move, which costs
+        nothing extra, unlike reading a whole state while the AI thinks.
+        """
+        with self._lock:
+            if self._fall_start is not None and frame >= self._fall_start[0]:
+                self._measure(frame, y)
+
+    def inputs_sent(self):
+        """Note that the move for the current turn is being sent."""
+        with self._lock:
+            self._inputs_sent = True
+
+    def frames_left(self, state:GameState) -> Optional[float]:
+        """Frames the AI can use before the piece could land.
+
+        Assumes the piece lands on the tallest column, so the estimate is on
+        the safe side. None if the fall rate isn't known yet.
+        """
+        frame = getattr(state, "frame", None)
+        position = getattr(state, "current_position", None)
+        if self.frames_per_row is None or frame is None or position is None:
+            return None
+        top = int((state.board != b'.').sum(axis=1).max())
+        rows = max(0, position[1] - top)
+        return max(0.0, rows * self.frames_per_row - self.reserve_frames)
+
+    def deadline(self, state:GameState) -> Optional[float]:
+        """`time.monotonic()` time the AI should return by, or None."""
+        frames = self.frames_left(state)
+        if frames is None:
+            return None
+        return time.monotonic() + frames / self.frame_rate
+
+    def _measure(self, frame:int, y:int):
+        start_frame, start_y = self._fall_start
+        if y >= start_y:
+            return
+        rate = (frame - start_frame) / (start_y - y)
+        self.frames_per_row = self._average(self.frames_per_row, rate)
+        # Measure from here next time, so each row is only counted once
+        self._fall_start = (frame, y)
+
+    def _average(self, average:Optional[float], value:float) -> float:
+        if average is None:
+            return value
+        return average + SMOOTHING * (value - average)
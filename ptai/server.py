@@ -0,0 +1,312 @@
+"""
+A long running AI process, answering move requests over a Unix socket.
+
+Starting Python, importing numpy and building an AI takes far longer than
+choosing a move, so `ptai.py serve` does it once and then answers requests
+from any number of clients. Each AI is created the first time it's asked
+for and kept, along with whatever it caches between moves, and moves are
+cached by position so repeated questions are answered without thinking.
+Moves an AI settled for because of the budget (see `AI.cut_short`) aren't
+cached.
+`RemoteAI` is the client, usable anywhere an `AI` is.
+
+Messages are a 4 byte little endian length followed by the body. A request
+body is:
+
+    u8 name length, name     AI name or path, as given to `--ai`
+    f64 budget               Seconds the AI has, or a negative number for none
+    u8 width, u8 height      Board size
+    width*height bytes       Board cells, column by column from the bottom
+    u8 queue length
+    queue length * 2 bytes   Pieces in the queue, two cells each
+
+A response body is:
+
+    u8 status                0 for a move, 1 for no move, 2 for an error
+    i8 orientation, i8 x, i8 y (-1 for None), u8 fast_down
+    u8 cache hit             1 if the move came from the cache
+    f64 think time           Seconds the AI spent, 0 for a cache hit
+    f64 server time          Seconds from receiving the request to replying
+    rest of the body         Error message, for an error
+
+Connections stay open, so each move costs one round-trip.
+"""
+import errno
+import os
+import socket
+import socketserver
+import stat
+import struct
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy
+
+from ptai.actions import MoveAction
+from ptai.ai import AI
+from ptai.gamestate import GameState
+
+DEFAULT_SOCKET = os.environ.get("PTAI_SOCKET", "/tmp/ptai.sock")
+# AI that `RemoteAI` asks for, by name or path. Empty for the server's default.
+DEFAULT_REMOTE_AI = os.environ.get("PTAI_REMOTE_AI", "")
+
+LENGTH = struct.Struct("<I")
+REQUEST_HEADER = struct.Struct("<dBB")
+RESPONSE = struct.Struct("<BbbbBBdd")
+
+STATUS_MOVE = 0
+STATUS_NO_MOVE = 1
+STATUS_ERROR = 2
+
+
+class RemoteError(Exception):
+    pass
+
+
+@dataclass
+class Reply:
+    move: Optional[MoveAction]
+    cache_hit: bool = False
+    # Seconds the AI spent thinking
+    think_time: float = 0.0
+    # Seconds the server spent on the request, including thinking
+    server_time: float = 0.0
+    error: str = ""
+
+
+def encode_request(ai_name:str, state:GameState, budget:Optional[float]=None) -> bytes:
+    name = ai_name.encode()
+    width, height = state.board.shape
+    return b"".join([
+        bytes([len(name)]), name,
+        REQUEST_HEADER.pack(-1.0 if budget is None else budget, width, height),
+        state.board.tobytes(),
+        bytes([len(state.queue)]),
+        b"".join(state.queue),
+    ])
+
+def decode_request(data:bytes, state_cls) -> Tuple[str, GameState, Optional[float]]:
+    name_length = data[0]
+    name = data[1:1+name_length].decode()
+    offset = 1 + name_length
+    budget, width, height = REQUEST_HEADER.unpack_from(data, offset)
+    offset += REQUEST_HEADER.size
+    board = numpy.frombuffer(data, "|S1", width*height, offset).reshape(width, height)
+    offset += width * height
+    queue_length = data[offset]
+    offset += 1
+    queue = [data[offset+2*i : offset+2*i+2] for i in range(queue_length)]
+    state = state_cls(board.copy(), queue, True)
+    return name, state, None if budget < 0 else budget
+
+def encode_reply(reply:Reply) -> bytes:
+    move = reply.move
+    if reply.error:
+        status = STATUS_ERROR
+    elif move is None:
+        status = STATUS_NO_MOVE
+    else:
+        status = STATUS_MOVE
+    fields = (-1, -1, -1, 0) if move is None else (
+        move.orientation, move.x,
+        -1 if move.y is None else move.y,
+        int(move.fast_down),
+    )
+    return RESPONSE.pack(
+        status, *fields, int(reply.cache_hit), reply.think_time, reply.server_time,
+    ) + reply.error.encode()
+
+def decode_reply(data:bytes, piece:bytes) -> Reply:
+    status, orientation, x, y, fast_down, cache_hit, think_time, server_time = \
+        RESPONSE.unpack_from(data)
+    move = None
+    if status == STATUS_MOVE:
+        move = MoveAction(piece, orientation, x, None if y < 0 else y, bool(fast_down))
+    return Reply(move, bool(cache_hit), think_time, server_time,
+                 data[RESPONSE.size:].decode())
+
+def send_message(sock:socket.socket, body:bytes):
+    sock.sendall(LENGTH.pack(len(body)) + body)
+
+def recv_message(sock:socket.socket) -> Optional[bytes]:
+    """Read one message, or return None if the connection was closed."""
+    header = _recv_exact(sock, LENGTH.size)
+    if header is None:
+        return None
+    body = _recv_exact(sock, LENGTH.unpack(header)[0])
+    if body is None:
+        raise RemoteError("Connection closed mid-message")
+    return body
+
+def _recv_exact(sock:socket.socket, size:int) -> Optional[bytes]:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+class MoveCache:
+    """Least recently used cache of moves, keyed by AI and position."""
+
+    def __init__(self, max_size:int=100000):
+        self.max_size = max_size
+        self.n_hits = 0
+        self.n_misses = 0
+        self._moves:OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(ai_name:str, state:GameState) -> tuple:
+        return (ai_name, state.board.tobytes(), tuple(state.queue))
+
+    def get(self, key) -> Optional[MoveAction]:
+        with self._lock:
+            move = self._moves.get(key)
+            if move is None:
+                self.n_misses += 1
+                return None
+            self._moves.move_to_end(key)
+            self.n_hits += 1
+            return move
+
+    def put(self, key, move:MoveAction):
+        with self._lock:
+            self._moves[key] = move
+            self._moves.move_to_end(key)
+            while len(self._moves) > self.max_size:
+                self._moves.popitem(last=False)
+
+
+class AIServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves moves from warm AIs to clients on a Unix socket.
+
+    `make_ai` creates the AI for a name, and is called once per name. Each
+    client connection gets its own thread, and each AI is used by one thread
+    at a time.
+    """
+    daemon_threads = True
+
+    def __init__(self, path:str, state_cls, make_ai:Callable[[str], AI],
+                 cache:Optional[MoveCache]=None):
+        if os.path.exists(path):
+            _remove_stale_socket(path)
+        self.path = path
+        self.state_cls = state_cls
+        self.make_ai = make_ai
+        self.cache = cache if cache is not None else MoveCache()
+        self.n_requests = 0
+        self._n_requests_lock = threading.Lock()
+        self._ais:Dict[str, Tuple[AI, threading.Lock]] = {}
+        self._ais_lock = threading.Lock()
+        super().__init__(path, _Handler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def get_ai(self, name:str) -> Tuple[AI, threading.Lock]:
+        with self._ais_lock:
+            if name not in self._ais:
+                self._ais[name] = (self.make_ai(name), threading.Lock())
+            return self._ais[name]
+
+    def answer(self, data:bytes) -> Reply:
+        start = time.perf_counter()
+        with self._n_requests_lock:
+            self.n_requests += 1
+        name, state, budget = decode_request(data, self.state_cls)
+        key = self.cache.key(name, state)
+        move = self.cache.get(key)
+        if move is not None:
+            return Reply(move, True, 0.0, time.perf_counter() - start)
+
+        ai, lock = self.get_ai(name)
+        with lock:
+            think_start = time.perf_counter()
+            deadline = None if budget is None else time.monotonic() + budget
+            move = ai.get_move_before(state, deadline)
+            think_time = time.perf_counter() - think_start
+            cut_short = ai.cut_short
+        if move is not None and not cut_short:
+            self.cache.put(key, move)
+        return Reply(move, False, think_time, time.perf_counter() - start)
+
+
+def _remove_stale_socket(path:str):
+    """Remove a socket left behind by a server that didn't shut down cleanly.
+
+    Raises `OSError` if `path` isn't a socket, or a server is listening on it.
+    """
+    if not stat.S_ISSOCK(os.stat(path).st_mode):
+        raise FileExistsError(errno.EEXIST, "File exists and isn't a socket", path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    finally:
+        sock.close()
+    raise OSError(errno.EADDRINUSE, "Another server is listening", path)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            data = recv_message(self.request)
+            if data is None:
+                return
+            try:
+                reply = self.server.answer(data)
+            except Exception as e:  # pylint: disable=broad-except
+                # Like a bad AI name, which shouldn't take down the server
+                reply = Reply(None, error=f"{type(e).__name__}: {e}")
+            send_message(self.request, encode_reply(reply))
+
+
+class RemoteAI(AI):
+    """Asks an `AIServer` for moves.
+
+    The connection is opened on the first move and kept open. `last_reply`
+    holds the timing of the last move. When created by name, like with
+    `--ai remote`, the AI and socket are chosen by the `PTAI_REMOTE_AI` and
+    `PTAI_SOCKET` environment variables.
+    """
+
+    def __init__(self, ai_name:str=DEFAULT_REMOTE_AI, path:str=DEFAULT_SOCKET):
+        self.ai_name = ai_name
+        self.path = path
+        self.last_reply:Optional[Reply] = None
+        self._sock:Optional[socket.socket] = None
+
+    def get_move(self, state:GameState) -> MoveAction:
+        return self.get_move_before(state, None)
+
+    def get_move_before(self, state:GameState, deadline:Optional[float]) -> MoveAction:
+        budget = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(self.path)
+        send_message(self._sock, encode_request(self.ai_name, state, budget))
+        data = recv_message(self._sock)
+        if data is None:
+            self.close()
+            raise RemoteError("Server closed the connection")
+        reply = decode_reply(data, state.queue[0])
+        if reply.error:
+            raise RemoteError(reply.error)
+        self.last_reply = reply
+        return reply.move
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
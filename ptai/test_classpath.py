@@ -0,0 +1,13 @@
+import pytest
+
+from ptai.ai import AI
+from ptai.classpath import ClassPathError, instantiate_class
+from ptai.puyo.ai import SimpleGreedyAI
+
+
+def test_instantiate_class():
+    shortcuts = {"greedy": "ptai.puyo.ai.SimpleGreedyAI"}
+    assert isinstance(instantiate_class("greedy", shortcuts, AI), SimpleGreedyAI)
+    for path in ["greedy", "ptai.puyo.ai.Missing", "missing.AI", "ptai.actions.MoveAction"]:
+        with pytest.raises(ClassPathError):
+            instantiate_class(path, {}, AI)
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+
+from ptai.ai import AI
+from ptai.driver import PipelinedDriver
+from ptai.gameinterface import GameInterface
+from ptai.puyo.gamestate import PuyoGameState
+
+
+class TurnInterface(GameInterface):
+    """Simulated game that reports each turn as new only once."""
+
+    def __init__(self, fail_after=None):
+        self.state = PuyoGameState(queue=[b'rg', b'by', b'pp'])
+        self.moves = []
+        self.n_reads = 0
+        self.fail_after = fail_after
+        self._reported = False
+
+    def get_state(self):
+        self.n_reads += 1
+        state = self.state.copy()
+        state.new_turn = not self._reported
+        self._reported = True
+        return state
+
+    def perform_action(self, action):
+        if len(self.moves) == self.fail_after:
+            raise RuntimeError("Lost connection")
+        self.moves.append(action)
+        self.state.move(action)
+        self.state.queue = self.state.queue[1:] + self.state.queue[:1]
+        self._reported = False
+
+
+class FlatAI(AI):
+
+    def get_move(self, state):
+        heights = (state.board != b'.').sum(axis=1)
+        x = int(heights.argmin())
+        return next(m for m in state.get_moves() if m.x == x and m.orientation == 0)
+
+
+def test_pipelined_driver(capsys):
+    interface = TurnInterface()
+    n_threads = threading.active_count()
+    driver = PipelinedDriver(interface, FlatAI())
+    driver.play(max_turns=9)
+
+    assert len(interface.moves) == 10
+    # Every move landed where expected
+    assert "incorrectly" not in capsys.readouterr().out
+    assert threading.active_count() == n_threads
+
+class SlowAI(FlatAI):
+
+    def get_move(self, state):
+        time.sleep(0.02)
+        return super().get_move(state)
+
+
+def test_pipelined_driver_waits_for_action():
+    # The reader doesn't poll while the AI thinks, so it's never in the
+    # actuator's way.
+    interface = TurnInterface()
+    PipelinedDriver(interface, SlowAI()).play(max_turns=4)
+    assert len(interface.moves) == 5
+    assert interface.n_reads <= 6
+
+class SlowInputInterface(TurnInterface):
+    """Takes a while to send each move, like a real console."""
+
+    def perform_action(self, action):
+        time.sleep(0.05)
+        super().perform_action(action)
+
+
+class NuisanceInterface(SlowInputInterface):
+    """Drops a nuisance puyo after every move."""
+
+    def perform_action(self, action):
+        super().perform_action(action)
+        self.state.board[5][len(self.moves)] = b'k'
+
+
+class WatchingAI(FlatAI):
+    """Notes how many moves had been made each time it's asked for one."""
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.moves_made = []
+
+    def get_move(self, state):
+        self.moves_made.append(len(self.interface.moves))
+        return super().get_move(state)
+
+
+def test_pipelined_driver_plans_ahead(capsys):
+    interface = SlowInputInterface()
+    ai = WatchingAI(interface)
+    driver = PipelinedDriver(interface, ai)
+    driver.play(max_turns=4)
+    assert len(interface.moves) == 5
+    assert "incorrectly" not in capsys.readouterr().out
+    # Every turn after the first was planned while the last move was still
+    # being sent
+    assert driver.n_speculated == 4
+    assert ai.moves_made == [0, 0, 1, 2, 3]
+
+    # A board that differs from the expected one is planned again
+    interface = NuisanceInterface()
+    driver = PipelinedDriver(interface, FlatAI())
+    driver.play(max_turns=2)
+    assert len(interface.moves) == 3
+    assert driver.n_speculated == 0
+
+def test_pipelined_driver_error():
+    interface = TurnInterface(fail_after=3)
+    n_threads = threading.active_count()
+    with pytest.raises(RuntimeError):
+        PipelinedDriver(interface, FlatAI()).play()
+    assert len(interface.moves) == 3
+    assert threading.active_count() == n_threads
@@ -0,0 +1,55 @@
+import io
+import json
+
+from ptai.actions import MoveAction
+from ptai.games import GAMES
+from ptai.puyo.gamestate import PuyoGameState
+from ptai.records import state_to_record, record_to_state, record_to_move
+from ptai import evaluate
+
+
+def test_record_round_trip():
+    state = PuyoGameState(queue=[b'rg', b'bb', b'yp'])
+    state.move(MoveAction(b'rg', 1, 3))
+    move = MoveAction(b'rg', 0, 0)
+
+    record = json.loads(json.dumps(state_to_record(state, move)))
+    loaded = record_to_state(GAMES["puyo"], record)
+    assert (loaded.board == state.board).all()
+    assert loaded.queue == state.queue
+    assert loaded.new_turn
+    assert record_to_move(record) == move
+
+def test_evaluate():
+    # Two reds in column 0, and two more in the piece: a greedy AI should
+    # stack them to pop all four, matching the recorded move.
+    state = PuyoGameState(queue=[b'rr', b'gg', b'bb'])
+    state.move(MoveAction(b'rr', 0, 0))
+    good_move = MoveAction(b'rr', 0, 0)
+    bad_move = MoveAction(b'rr', 0, 5)
+    illegal_move = MoveAction(b'rr', 1, 5)
+
+    recording = io.StringIO("".join(
+        json.dumps(state_to_record(state, move)) + "\n"
+        for move in [good_move, bad_move, illegal_move]
+    ))
+    ai_paths = ["ptai.puyo.ai.SimpleGreedyAI"]
+    totals = evaluate.evaluate(GAMES["puyo"], ai_paths, recording,
+                               chunk_size=2, processes=1)
+
+    stats, = totals
+    assert stats.n_positions == 2
+    assert stats.n_agree == 1
+    assert stats.n_better == 1
+    assert stats.n_worse == 0
+    assert stats.score_delta > 0
+    assert stats.latency.count == 2
+
+def test_latency_histogram():
+    histogram = evaluate.LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.add(ms / 1000)
+    assert histogram.count == 100
+    assert abs(histogram.percentile(50) - 0.050) < 0.050 * 0.07
+    assert abs(histogram.percentile(95) - 0.095) < 0.095 * 0.07
+    assert histogram.percentile(100) == histogram.max == 0.1
@@ -0,0 +1,67 @@
+"""
+Import time of the command line, measured with `python -X importtime`.
+
+Run `python -X importtime ptai.py --help` to see the full breakdown.
+"""
+import os
+import subprocess
+import sys
+from typing import Dict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative milliseconds allowed for importing `ptai.cli`, if set. Wall
+# clock times depend on the machine and its load, so it's only checked when
+# asked for, like `PTAI_IMPORT_BUDGET_MS=100 pytest ptai/test_importtime.py`.
+CLI_BUDGET_MS = os.environ.get("PTAI_IMPORT_BUDGET_MS")
+
+# Exit status of `usage_error`, which exits with -1
+USAGE_ERROR = 255
+
+
+def import_times(*args:str, status:int=0) -> Dict[str, int]:
+    """Run ptai.py, returning the cumulative microseconds of each import.
+
+    Fails unless ptai.py exits with `status`, so a crash can't pass for a
+    fast start.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "ptai.py", *args],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    assert result.returncode == status, result.stderr[-2000:]
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+def top_level(times:Dict[str, int]) -> set:
+    return {name.split(".")[0] for name in times}
+
+
+def test_help():
+    times = import_times("--help")
+    assert "numpy" not in top_level(times)
+    assert "usb" not in top_level(times)
+    assert "ptai.cli" in times
+    if CLI_BUDGET_MS:
+        assert times["ptai.cli"] < float(CLI_BUDGET_MS) * 1000
+
+def test_ai_help():
+    for args in (["play", "--ai", "help"], ["getstate", "--interface", "help"]):
+        times = import_times(*args, status=USAGE_ERROR)
+        assert "ptai.cli" in times
+        modules = top_level(times)
+        assert "numpy" not in modules
+        assert "usb" not in modules
+
+def test_simulated():
+    times = import_times("play", "--interface", "simulated",
+                         "--ai", "ptai.test_driver.FlatAI", "--max-turns", "0")
+    assert "ptai.driver" in times
+    assert "usb" not in top_level(times)
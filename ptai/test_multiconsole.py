@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from ptai.multiconsole import AIPool, MultiConsole
+from ptai.test_driver import TurnInterface
+
+AI_PATH = "ptai.test_driver.FlatAI"
+
+
+def test_multiconsole(capsys):
+    interfaces = {"a": TurnInterface(), "b": TurnInterface()}
+    pool = AIPool(AI_PATH, processes=1)
+    n_threads = threading.active_count()
+    consoles = MultiConsole(interfaces, pool)
+    consoles.play(max_turns=4)
+
+    assert [len(i.moves) for i in interfaces.values()] == [5, 5]
+    assert "incorrectly" not in capsys.readouterr().out
+    assert threading.active_count() == n_threads
+
+    stats = [console.stats for console in consoles.consoles]
+    assert [s.n_moves for s in stats] == [5, 5]
+    assert sum(s.n_cache_hits for s in stats) == pool.cache.n_hits
+    assert pool.cache.n_hits + pool.cache.n_misses == 10
+    assert "a\n  Moves:" in consoles.format_report()
+
+def test_multiconsole_error():
+    interfaces = {"a": TurnInterface(), "b": TurnInterface(fail_after=2)}
+    consoles = MultiConsole(interfaces, AIPool(AI_PATH, processes=1))
+    # Console "a" is bounded so it can't fill its board before "b" fails
+    with pytest.raises(RuntimeError, match="Lost connection"):
+        consoles.play(max_turns=20)
+    assert len(interfaces["b"].moves) == 2
+
+def test_pool_processes():
+    pool = AIPool(AI_PATH, processes=2)
+    try:
+        state = TurnInterface().get_state()
+        move, cache_hit = pool.get_move_before(state, None)
+        assert move.x == 0 and not cache_hit
+        assert pool.get_move_before(state, None) == (move, True)
+    finally:
+        pool.close()
+
+def test_pool_cut_short():
+    pool = AIPool("ptai.test_server.HurriedAI", processes=1)
+    state = TurnInterface().get_state()
+    assert pool.get_move_before(state, 0.0)[1] is False
+    assert pool.get_move_before(state, 0.0)[1] is False
+    assert pool.get_move_before(state, None)[1] is False
+    assert pool.get_move_before(state, 0.0)[1] is True
@@ -0,0 +1,49 @@
+import marshal
+
+from ptai import profiling
+
+
+@profiling.tag("test")
+def outer(n):
+    def inner(i):
+        return sum(range(i))
+    return sum(inner(i) for i in range(n))
+
+
+def test_tag_labels():
+    key = profiling._code_key(outer.__code__)
+    assert profiling.label_for(key) == "test:outer"
+    inner_code = next(
+        const for const in outer.__code__.co_consts
+        if hasattr(const, "co_code") and const.co_name == "inner"
+    )
+    assert profiling.label_for(profiling._code_key(inner_code)) == "test:outer.inner"
+
+def test_deterministic_profile(tmp_path):
+    profiler = profiling.Profiler("deterministic")
+    for _ in range(3):
+        with profiler:
+            outer(200)
+
+    pstats_path, collapsed_path = profiler.write(str(tmp_path / "profile"))
+    with open(pstats_path, "rb") as f:
+        stats = marshal.load(f)
+    names = {name for filename, line, name in stats}
+    assert "test:outer" in names
+    assert "test:outer.inner" in names
+    outer_calls = [
+        value[1] for (filename, line, name), value in stats.items()
+        if name == "test:outer"
+    ]
+    assert outer_calls == [3]
+
+    with open(collapsed_path) as f:
+        lines = f.read().splitlines()
+    stacks = [line.rsplit(" ", 1)[0].split(";") for line in lines]
+    assert any(
+        stack[0] == "test:outer" and stack[-1] == "test:outer.inner"
+        for stack in stacks
+    )
+    for line in lines:
+        stack, microseconds = line.rsplit(" ", 1)
+        assert int(microseconds) > 0
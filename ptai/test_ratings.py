@@ -0,0 +1,28 @@
+from ptai.ratings import elo_ratings, glicko_ratings, INITIAL_RATING
+
+
+def test_elo_ratings():
+    # A beats B 3 times out of 4, B beats C 3 times out of 4
+    games = [("A", "B", 1.0)] * 30 + [("A", "B", 0.0)] * 10 + \
+            [("B", "C", 1.0)] * 30 + [("B", "C", 0.0)] * 10
+    ratings = elo_ratings(["A", "B", "C"], games, prior_draws=0)
+
+    # An expected score of 0.75 is a difference of about 191 points
+    assert abs((ratings["A"].rating - ratings["B"].rating) - 191) < 1
+    assert abs((ratings["B"].rating - ratings["C"].rating) - 191) < 1
+    assert abs(sum(r.rating for r in ratings.values()) / 3 - INITIAL_RATING) < 1e-6
+    # B played twice as many games, so is more certain
+    assert ratings["B"].interval < ratings["A"].interval
+
+def test_elo_ratings_undefeated():
+    ratings = elo_ratings(["A", "B"], [("A", "B", 1.0)] * 10)
+    assert ratings["A"].rating > ratings["B"].rating
+    assert ratings["A"].interval < float("inf")
+
+def test_glicko_ratings():
+    periods = [[("A", "B", 1.0), ("B", "A", 0.0)] for _ in range(5)] + \
+              [[("A", "B", 0.5)]]
+    ratings = glicko_ratings(["A", "B", "C"], periods)
+    assert ratings["A"].rating > INITIAL_RATING > ratings["B"].rating
+    assert ratings["A"].interval < ratings["C"].interval
+    assert ratings["C"].rating == INITIAL_RATING
@@ -0,0 +1,81 @@
+import time
+
+from ptai.ai import LookaheadAI
+from ptai.puyo.gamestate import PuyoGameState
+from ptai.schedule import FrameBudget
+from ptai.test_driver import TurnInterface
+
+
+def make_state(frame, y, new_turn=False):
+    return PuyoGameState(queue=[b'rg', b'by'], new_turn=new_turn,
+                         current_position=(2, y), frame=frame)
+
+def test_frame_budget():
+    budget = FrameBudget(reserve_frames=10)
+    budget.observe(make_state(100, 11, new_turn=True))
+    assert budget.deadline(make_state(100, 11)) is None
+
+    budget.observe(make_state(120, 11))
+    budget.observe(make_state(140, 10))
+    assert budget.frames_per_row == 40
+    budget.observe(make_state(160, 9))
+    assert budget.frames_per_row == 30
+
+    # Inputs move the piece faster than it falls
+    budget.inputs_sent()
+    budget.observe(make_state(161, 2))
+    assert budget.frames_per_row == 30
+
+    budget.observe(make_state(200, 11, new_turn=True))
+    state = make_state(200, 11)
+    state.board[0][0:3] = b'r'
+    assert budget.frames_left(state) == 8 * 30 - 10
+    assert 3.5 < budget.deadline(state) - time.monotonic() <= 230 / 60
+
+    # The height sampled as the inputs start still counts
+    budget.inputs_sent()
+    budget.observe_fall(250, 10)
+    assert budget.frames_per_row == 40
+
+    # States without a frame counter are ignored
+    budget.observe(PuyoGameState(new_turn=True))
+    assert budget.frames_per_row == 40
+
+
+class CountingAI(LookaheadAI):
+    """Prefers filling the left columns, counting evaluations."""
+
+    def __init__(self):
+        super().__init__()
+        self.n_scores = 0
+
+    def score_move(self, state, move):
+        self.n_scores += 1
+        state.move(move)
+        return -move.x
+
+def test_input_latency_reserve():
+    # Interfaces that don't know their latency keep the default reserve
+    assert FrameBudget.for_interface(TurnInterface()).reserve_frames == 10
+
+    class LaggyInterface(TurnInterface):
+        def input_latency(self):
+            return 0.201
+    assert FrameBudget.for_interface(LaggyInterface()).reserve_frames == 13
+
+def test_lookahead_deadline():
+    state = PuyoGameState(queue=[b'rg', b'by'])
+    ai = CountingAI()
+    move = ai.get_move(state)
+    assert move.x == 0
+    assert ai.n_scores == 22 + 22 * 22
+    assert ai.deep_seconds is not None
+    assert not ai.cut_short
+
+    # Not enough time for the deep search it measured
+    ai.n_scores = 0
+    ai.deep_seconds = 10.0
+    move = ai.get_move_before(state, time.monotonic() + 1)
+    assert move.x == 0
+    assert ai.n_scores == 22
+    assert ai.cut_short
@@ -0,0 +1,99 @@
+import socket
+import threading
+
+import pytest
+
+from ptai.ai import AI
+from ptai.puyo.gamestate import PuyoGameState
+from ptai.server import AIServer, RemoteAI, RemoteError
+
+
+class LeftAI(AI):
+
+    def __init__(self):
+        self.n_moves = 0
+
+    def get_move(self, state):
+        self.n_moves += 1
+        return min(state.get_moves(), key=lambda move: (move.x, move.orientation))
+
+
+class HurriedAI(LeftAI):
+    """Cuts every move with a deadline short."""
+
+    def get_move_before(self, state, deadline):
+        self.cut_short = deadline is not None
+        return self.get_move(state)
+
+
+def make_ai(name):
+    if name == "hurried":
+        return HurriedAI()
+    if name != "left":
+        raise ValueError(f"Unknown AI {name}")
+    return LeftAI()
+
+@pytest.fixture
+def server(tmp_path):
+    ai_server = AIServer(str(tmp_path / "ptai.sock"), PuyoGameState, make_ai)
+    thread = threading.Thread(target=ai_server.serve_forever)
+    thread.start()
+    yield ai_server
+    ai_server.shutdown()
+    ai_server.server_close()
+    thread.join()
+
+def test_remote_ai(server):
+    state = PuyoGameState(queue=[b'rg', b'by', b'pp'])
+    state.board[0][0] = b'k'
+    remote = RemoteAI("left", server.path)
+    move = remote.get_move(state)
+    assert move == LeftAI().get_move(state)
+    assert not remote.last_reply.cache_hit
+    assert remote.last_reply.server_time >= remote.last_reply.think_time
+
+    # The same position is answered from the cache, by any client
+    other = RemoteAI("left", server.path)
+    assert other.get_move_before(state.copy(), 0.0) == move
+    assert other.last_reply.cache_hit
+    ai, _ = server.get_ai("left")
+    assert ai.n_moves == 1
+
+    # The client gets the reason
+    with pytest.raises(RemoteError, match="Unknown AI missing"):
+        RemoteAI("missing", server.path).get_move(state)
+    # Errors don't close the server
+    state.queue = [b'yy']
+    assert remote.get_move(state).piece == b'yy'
+    remote.close()
+    other.close()
+
+def test_cut_short_not_cached(server):
+    state = PuyoGameState(queue=[b'rg', b'by', b'pp'])
+    remote = RemoteAI("hurried", server.path)
+    move = remote.get_move_before(state, 0.0)
+    assert remote.get_move_before(state, 0.0) == move
+    assert not remote.last_reply.cache_hit
+
+    # A move found without a deadline is cached for any request
+    assert remote.get_move(state) == move
+    assert remote.get_move_before(state, 0.0) == move
+    assert remote.last_reply.cache_hit
+    ai, _ = server.get_ai("hurried")
+    assert ai.n_moves == 3
+    remote.close()
+
+def test_socket_in_use(server, tmp_path):
+    # A live server's socket isn't taken over
+    with pytest.raises(OSError):
+        AIServer(server.path, PuyoGameState, make_ai)
+    assert RemoteAI("left", server.path).get_move(PuyoGameState(queue=[b'rg']))
+
+    # A socket nothing listens on is replaced, but other files aren't
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(tmp_path / "stale.sock"))
+    stale.close()
+    AIServer(str(tmp_path / "stale.sock"), PuyoGameState, make_ai).server_close()
+    (tmp_path / "file").write_text("")
+    with pytest.raises(FileExistsError):
+        AIServer(str(tmp_path / "file"), PuyoGameState, make_ai)
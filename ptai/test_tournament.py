@@ -0,0 +1,40 @@
+from ptai.ai import AI
+from ptai import tournament
+
+AI_PATHS = ["ptai.ai.RandomAI", "ptai.test_tournament.LeftAI"]
+
+
+class LeftAI(AI):
+    """Stacks pieces on the left, so matches end quickly."""
+
+    def get_move(self, state):
+        return min(state.get_moves(), key=lambda move: (move.x, move.orientation))
+
+
+def test_resume(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    seeds = range(2)
+    jobs = tournament.schedule(AI_PATHS, seeds)
+    assert len(jobs) == 4
+
+    first = list(tournament.run(AI_PATHS, seeds, path, processes=1))
+    assert len(first) == 4
+
+    # Keep two results, and half of the third, as if interrupted mid-write
+    with open(path) as f:
+        lines = f.readlines()
+    with open(path, "w") as f:
+        f.writelines(lines[:2])
+        f.write(lines[2][:10])
+    assert len(tournament.load_results(path)) == 2
+
+    replayed = list(tournament.run(AI_PATHS, seeds, path, processes=1))
+    assert [tournament.result_key(r) for r in replayed] == \
+        [tournament.result_key(r) for r in first[2:]]
+    # Matches are seeded, so replays give the same results
+    assert replayed == first[2:]
+
+    results = tournament.load_results(path)
+    assert sorted(map(tournament.result_key, results)) == \
+        sorted(job.key() for job in jobs)
+    assert list(tournament.run(AI_PATHS, seeds, path, processes=1)) == []
@@ -0,0 +1,183 @@
+"""
+Round-robin tournaments between AIs.
+
+Every pair of AIs plays one versus match per seed for each seating, so both
+AIs see exactly the same piece sequences from both sides of the board.
+Results are appended to a file as each match finishes. Running the same
+tournament again with the same results file skips matches that were already
+played, so an interrupted tournament can be resumed.
+"""
+import json
+import multiprocessing
+import os
+import random
+from dataclasses import dataclass
+from itertools import combinations
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from ptai.ai import AI
+from ptai.classpath import instantiate_class
+from ptai.puyo import versus
+from ptai.ratings import Game, Rating, elo_ratings, glicko_ratings
+
+
+@dataclass(frozen=True)
+class Job:
+    players: Tuple[str, str]
+    seed: int
+
+    def key(self):
+        return (self.players, self.seed)
+
+
+def schedule(ai_paths:Sequence[str], seeds:Iterable[int]) -> List[Job]:
+    """Return every match of a round-robin, ordered by seed."""
+    jobs = []
+    for seed in seeds:
+        for a, b in combinations(ai_paths, 2):
+            jobs.append(Job((a, b), seed))
+            jobs.append(Job((b, a), seed))
+    return jobs
+
+def load_results(path:str) -> List[dict]:
+    """Read results, skipping any line left half written by an interruption."""
+    if not os.path.exists(path):
+        return []
+    results = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+    return results
+
+def result_key(result:dict):
+    return (tuple(result["players"]), result["seed"])
+
+
+# Set in each worker process by `_init_worker()`.
+_worker_shortcuts: Dict[str, str] = {}
+_worker_ais: Dict[str, AI] = {}
+
+def _init_worker(ai_shortcuts:Dict[str, str]):
+    global _worker_shortcuts  # pylint: disable=global-statement
+    _worker_shortcuts = ai_shortcuts
+    _worker_ais.clear()
+
+def _get_worker_ai(path:str) -> AI:
+    if path not in _worker_ais:
+        _worker_ais[path] = instantiate_class(path, _worker_shortcuts, AI)
+    return _worker_ais[path]
+
+def _play_job(job:Job) -> dict:
+    random.seed(job.seed)
+    ai0, ai1 = (_get_worker_ai(path) for path in job.players)
+    # A separate AI instance is needed when an AI plays itself, in case it
+    # keeps state between moves.
+    if ai0 is ai1:
+        ai1 = instantiate_class(job.players[1], _worker_shortcuts, AI)
+    result = versus.VersusMatch(ai0, ai1, job.seed).play()
+    return {
+        "players": list(job.players),
+        "seed": job.seed,
+        "winner": result.winner,
+        "n_turns": result.n_turns,
+        "scores": result.scores,
+        "nuisance_sent": result.nuisance_sent,
+    }
+
+def run(ai_paths:Sequence[str],
+        seeds:Iterable[int],
+        results_path:str,
+        ai_shortcuts:Optional[Dict[str, str]]=None,
+        processes:Optional[int]=None) -> Iterator[dict]:
+    """Play all matches not already in `results_path`, yielding each result.
+
+    Each result is appended to `results_path` before it's yielded.
+    """
+    done = {result_key(result) for result in load_results(results_path)}
+    jobs = [job for job in schedule(ai_paths, seeds) if job.key() not in done]
+    ai_shortcuts = ai_shortcuts or {}
+
+    with open(results_path, "a+") as f:
+        # Start on a new line if the last result was cut off
+        if f.tell() > 0:
+            f.seek(f.tell() - 1)
+            if f.read(1) != "\n":
+                f.write("\n")
+
+        if processes == 1:
+            _init_worker(ai_shortcuts)
+            results: Iterable[dict] = map(_play_job, jobs)
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+                yield result
+            return
+
+        processes = processes or os.cpu_count() or 1
+        with multiprocessing.Pool(processes, _init_worker, (ai_shortcuts,)) as pool:
+            for result in pool.imap_unordered(_play_job, jobs):
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+                yield result
+
+def results_to_games(results:Iterable[dict]) -> Iterator[Game]:
+    for result in results:
+        a, b = result["players"]
+        if result["winner"] is None:
+            score = 0.5
+        else:
+            score = 1.0 if result["winner"] == 0 else 0.0
+        yield (a, b, score)
+
+def compute_ratings(ai_paths:Sequence[str], results:List[dict]
+                    ) -> Tuple[Dict[str, Rating], Dict[str, Rating]]:
+    """Return `(elo, glicko)` ratings for the given results.
+
+    Results for AIs not in `ai_paths` are ignored. Glicko rating periods are
+    one seed each, in seed order.
+    """
+    players = set(ai_paths)
+    results = [
+        result for result in results
+        if set(result["players"]) <= players
+    ]
+    elo = elo_ratings(ai_paths, results_to_games(results))
+
+    by_seed: Dict[int, List[dict]] = {}
+    for result in results:
+        by_seed.setdefault(result["seed"], []).append(result)
+    glicko = glicko_ratings(ai_paths, (
+        list(results_to_games(by_seed[seed]))
+        for seed in sorted(by_seed)
+    ))
+    return elo, glicko
+
+def format_standings(ai_paths:Sequence[str], results:List[dict]) -> str:
+    elo, glicko = compute_ratings(ai_paths, results)
+    records = {path: [0, 0, 0] for path in ai_paths}
+    for a, b, score in results_to_games(results):
+        if a not in records or b not in records:
+            continue
+        if score == 0.5:
+            records[a][2] += 1
+            records[b][2] += 1
+        else:
+            winner, loser = (a, b) if score == 1 else (b, a)
+            records[winner][0] += 1
+            records[loser][1] += 1
+
+    width = max(len(path) for path in ai_paths)
+    lines = [f"{'AI':<{width}}  {'W-L-D':>11}  {'Elo':>11}  {'Glicko':>11}"]
+    for path in sorted(ai_paths, key=lambda path: -elo[path].rating):
+        wins, losses, draws = records[path]
+        lines.append(
+            f"{path:<{width}}  {f'{wins}-{losses}-{draws}':>11}  "
+            f"{str(elo[path]):>11}  {str(glicko[path]):>11}"
+        )
+    return "\n".join(lines)